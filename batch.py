@@ -0,0 +1,177 @@
+import random
+
+import numpy as np
+
+from colony import Colony
+from models import Grid, ArrayPheromoneGrid
+from rng import AntStreams
+from rules import Rules
+from simulation import world_grid, create_ants
+from warmstart import warm_start
+
+# Config sections every environment of a batch must share
+SHARED_KEYS = ("grid_width", "grid_height", "map", "map_file", "pheromones")
+
+
+class BatchRunner:
+    """Runs N independent simulations of the same map in lockstep.
+
+    The environments are stacked along y in one tall grid: environment e
+    owns rows e*H to (e+1)*H - 1, with its own food sources, Q-values and
+    ants. Every cell keeps the valid-move mask of the single map, so no ant
+    ever crosses into a neighbouring environment. One Colony holds all the
+    ants and advances them with a single vectorized step. Each environment
+    draws from its own random streams (or Generator with engine.rng
+    "shared"), seeded with its config's `seed`.
+    Environments leave the active set, and their ants the colony, as soon
+    as they finish.
+
+    The configs may differ in seed, max_time, q_learning, nest and
+    food_quantities. With lazy dissipation each environment ends in the
+    same state as Simulation(config) with the "arrays" colony, stepped with
+    skip_idle_ticks.
+    """
+
+    def __init__(self, configs, skip_idle=True):
+        self.configs = list(configs)
+        first = self.configs[0]
+        engine = first.get("engine", {})
+        for config in self.configs[1:]:
+            for key in SHARED_KEYS:
+                if config.get(key) != first.get(key):
+                    raise ValueError(f"Batched configs must share {key!r}")
+            if config.get("engine", {}).get("lazy_dissipation", False) != engine.get("lazy_dissipation", False):
+                raise ValueError("Batched configs must share engine.lazy_dissipation")
+        if engine.get("clear_exhausted_food", False):
+            raise ValueError("clear_exhausted_food changes the map and cannot be batched")
+
+        count = len(self.configs)
+        single = world_grid(dict(first, food_quantities={}))
+        width, height = single.width, single.height
+        nest_x, nest_y = single.nest_position
+        self.height = height
+        self.skip_idle = skip_idle
+        self.time = 0
+        self.rules = Rules(first["pheromones"])
+
+        # The map repeated once per environment, each with its own food quantities
+        quantities = {}
+        for e, config in enumerate(self.configs):
+            for (x, y), quantity in config.get("food_quantities", {}).items():
+                quantities[(x, y + e * height)] = quantity
+        self.grid = Grid.from_cells(width, height * count, bytearray(single.cells) * count, quantities)
+        ants, env = [], []
+        for e, config in enumerate(self.configs):
+            env_ants = create_ants(config, (nest_x, nest_y + e * height))
+            ants += env_ants
+            env += [e] * len(env_ants)
+        # Moves across the border between two environments are not allowed
+        self.grid.valid_masks[:] = single.valid_masks * count
+
+        self.pheromone_grid = ArrayPheromoneGrid(
+            width, height * count, first["pheromones"]["dissipation_rate"],
+            lazy=engine.get("lazy_dissipation", False)
+        )
+        # Warm start each environment's rows on its own (q_learning may differ)
+        for e, config in enumerate(self.configs):
+            if not config.get("engine", {}).get("warm_start"):
+                continue
+            env_grid = ArrayPheromoneGrid(width, height)
+            warm_start(single, env_grid, config)
+            self.pheromone_grid.food_q_table[e * height:(e + 1) * height] = env_grid.food_q_table
+            self.pheromone_grid.nest_q_table[e * height:(e + 1) * height] = env_grid.nest_q_table
+        self.ants = Colony.from_ants(ants)
+        self.ants.env = np.array(env, dtype=np.int64)
+        self.rngs = []
+        for config in self.configs:
+            seed = config.get("seed")
+            if config.get("engine", {}).get("rng", "shared") == "streams":
+                self.rngs.append(AntStreams(random.getrandbits(64) if seed is None else seed))
+            else:
+                self.rngs.append(np.random.default_rng(seed))
+
+        self.max_time = [config["max_time"] for config in self.configs]
+        self.actions = np.zeros(count, dtype=np.int64)
+        self.total_food = self._food_per_env()
+        self.remaining_food = list(self.total_food)
+        self._remaining_total = self.grid.remaining_food
+
+        self.active = list(range(count))
+        self.results = [None] * count
+        self._retire_finished()
+
+    def _food_per_env(self):
+        """Returns the food left in each environment."""
+        remaining = [0] * len(self.configs)
+        for food_source in self.grid.food_sources:
+            remaining[food_source.y // self.height] += food_source.quantity
+        return remaining
+
+    def step(self):
+        """Advances every active environment by one tick."""
+        colony = self.ants
+        if len(colony):
+            self.actions += np.bincount(colony.env[colony.timer <= 1], minlength=len(self.configs))
+        for rng in self.rngs:
+            if isinstance(rng, AntStreams):
+                rng.tick = self.time
+        colony.step(self.grid, self.pheromone_grid, self.rules, self.rngs)
+        self.pheromone_grid.dissipate()
+        self.time += 1
+        self._retire_finished()
+
+    def skip_idle_ticks(self):
+        """Jumps over the upcoming ticks in which no ant of any environment acts."""
+        if not self.active:
+            return 0
+        max_time = min(self.max_time[e] for e in self.active)
+        target = max_time
+        if len(self.ants):
+            target = min(target, self.time + max(int(self.ants.timer.min()), 1) - 1)
+        skipped = target - self.time
+        if skipped <= 0:
+            return 0
+        self.ants.timer -= skipped
+        self.pheromone_grid.dissipate(skipped)
+        self.time = target
+        self._retire_finished()
+        return skipped
+
+    def _retire_finished(self):
+        """Records the result of the environments that just finished and drops their ants."""
+        if self.grid.remaining_food != self._remaining_total:
+            self.remaining_food = self._food_per_env()
+            self._remaining_total = self.grid.remaining_food
+
+        # An environment without ants cannot change any more: it runs to max_time
+        removed = self.ants.last_removed
+        if removed is None or len(removed):
+            self._alive = np.bincount(self.ants.env, minlength=len(self.configs))
+        alive = self._alive
+        finished = []
+        for e in self.active:
+            if self.time >= self.max_time[e] or self.remaining_food[e] <= 0:
+                finished.append((e, self.time))
+            elif alive[e] == 0:
+                finished.append((e, self.max_time[e]))
+        if not finished:
+            return
+
+        for e, end in finished:
+            self.active.remove(e)
+            self.results[e] = {
+                "time": end,
+                "remaining_food": self.remaining_food[e],
+                "total_food": self.total_food[e],
+                "actions": int(self.actions[e]),
+                "ants": int(alive[e]),
+            }
+        self.ants.drop(np.isin(self.ants.env, [e for e, _ in finished]))
+
+    def run(self):
+        """Runs every environment to the end and returns their results, in config order."""
+        while self.active:
+            self.step()
+            if self.skip_idle:
+                self.skip_idle_ticks()
+        return self.results
@@ -0,0 +1,335 @@
+"""Reproducible benchmark suite for the simulation engine.
+
+Runs the engine on generated maps (open field, maze, many food cells,
+deadly zones) across grid sizes and colony sizes, with a fixed seed, and
+reports ticks/sec, cost per ant action and peak memory. Each case runs in its
+own process so peak memory is measured in isolation. The "tiled-CxR"
+engines run the "streams" engine split into C x R worker processes
+(tiled.py); their "scaling" is their speed over the single process.
+
+    python3 benchmark.py --suite quick --output results.json
+    python3 benchmark.py --suite quick --save-baseline baseline.json
+    python3 benchmark.py --suite quick --baseline baseline.json --threshold 0.2
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from simulation import Simulation
+
+SEED = 1234
+
+BASE_CONFIG = {
+    "max_time": 10 ** 9,
+    "q_learning": {
+        "learning_rate": 0.1,
+        "discount_factor": 0.9,
+        "epsilon": 0.1,
+    },
+    "pheromones": {
+        "dissipation_rate": 0.01,
+        "food_reward": 1000,
+        "nest_reward": 1000,
+        "deadly_reward": -500,
+        "move_reward": -1,
+    },
+}
+
+# "baseline" is the default engine (eager decay, every ant visited each
+# tick, nested-list Q-tables): the speed-ups are measured against it
+ENGINES = {
+    "baseline": {},
+    "objects": {"lazy_dissipation": True, "scheduler": "event"},
+    "arrays": {"lazy_dissipation": True, "colony": "arrays"},
+    "numpy": {"pheromone_backend": "numpy"},
+    "sparse": {"pheromone_backend": "sparse"},
+    # The rules tiled runs follow, in one process
+    "streams": {"lazy_dissipation": True, "colony": "arrays", "rng": "streams"},
+}
+
+# Tiled runs of the "streams" engine: name -> (columns, rows) of tiles
+TILINGS = {f"tiled-{cols}x{rows}": (cols, rows) for cols, rows in ((1, 1), (2, 1), (2, 2), (4, 2), (4, 4))}
+
+
+# --- Map generators ---
+# Each returns the map as a list of rows of characters. The nest is a 2x2
+# block in the top left corner and food is placed far from it, so ants have
+# to travel.
+
+def _blank(width, height):
+    rows = [["."] * width for _ in range(height)]
+    for y in range(2):
+        for x in range(2):
+            rows[y][x] = "N"
+    return rows
+
+
+def _far_food(rows, width, height):
+    for y in range(max(2, height - 3), height):
+        for x in range(max(2, width - 3), width):
+            rows[y][x] = "F"
+
+
+def open_field(width, height, rng):
+    rows = _blank(width, height)
+    _far_food(rows, width, height)
+    return rows
+
+
+def maze(width, height, rng):
+    """Perfect maze carved by a randomized depth-first search on odd cells."""
+    rows = [["W"] * width for _ in range(height)]
+    stack = [(1, 1)]
+    rows[1][1] = "."
+    while stack:
+        x, y = stack[-1]
+        neighbours = [(x + dx, y + dy, dx, dy) for dx, dy in ((0, -2), (2, 0), (0, 2), (-2, 0))
+                      if 0 < x + dx < width - 1 and 0 < y + dy < height - 1 and rows[y + dy][x + dx] == "W"]
+        if not neighbours:
+            stack.pop()
+            continue
+        nx, ny, dx, dy = rng.choice(neighbours)
+        rows[y + dy // 2][x + dx // 2] = "."
+        rows[ny][nx] = "."
+        stack.append((nx, ny))
+    for y in range(2):
+        for x in range(2):
+            rows[y][x] = "N"
+    fy, fx = (height - 2) | 1, (width - 2) | 1
+    rows[min(fy, height - 2)][min(fx, width - 2)] = "F"
+    return rows
+
+
+def many_food(width, height, rng, density=0.05):
+    rows = _blank(width, height)
+    for y in range(height):
+        for x in range(width):
+            if rows[y][x] == "." and rng.random() < density:
+                rows[y][x] = "F"
+    return rows
+
+
+def deadly_zones(width, height, rng, zones=None):
+    rows = _blank(width, height)
+    for _ in range(zones or max(1, width * height // 400)):
+        zx, zy = rng.randrange(3, max(4, width - 3)), rng.randrange(3, max(4, height - 3))
+        for y in range(zy, min(height - 3, zy + 3)):
+            for x in range(zx, min(width - 3, zx + 3)):
+                rows[y][x] = "D"
+    _far_food(rows, width, height)
+    return rows
+
+
+MAPS = {"open": open_field, "maze": maze, "many_food": many_food, "deadly": deadly_zones}
+
+
+def make_config(map_kind, size, ants, engine, history=False):
+    """Builds the config of one benchmark case (same seed, same map every time)."""
+    rng = random.Random(SEED)
+    rows = MAPS[map_kind](size, size, rng)
+    config = dict(BASE_CONFIG)
+    config.update({
+        "grid_width": size,
+        "grid_height": size,
+        "map": ["".join(row) for row in rows],
+        # Plenty of food, so no case ends before its tick budget
+        "food_quantities": {(x, y): 10 ** 9 for y, row in enumerate(rows) for x, c in enumerate(row) if c == "F"},
+        "nest": {"ants": {"Explorer": ants // 2, "Fighter": ants // 4, "Collector": ants - ants // 2 - ants // 4}},
+        "seed": SEED,
+    })
+    engine_options = dict(ENGINES["streams" if engine in TILINGS else engine])
+    engine_options["history"] = {} if history else False
+    config["engine"] = engine_options
+    return config
+
+
+# --- Suites ---
+# (map, size, ants, engine, ticks, history)
+
+def _suite_quick():
+    return [
+        ("open", 20, 10, "baseline", 2000, False),
+        ("open", 20, 10, "objects", 2000, False),
+        *(("open", 100, 1000, engine, 200, False) for engine in ENGINES),
+        ("maze", 101, 1000, "objects", 200, False),
+        ("many_food", 100, 1000, "objects", 200, False),
+        ("deadly", 100, 1000, "objects", 200, False),
+        ("open", 100, 1000, "objects", 1000, True),
+        *(("open", 300, 10000, engine, 50, False) for engine in ("streams", "tiled-1x1", "tiled-2x1", "tiled-2x2")),
+    ]
+
+
+def _suite_full():
+    cases = []
+    # Grid area
+    for size in (20, 100, 500, 1000):
+        for engine in ENGINES:
+            cases.append(("open", size, 100, engine, 500, False))
+    # Ant count
+    for ants in (10, 100, 1000, 10000, 100000):
+        cases.append(("open", 200, ants, "arrays", 100, False))
+        if ants <= 10000:
+            cases.append(("open", 200, ants, "baseline", 100, False))
+            cases.append(("open", 200, ants, "objects", 100, False))
+    # Map kinds, including food-source count
+    for kind in ("maze", "many_food", "deadly"):
+        for size in (100, 500):
+            cases.append((kind, size + 1 if kind == "maze" else size, 1000, "objects", 100, False))
+    # History length
+    for ticks in (100, 1000, 10000):
+        cases.append(("open", 100, 1000, "objects", ticks, True))
+    # Tile count, on a world large enough to split
+    for engine in ("streams", *TILINGS):
+        cases.append(("open", 2000, 100000, engine, 50, False))
+    return cases
+
+
+SUITES = {"quick": _suite_quick, "full": _suite_full}
+
+
+def case_name(map_kind, size, ants, engine, ticks, history):
+    return f"{map_kind}-{size}x{size}-{ants}ants-{engine}-{ticks}ticks" + ("-history" if history else "")
+
+
+def run_case(case):
+    """Runs one case and returns its measurements (call in a fresh process)."""
+    map_kind, size, ants, engine, ticks, history = case
+    config = make_config(map_kind, size, ants, engine, history)
+
+    random.seed(SEED)
+    start = time.perf_counter()
+    if engine in TILINGS:
+        from tiled import TiledSimulation  # needs NumPy, like the "arrays" colony
+        simulation = TiledSimulation(config, TILINGS[engine])
+    else:
+        simulation = Simulation(config)
+    setup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        simulation.run_step()
+    elapsed = time.perf_counter() - start
+    if engine in TILINGS:
+        simulation.close()
+
+    return {
+        "name": case_name(*case),
+        "map": map_kind, "size": size, "ants": ants, "engine": engine, "ticks": ticks, "history": history,
+        "setup_seconds": setup,
+        "ticks_per_second": ticks / elapsed,
+        "actions": simulation.actions_taken,
+        "us_per_action": elapsed / max(1, simulation.actions_taken) * 1e6,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        # Largest tile worker (tiled engines only; the tables are shared memory)
+        "worker_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def run_suite(cases):
+    """Runs each case in a fresh process, one at a time, and prints its line."""
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_case, case).result()
+        print(f"{result['name']:<50} {result['ticks_per_second']:>10.1f} ticks/s "
+              f"{result['us_per_action']:>8.2f} us/action {result['peak_rss_mb']:>8.1f} MB", flush=True)
+        results.append(result)
+    add_speedups(results)
+    add_scaling(results)
+    return results
+
+
+def add_speedups(results):
+    """Sets "speedup", the ticks/sec of each result over that of the "baseline"
+    engine on the same case, when the suite ran it."""
+    def key(result):
+        return result["map"], result["size"], result["ants"], result["ticks"], result["history"]
+
+    baselines = {key(result): result for result in results if result["engine"] == "baseline"}
+    for result in results:
+        baseline = baselines.get(key(result))
+        if baseline is not None:
+            result["speedup"] = result["ticks_per_second"] / baseline["ticks_per_second"]
+
+
+def add_scaling(results):
+    """Sets "scaling", the ticks/sec of each tiled result over that of the
+    single-process "streams" engine on the same case, when the suite ran it."""
+    def key(result):
+        return result["map"], result["size"], result["ants"], result["ticks"], result["history"]
+
+    single = {key(result): result for result in results if result["engine"] == "streams"}
+    for result in results:
+        reference = single.get(key(result))
+        if result["engine"] in TILINGS and reference is not None:
+            result["scaling"] = result["ticks_per_second"] / reference["ticks_per_second"]
+
+
+def compare(results, baseline, threshold):
+    """Returns the regressions of `results` against a baseline report."""
+    reference = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = reference.get(result["name"])
+        if old is None:
+            continue
+        if result["ticks_per_second"] < old["ticks_per_second"] * (1 - threshold):
+            regressions.append(f"{result['name']}: {old['ticks_per_second']:.1f} -> {result['ticks_per_second']:.1f} ticks/s")
+        if result["peak_rss_mb"] > old["peak_rss_mb"] * (1 + threshold):
+            regressions.append(f"{result['name']}: {old['peak_rss_mb']:.1f} -> {result['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the simulation engine.")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against this JSON report")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown / memory growth (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    args = parser.parse_args(argv)
+
+    report = {
+        "suite": args.suite,
+        "seed": SEED,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": run_suite(SUITES[args.suite]()),
+    }
+    speedups = [result for result in report["results"] if result["engine"] != "baseline" and "speedup" in result]
+    if speedups:
+        print("\nAgainst the baseline engine:")
+        for result in speedups:
+            print(f"  {result['name']:<50} x{result['speedup']:.2f}")
+    scaling = [result for result in report["results"] if "scaling" in result]
+    if scaling:
+        print("\nTiled against one process:")
+        for result in scaling:
+            print(f"  {result['name']:<50} x{result['scaling']:.2f}")
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as out:
+                json.dump(report, out, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report["results"], json.load(f), args.threshold)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print("\nNo regression against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+"""Binary checkpoints of a running Simulation.
+
+Layout of a checkpoint file (little-endian):
+
+    header    magic b"AIFCKPT1", format version (u32), metadata offset (u64),
+              metadata length (u64)
+    buffers   raw arrays, each starting on a 64-byte boundary: cell codes,
+              food quantities, ant columns, both Q-tables as contiguous
+              float64 (H, W, 4) arrays and the lazy-decay stamps (the sparse
+              backend stores flat cell keys and values instead)
+    metadata  JSON: config, time, counters, RNG state and the offset, size
+              and type of every buffer
+
+The Q-tables of the NumPy backend are memory-mapped copy-on-write when
+loading, so restoring a large grid costs almost nothing until cells are
+touched, and the file itself is never modified.
+"""
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+from config import config_to_json, config_from_json
+from models import ANT_TYPES, ANT_MODES, CellType, SparsePheromoneGrid
+from scheduler import EventScheduler
+from simulation import Simulation
+
+try:
+    import numpy as np
+except ImportError:  # the "python" pheromone backend does not need it
+    np = None
+
+MAGIC = b"AIFCKPT1"
+VERSION = 1
+HEADER = struct.Struct("<8sIQQ")
+ALIGN = 64
+
+NUMPY_TYPES = {"B": "uint8", "b": "int8", "q": "int64", "d": "float64"}
+
+
+def _flat(table):
+    """Flattens a nested-list Q-table or stamp table into an array.array."""
+    if isinstance(table[0][0], list):
+        return array('d', [v for row in table for cell in row for v in cell])
+    return array('q', [v for row in table for v in row])
+
+
+def _sparse_buffers(pheromone_grid):
+    """Stored cells of a SparsePheromoneGrid as flat (keys, values) arrays, left unsynced."""
+    width = pheromone_grid.width
+    buffers = {}
+    for name, table in (("food", pheromone_grid.food_q_table), ("nest", pheromone_grid.nest_q_table)):
+        keys, values = array('q'), array('d')
+        for x, y, q_values in pheromone_grid.active_cells(table):
+            keys.append(y * width + x)
+            values.extend(q_values)
+        buffers[f"sparse_{name}_keys"], buffers[f"sparse_{name}_values"] = keys, values
+    if pheromone_grid.lazy:
+        keys, values = array('q'), array('q')
+        for y, stamps in enumerate(pheromone_grid.last_decayed):
+            for x, stamp in stamps.items():
+                keys.append(y * width + x)
+                values.append(stamp)
+        buffers["sparse_stamp_keys"], buffers["sparse_stamp_values"] = keys, values
+    return buffers
+
+
+def _buffers(simulation):
+    """Returns the {name: buffer} to write, as array.array or NumPy arrays."""
+    grid, pheromone_grid = simulation.grid, simulation.pheromone_grid
+    buffers = {
+        "cells": array('B', grid.cells),
+        "food": array('q', [fs.quantity for fs in grid.food_sources]),
+    }
+
+    if simulation.batched:
+        colony = simulation.ants
+        columns = {
+            "ids": colony.ids, "x": colony.x, "y": colony.y, "type": colony.type, "mode": colony.mode,
+            "load": colony.load, "timer": colony.timer, "learning_rate": colony.learning_rate,
+            "discount_factor": colony.discount_factor, "epsilon": colony.epsilon,
+        }
+    else:
+        ants = simulation.ants
+        if simulation.scheduler is not None:
+            simulation.scheduler.sync_timers(simulation.time)
+        columns = {
+            "ids": [a.id for a in ants], "x": [a.x for a in ants], "y": [a.y for a in ants],
+            "type": [ANT_TYPES.index(type(a)) for a in ants], "mode": [ANT_MODES.index(a.mode) for a in ants],
+            "load": [a.current_load for a in ants], "timer": [a.time_to_next_move for a in ants],
+            "learning_rate": [a.learning_rate for a in ants],
+            "discount_factor": [a.discount_factor for a in ants], "epsilon": [a.epsilon for a in ants],
+        }
+    for name, values in columns.items():
+        typecode = 'd' if name in ("learning_rate", "discount_factor", "epsilon") else \
+            'b' if name in ("type", "mode") else 'q'
+        if hasattr(values, "astype"):
+            buffers["ant_" + name] = values.astype(NUMPY_TYPES[typecode])
+        else:
+            buffers["ant_" + name] = array(typecode, values)
+
+    if isinstance(pheromone_grid, SparsePheromoneGrid):
+        buffers.update(_sparse_buffers(pheromone_grid))
+        return buffers
+    for name in ("food_q_table", "nest_q_table", "last_decayed"):
+        table = getattr(pheromone_grid, name)
+        if table is None:
+            continue
+        if hasattr(table, "astype"):
+            buffers[name] = table.astype("int64" if name == "last_decayed" else "float64")
+        else:
+            buffers[name] = _flat(table)
+    return buffers
+
+
+def save_checkpoint(simulation, path):
+    """Writes the full state of `simulation` to `path`.
+
+    The history and the profiler are not saved; a restored simulation
+    starts a new history at the checkpoint's tick.
+    """
+    if sys.byteorder != "little":
+        raise ValueError("checkpoints are written on little-endian machines only")
+
+    decay_steps, next_sweep = simulation.pheromone_grid.decay_state()
+    metadata = {
+        "config": config_to_json(simulation.config),
+        "time": simulation.time,
+        "actions_taken": simulation.actions_taken,
+        "food_delivered": simulation.food_delivered,
+        "exhausted_food": [simulation.grid.food_sources.index(fs) for fs in simulation.grid.exhausted_food],
+        "decay_steps": decay_steps,
+        "next_sweep": next_sweep,
+        "random_state": simulation.random.getstate(),
+        "stream_seed": simulation.streams.seed if simulation.streams is not None else None,
+        "numpy_rng_state": simulation.rng.bit_generator.state if hasattr(simulation.rng, "bit_generator") else None,
+        "buffers": {},
+    }
+
+    with open(path, "wb") as out:
+        out.write(b"\0" * HEADER.size)
+        for name, buffer in _buffers(simulation).items():
+            offset = -out.tell() % ALIGN
+            out.write(b"\0" * offset)
+            typecode = buffer.typecode if isinstance(buffer, array) else \
+                next(code for code, dtype in NUMPY_TYPES.items() if buffer.dtype == dtype)
+            data = memoryview(buffer).cast("B") if isinstance(buffer, array) else buffer.tobytes()
+            metadata["buffers"][name] = [out.tell(), len(data), typecode]
+            out.write(data)
+
+        blob = json.dumps(metadata).encode()
+        metadata_offset = out.tell()
+        out.write(blob)
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, VERSION, metadata_offset, len(blob)))
+
+
+def _read_metadata(mapped):
+    if len(mapped) < HEADER.size:
+        raise ValueError("not a simulation checkpoint")
+    magic, version, offset, length = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise ValueError("not a simulation checkpoint")
+    if version != VERSION:
+        raise ValueError(f"unsupported checkpoint version {version}")
+    return json.loads(mapped[offset:offset + length])
+
+
+def load_checkpoint(path, use_mmap=True, trajectory=False):
+    """Rebuilds the Simulation saved in `path`.
+
+    With `use_mmap` the NumPy Q-tables are copy-on-write memory maps of the
+    file instead of copies read in memory. The restored run writes no
+    trajectory log unless `trajectory` gives a new one (an engine.trajectory
+    option): the log of the saved run is left as it is.
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        metadata = _read_metadata(mapped)
+        # The Q-tables are read by _restore, straight into their final form
+        buffers = {}
+        for name, (offset, length, typecode) in metadata["buffers"].items():
+            if name not in ("food_q_table", "nest_q_table"):
+                buffers[name] = array(typecode)
+                buffers[name].frombytes(mapped[offset:offset + length])
+        config = config_from_json(metadata["config"])
+        config["engine"] = dict(config.get("engine", {}), trajectory=trajectory)
+        # The saved Q-tables replace any warm start, so skip computing it
+        engine = dict(config["engine"], warm_start=False, trajectory=False)
+        simulation = Simulation(dict(config, engine=engine))
+        simulation.config = config
+        _restore(simulation, metadata, buffers, path, use_mmap, mapped)
+    finally:
+        mapped.close()
+    return simulation
+
+
+def read_q_tables(path):
+    """Reads the Q-tables of a checkpoint without rebuilding its simulation.
+
+    Returns (config, food, nest) where food and nest are flat array('d') of
+    height * width * 4 values, decayed up to the checkpoint's tick (e.g. to
+    warm-start a new simulation from a trained run).
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        metadata = _read_metadata(mapped)
+        stored = metadata["buffers"]
+
+        def read(name):
+            offset, length, typecode = stored[name]
+            buffer = array(typecode)
+            buffer.frombytes(mapped[offset:offset + length])
+            return buffer
+
+        config = config_from_json(metadata["config"])
+        size = config["grid_width"] * config["grid_height"]
+        stamps = None
+        if "food_q_table" in stored:
+            tables = [read("food_q_table"), read("nest_q_table")]
+            if "last_decayed" in stored:
+                stamps = read("last_decayed")
+        else:
+            tables = []
+            for name in ("food", "nest"):
+                table = array('d', bytes(8 * 4 * size))
+                values = read(f"sparse_{name}_values")
+                for i, key in enumerate(read(f"sparse_{name}_keys")):
+                    table[key * 4:key * 4 + 4] = values[i * 4:i * 4 + 4]
+                tables.append(table)
+            if "sparse_stamp_keys" in stored:
+                stamps = array('q', bytes(8 * size))
+                for key, stamp in zip(read("sparse_stamp_keys"), read("sparse_stamp_values")):
+                    stamps[key] = stamp
+    finally:
+        mapped.close()
+
+    if stamps is not None:
+        decay_factor = 1 - config["pheromones"]["dissipation_rate"]
+        decay_steps = metadata["decay_steps"]
+        for cell, stamp in enumerate(stamps):
+            if stamp != decay_steps:
+                factor = decay_factor ** (decay_steps - stamp)
+                for table in tables:
+                    for i in range(cell * 4, cell * 4 + 4):
+                        table[i] *= factor
+    return config, tables[0], tables[1]
+
+
+def _restore(simulation, metadata, buffers, path, use_mmap, mapped):
+    grid, pheromone_grid = simulation.grid, simulation.pheromone_grid
+    width = grid.width
+    simulation.time = metadata["time"]
+    simulation.actions_taken = metadata["actions_taken"]
+    simulation.food_delivered = metadata.get("food_delivered", 0)
+
+    # Terrain only changes when exhausted food is cleared, but restore any change
+    for i, code in enumerate(buffers["cells"]):
+        if grid.cells[i] != code:
+            grid.set_cell(i % width, i // width, CellType(code))
+    grid.remaining_food = 0
+    for food_source, quantity in zip(grid.food_sources, buffers["food"]):
+        food_source.quantity = quantity
+        grid.remaining_food += quantity
+    grid.exhausted_food = [grid.food_sources[i] for i in metadata["exhausted_food"]]
+
+    # Q-tables and lazy-decay stamps
+    pheromone_grid.restore_decay_state(metadata["decay_steps"], metadata.get("next_sweep"))
+    if isinstance(pheromone_grid, SparsePheromoneGrid):
+        _restore_sparse(pheromone_grid, metadata, buffers)
+    else:
+        _restore_dense(pheromone_grid, metadata, buffers, path, use_mmap, mapped)
+
+    _restore_ants(simulation, metadata, buffers)
+    simulation._reset_history()
+
+
+def _restore_dense(pheromone_grid, metadata, buffers, path, use_mmap, mapped):
+    width, height = pheromone_grid.width, pheromone_grid.height
+    for name in ("food_q_table", "nest_q_table"):
+        offset, length, _ = metadata["buffers"][name]
+        if hasattr(getattr(pheromone_grid, name), "shape"):
+            if use_mmap:
+                table = np.memmap(path, dtype="float64", mode="c", offset=offset, shape=(height, width, 4))
+            else:
+                table = np.frombuffer(mapped[offset:offset + length], dtype="float64").reshape(height, width, 4).copy()
+        else:
+            flat = memoryview(mapped[offset:offset + length]).cast("d")
+            table = [[list(flat[i:i + 4]) for i in range(y * width * 4, (y + 1) * width * 4, 4)] for y in range(height)]
+        setattr(pheromone_grid, name, table)
+    if "last_decayed" in buffers and pheromone_grid.lazy:
+        stamps = buffers["last_decayed"]
+        if hasattr(pheromone_grid.last_decayed, "shape"):
+            pheromone_grid.last_decayed = np.array(stamps, dtype="int64").reshape(height, width)
+        else:
+            pheromone_grid.last_decayed = [list(stamps[y * width:(y + 1) * width]) for y in range(height)]
+
+
+def _restore_sparse(pheromone_grid, metadata, buffers):
+    width = pheromone_grid.width
+    for name, table in (("food", pheromone_grid.food_q_table), ("nest", pheromone_grid.nest_q_table)):
+        values = buffers[f"sparse_{name}_values"]
+        for i, key in enumerate(buffers[f"sparse_{name}_keys"]):
+            table[key // width][key % width] = list(values[i * 4:i * 4 + 4])
+    if pheromone_grid.lazy:
+        for key, stamp in zip(buffers["sparse_stamp_keys"], buffers["sparse_stamp_values"]):
+            pheromone_grid.last_decayed[key // width][key % width] = stamp
+
+
+def _restore_ants(simulation, metadata, buffers):
+    """Ants, scheduler and random state."""
+    columns = {name[4:]: buffer for name, buffer in buffers.items() if name.startswith("ant_")}
+    if simulation.batched:
+        colony = type(simulation.ants)(columns["x"], columns["y"], columns["type"], columns["learning_rate"],
+                                       columns["discount_factor"], columns["epsilon"])
+        for name in ("ids", "mode", "load", "timer"):
+            getattr(colony, name)[:] = columns[name]
+        simulation.ants = colony
+        if metadata["numpy_rng_state"] is not None:
+            simulation.rng.bit_generator.state = metadata["numpy_rng_state"]
+    else:
+        ants = []
+        for i in range(len(columns["ids"])):
+            ant = ANT_TYPES[columns["type"][i]](
+                columns["x"][i], columns["y"][i],
+                columns["learning_rate"][i], columns["discount_factor"][i], columns["epsilon"][i]
+            )
+            ant.id = columns["ids"][i]
+            ant.mode = ANT_MODES[columns["mode"][i]]
+            ant.current_load = columns["load"][i]
+            ant.time_to_next_move = columns["timer"][i]
+            ants.append(ant)
+        simulation.ants = ants
+        if simulation.scheduler is not None:
+            simulation.scheduler = EventScheduler(ants, simulation.time)
+    if metadata.get("stream_seed") is not None:
+        simulation.streams.seed = metadata["stream_seed"]
+    version, state, gauss = metadata["random_state"]
+    simulation.random.setstate((version, tuple(state), gauss))
@@ -0,0 +1,306 @@
+import numpy as np
+from models import ANT_TYPES as TYPE_CLASSES, ANT_MODES as MODES
+from rules import PICKUP, DROP, DEATH
+
+# Type codes index TYPE_CLASSES, mode codes index MODES.
+SEARCHING, RETURNING = 0, 1
+
+# Per-ant arrays of a colony
+COLUMNS = ("ids", "x", "y", "type", "mode", "load", "speed", "max_load", "timer",
+           "learning_rate", "discount_factor", "epsilon")
+
+# N, E, S, W (same order as QLearning.actions)
+ACTION_DX = np.array([0, 1, 0, -1])
+ACTION_DY = np.array([-1, 0, 1, 0])
+ACTION_BITS = np.arange(4, dtype=np.uint8)
+
+
+class Colony:
+    """Struct-of-arrays ant population advanced by a batched step.
+
+    Every ant is a slot in parallel arrays (position, mode, load, timer, speed,
+    type...). ``step`` processes all the ants due to move in one vectorized
+    pass, which differs from the object engine in one respect: all the ants
+    acting in the same tick read the Q-tables as they were at the start of
+    the tick. When several of them update the same (table, cell, action)
+    entry, the update of the last ant in colony order wins. Food pickups are
+    still granted in colony order, as the object engine does.
+    """
+
+    def __init__(self, x, y, types, learning_rate, discount_factor, epsilon):
+        n = len(x)
+        self.ids = np.arange(n)
+        self.x = np.asarray(x, dtype=np.int64)
+        self.y = np.asarray(y, dtype=np.int64)
+        self.type = np.asarray(types, dtype=np.int8)
+        self.mode = np.full(n, SEARCHING, dtype=np.int8)
+        self.load = np.zeros(n, dtype=np.int64)
+
+        probes = [cls(0, 0, 0, 0, 0) for cls in TYPE_CLASSES]
+        self.speed = np.array([p.speed for p in probes], dtype=np.int64)[self.type]
+        self.max_load = np.array([p.max_load for p in probes], dtype=np.int64)[self.type]
+        self.timer = self.speed.copy()
+
+        self.learning_rate = np.broadcast_to(np.asarray(learning_rate, dtype=float), (n,)).copy()
+        self.discount_factor = np.broadcast_to(np.asarray(discount_factor, dtype=float), (n,)).copy()
+        self.epsilon = np.broadcast_to(np.asarray(epsilon, dtype=float), (n,)).copy()
+
+        # What the last step changed, for the history: (ids, x, y, load, mode)
+        # of the ants that acted and survived, and the ids of the dead ones.
+        self.last_changes = None
+        self.last_removed = None
+        # Food units dropped off at the nest by the last step
+        self.last_delivered = 0
+
+        # Environment of each ant when several simulations share the colony
+        # (see batch.py); the ants of one environment are contiguous.
+        self.env = None
+
+        self._static = None
+
+    @classmethod
+    def from_ants(cls, ants):
+        """Builds a colony holding the same ants as a list of Ant objects."""
+        colony = cls(
+            [a.x for a in ants], [a.y for a in ants],
+            [TYPE_CLASSES.index(type(a)) for a in ants],
+            [a.learning_rate for a in ants],
+            [a.discount_factor for a in ants],
+            [a.epsilon for a in ants],
+        )
+        colony.mode[:] = [MODES.index(a.mode) for a in ants]
+        colony.load[:] = [a.current_load for a in ants]
+        colony.timer[:] = [a.time_to_next_move for a in ants]
+        if ants and ants[0].id is not None:
+            colony.ids[:] = [a.id for a in ants]
+        return colony
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Builds a colony from per-ant arrays given as {column: array} (see take)."""
+        colony = cls.__new__(cls)
+        for name in COLUMNS:
+            setattr(colony, name, np.asarray(columns[name]))
+        colony.last_changes = colony.last_removed = None
+        colony.last_delivered = 0
+        colony.env = None
+        colony._static = None
+        return colony
+
+    def __len__(self):
+        return len(self.x)
+
+    def copy(self):
+        """Returns an independent copy of the colony (the grid cache is rebuilt on the next step)."""
+        clone = Colony.__new__(Colony)
+        for name, value in self.__dict__.items():
+            setattr(clone, name, value.copy() if isinstance(value, np.ndarray) else value)
+        clone.last_changes = clone.last_removed = None
+        clone._static = None
+        return clone
+
+    def to_ants(self):
+        """Materializes the colony as a list of Ant objects."""
+        ants = []
+        for i in range(len(self)):
+            ant = TYPE_CLASSES[self.type[i]](
+                int(self.x[i]), int(self.y[i]),
+                float(self.learning_rate[i]), float(self.discount_factor[i]), float(self.epsilon[i])
+            )
+            ant.mode = MODES[self.mode[i]]
+            ant.current_load = int(self.load[i])
+            ant.time_to_next_move = int(self.timer[i])
+            ant.id = int(self.ids[i])
+            ants.append(ant)
+        return ants
+
+    def ant_states(self):
+        """Returns the ants in the history format (list of dicts)."""
+        names = [cls.__name__ for cls in TYPE_CLASSES]
+        return [
+            {"x": x, "y": y, "type": names[t], "load": load, "mode": MODES[mode]}
+            for x, y, t, load, mode in zip(
+                self.x.tolist(), self.y.tolist(), self.type.tolist(), self.load.tolist(), self.mode.tolist()
+            )
+        ]
+
+    def columns(self):
+        """Returns (ids, xs, ys, types, loads, modes) arrays for every ant."""
+        return self.ids, self.x, self.y, self.type, self.load, self.mode
+
+    def _build_static(self, grid):
+        """Caches the grid data the kernel needs (cell codes, valid moves, food index)."""
+        height, width = grid.height, grid.width
+        # Views on the Grid's flat arrays, so they stay in sync with set_cell
+        cells = np.frombuffer(grid.cells, dtype=np.uint8).reshape(height, width)
+        masks = np.frombuffer(grid.valid_masks, dtype=np.uint8).reshape(height, width)
+
+        # Position of each cell's FoodSource in `sources`, -1 elsewhere
+        sources = list(grid.food_at.values())
+        food_index = np.full((height, width), -1, dtype=np.int64)
+        for i, fs in enumerate(sources):
+            food_index[fs.y, fs.x] = i
+
+        self._static = (cells, masks, food_index, sources)
+
+    def step(self, grid, pheromone_grid, rules, rng, stats=None):
+        """Advances every ant by one tick, removes the ants that died and returns how many acted.
+
+        `rules` are the compiled rewards and effects of a move (rules.Rules).
+        `stats` is an optional Profiler.counts dict updated with this tick's events.
+        """
+        if self._static is None:
+            self._build_static(grid)
+        cells, masks, food_index, sources = self._static
+
+        self.timer -= 1
+        due = np.flatnonzero(self.timer <= 0)
+        if len(due) == 0:
+            self.last_changes, self.last_removed = (due,) * 5, due
+            self.last_delivered = 0
+            return 0
+        x, y, mode = self.x[due], self.y[due], self.mode[due]
+        n = len(due)
+
+        # Epsilon-greedy choice against the Q-tables as of the start of the tick.
+        # Cells are only synced when written, so reading a cell never changes
+        # its rounding (tiled.py relies on this to match a single colony).
+        searching = mode == SEARCHING
+        q_old = np.where(searching[:, None], pheromone_grid.peek_cells(pheromone_grid.food_q_table, x, y),
+                         pheromone_grid.peek_cells(pheromone_grid.nest_q_table, x, y))
+        valid = (masks[y, x, None] >> ACTION_BITS) & 1 == 1
+        n_valid = valid.sum(axis=1)
+
+        best = np.where(valid, q_old, -np.inf).argmax(axis=1)
+        explore = self._random(rng, due, 0) < self.epsilon[due]
+        pick = (self._random(rng, due, 1) * n_valid).astype(np.int64)
+        random_action = (valid.cumsum(axis=1) > pick[:, None]).argmax(axis=1)
+        action = np.where(explore, random_action, best)
+
+        # Boxed-in ants stay where they are this tick
+        moving = n_valid > 0
+        nx = x + np.where(moving, ACTION_DX[action], 0)
+        ny = y + np.where(moving, ACTION_DY[action], 0)
+
+        # Reward, effect and Q update: one gather by (mode, cell code)
+        new_cell = cells[ny, nx]
+        reward = rules.reward_table[mode, new_cell]
+        effect = rules.effect_table[mode, new_cell]
+
+        q_future = np.where(searching[:, None], pheromone_grid.peek_cells(pheromone_grid.food_q_table, nx, ny),
+                            pheromone_grid.peek_cells(pheromone_grid.nest_q_table, nx, ny))
+        old_value = q_old[np.arange(n), action]
+        new_value = old_value + self.learning_rate[due] * \
+            (reward + self.discount_factor[due] * q_future.max(axis=1) - old_value)
+
+        # Same (table, cell, action) updated twice: the last ant in order wins
+        key = ((mode.astype(np.int64) * grid.height + y) * grid.width + x) * 4 + action
+        _, last_rev = np.unique(key[::-1], return_index=True)
+        keep = np.zeros(n, dtype=bool)
+        keep[n - 1 - last_rev] = True
+        keep &= moving
+        pheromone_grid.sync_cells(x[keep], y[keep])
+        for table, in_table in ((pheromone_grid.food_q_table, searching), (pheromone_grid.nest_q_table, ~searching)):
+            sel = keep & in_table
+            table[y[sel], x[sel], action[sel]] = new_value[sel]
+        if pheromone_grid.changed_cells is not None:
+            pheromone_grid.changed_cells.update((y[keep] * grid.width + x[keep]).tolist())
+
+        # Move
+        self.x[due] = nx
+        self.y[due] = ny
+
+        # Pick up food, granted in colony order within each source
+        load = self.load[due]
+        source = food_index[ny, nx]
+        pickers = np.flatnonzero((effect == PICKUP) & (source >= 0))
+        picked = 0
+        if len(pickers):
+            order = pickers[np.argsort(source[pickers], kind="stable")]
+            src = source[order]
+            demand = self.max_load[due][order] - load[order]
+            uniq, start = np.unique(src, return_index=True)
+            available = np.array([sources[i].quantity for i in uniq.tolist()])
+            group = np.searchsorted(uniq, src)
+            taken_before = np.cumsum(demand) - demand
+            taken_before -= taken_before[start][group]
+            granted = np.clip(available[group] - taken_before, 0, demand)
+            for i, amount in zip(uniq.tolist(), np.add.reduceat(granted, start).tolist()):
+                grid.take_food(sources[i], amount)
+            load[order] += granted
+            mode[order[granted > 0]] = RETURNING
+            picked = int(np.count_nonzero(granted))
+
+        # Drop off food at the nest
+        dropping = effect == DROP
+        self.last_delivered = int(load[dropping].sum())
+        load[dropping] = 0
+        mode[dropping] = SEARCHING
+
+        self.load[due] = load
+        self.mode[due] = mode
+        self.timer[due] = self.speed[due]
+
+        # Compact the arrays to drop the ants that stepped on a deadly cell
+        died = effect == DEATH
+        dead = due[died]
+        survivors = due[~died]
+        self.last_changes = (self.ids[survivors], nx[~died], ny[~died], load[~died], mode[~died])
+        self.last_removed = self.ids[dead]
+        if len(dead):
+            alive = np.ones(len(self), dtype=bool)
+            alive[dead] = False
+            self._compact(alive)
+
+        if stats is not None:
+            explored = int(np.count_nonzero(explore))
+            stats["explorations"] += explored
+            stats["exploitations"] += n - explored
+            stats["pickups"] += picked
+            stats["drops"] += int(np.count_nonzero(dropping))
+            stats["deaths"] += len(dead)
+            # One cell read to exploit, the old and new cells for the update
+            stats["q_cells"] += n - explored + 2 * n
+        return n
+
+    def drop(self, dead):
+        """Removes the ants flagged in the boolean array `dead`."""
+        if dead.any():
+            self._compact(~dead)
+
+    def _random(self, rng, due, slot):
+        """Uniform draws for the due ants.
+
+        `rng` is an AntStreams (draw `slot` of each ant's own stream) or a
+        Generator, or one of those per environment when `env` is set; each
+        environment then draws exactly as it would alone.
+        """
+        if self.env is None:
+            return rng.uniforms(self.ids[due], slot) if hasattr(rng, "uniforms") else rng.random(len(due))
+        counts = np.bincount(self.env[due], minlength=len(rng)).tolist()
+        ids = np.split(self.ids[due], np.cumsum(counts)[:-1])
+        return np.concatenate([
+            rng[e].uniforms(ids[e], slot) if hasattr(rng[e], "uniforms") else rng[e].random(count)
+            for e, count in enumerate(counts) if count
+        ])
+
+    def take(self, selected):
+        """Removes the ants flagged in the boolean array `selected` and returns them as {column: array}."""
+        taken = {name: getattr(self, name)[selected] for name in COLUMNS}
+        self._compact(~selected)
+        return taken
+
+    def add(self, columns):
+        """Adds ants given as {column: array} (see take), keeping the colony sorted by id."""
+        if not len(columns["ids"]):
+            return
+        for name in COLUMNS:
+            setattr(self, name, np.concatenate([getattr(self, name), columns[name]]))
+        self._compact(np.argsort(self.ids, kind="stable"))
+
+    def _compact(self, alive):
+        """Keeps only the ants selected by ``alive`` (a boolean mask or an index array)."""
+        for name in COLUMNS:
+            setattr(self, name, getattr(self, name)[alive])
+        if self.env is not None:
+            self.env = self.env[alive]
@@ -0,0 +1,163 @@
+"""Default configuration and configuration files.
+
+Kept apart from main.py so that headless tools do not import Tkinter.
+"""
+import json
+import os
+
+from maps import map_size
+
+# --- Default Configuration ---
+DEFAULT_CONFIG = {
+    "grid_width": 20,
+    "grid_height": 20,
+    "map": [
+        "NNW................F",
+        ".NW................F",
+        ".W........DD......F.",
+        "....................",
+        "....................",
+        "....................",
+        "....................",
+        "....................",
+        "....................",
+        "....................",
+        "....................",
+        "....................",
+        "....................",
+        "....................",
+        "....................",
+        "....................",
+        "....................",
+        "F...................",
+        "F...................",
+        "F...................",
+    ],
+    "food_quantities": {
+        (19, 0): 20000, (19, 1): 20000, (19, 2): 20000,
+        (0, 17): 1000, (0, 18): 1000, (0, 19): 1000,
+    },
+    "max_time": 100000,
+    "nest": {
+        "ants": {
+            "Explorer": 2,
+            "Fighter": 1,
+            "Collector": 3,
+        }
+    },
+    "q_learning": {
+        "learning_rate": 0.1,
+        "discount_factor": 0.9,
+        "epsilon": 0.1,
+    },
+    "pheromones": {
+        "dissipation_rate": 0.01,
+        "food_reward": 1000,
+        "nest_reward": 1000,
+        "deadly_reward": -500,
+        "move_reward": -1,
+    },
+    # Engine options: the defaults are the original engine (eager decay,
+    # every ant visited each tick, one shared random stream); the faster
+    # modes are opt-in, see utilisation.md
+    "engine": {
+        # Decay pheromones on access instead of sweeping the grid every step
+        "lazy_dissipation": False,
+        # "python" (nested lists), "numpy" (contiguous arrays, needs NumPy) or
+        # "sparse" (only visited cells, for huge maps; cells whose values fade
+        # below sparse_threshold are dropped)
+        "pheromone_backend": "python",
+        # "objects" (one Ant per ant) or "arrays" (batched step, needs NumPy)
+        "colony": "objects",
+        # "shared" (the global random module / one NumPy generator) or
+        # "streams" (each ant draws from its own stream derived from the seed,
+        # so a seed gives the same run in a batch, across processes or alone)
+        "rng": "shared",
+        # "tick" (visit every ant every tick) or "event" (only wake due ants)
+        "scheduler": "tick",
+        # Initial Q-tables: False (zeros), "distances" (shortest paths to the
+        # nest and food, cached per map in warm_start_cache) or the path of a
+        # checkpoint of a trained run on a map of the same size
+        "warm_start": False,
+        # Per-phase timers and counters (profiler.py), shown under the controls
+        "profile": False,
+        # Rewind history: a keyframe of every ant every keyframe_interval
+        # ticks, per-tick deltas in between, pheromone frames every
+        # pheromone_interval ticks, bounded by max_bytes (False disables it)
+        "history": {
+            "keyframe_interval": 100,
+            "pheromone_interval": 1000,
+            "max_bytes": 256 * 1024 * 1024,
+        },
+        # Log of the whole run on disk, replayed with main.py --replay
+        # (trajectory.py): False, a directory path or {"path", "keyframe_interval",
+        # "frame_interval"}
+        "trajectory": False,
+    }
+}
+
+
+def config_to_json(config):
+    """Copy of `config` that JSON can store: food_quantities is keyed by (x, y) tuples."""
+    config = dict(config)
+    if "food_quantities" in config:
+        config["food_quantities"] = [[x, y, q] for (x, y), q in config["food_quantities"].items()]
+    return config
+
+
+def config_from_json(config):
+    """Inverse of config_to_json, in place; food_quantities may also be a {"x,y": q} dict."""
+    quantities = config.get("food_quantities")
+    if isinstance(quantities, list):
+        config["food_quantities"] = {(x, y): q for x, y, q in quantities}
+    elif isinstance(quantities, dict):
+        config["food_quantities"] = {tuple(int(v) for v in key.split(",")): q for key, q in quantities.items()}
+    return config
+
+
+def with_params(config, params):
+    """Returns a copy of `config` with the dotted `params` applied.
+
+    Only the dicts along the modified paths are copied; the map and the other
+    sections are shared with the base config instead of being deep-copied.
+    """
+    config = dict(config)
+    for path, value in params.items():
+        keys = path.split(".")
+        node = config
+        for key in keys[:-1]:
+            node[key] = dict(node.get(key, {}))
+            node = node[key]
+        node[keys[-1]] = value
+    return config
+
+
+def with_map_file(config, path):
+    """Returns a copy of `config` whose map is read from the file `path` (text
+    or binary, see maps.py) when the simulation starts, sized to fit it."""
+    config = dict(config)
+    config.pop("map", None)
+    config["map_file"] = path
+    config["grid_width"], config["grid_height"] = map_size(path)
+    return config
+
+
+def load_config(path, base=None):
+    """Loads a JSON config file on top of `base` (DEFAULT_CONFIG by default).
+
+    Sections given as objects (q_learning, pheromones, engine, nest...) are
+    merged key by key into the base ones. A "map_file" entry, relative to the
+    config file, replaces the map and the grid size (see with_map_file).
+    """
+    with open(path) as f:
+        overrides = config_from_json(json.load(f))
+    config = dict(DEFAULT_CONFIG if base is None else base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict) and key != "food_quantities":
+            config[key] = {**config[key], **value}
+        else:
+            config[key] = value
+    map_file = config.pop("map_file", None)
+    if map_file is not None:
+        config = with_map_file(config, os.path.join(os.path.dirname(path), map_file))
+    return config
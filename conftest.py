@@ -0,0 +1,56 @@
+"""Shared helpers of the tests: a small seeded world and run comparisons.
+
+Run the tests with `python -m pytest -q` from the project folder.
+"""
+import math
+
+
+def small_config(engine=None, seed=7, max_time=1500):
+    """A 20x20 world with two food groups, a wall and a deadly patch."""
+    config = {
+        "grid_width": 20, "grid_height": 20,
+        "map": ["NNW................F", ".NW................F", ".W........DD......F.",
+                *["...................."] * 14,
+                "F...................", "F...W...............", "F..................."],
+        "food_quantities": {(19, 0): 200, (19, 1): 200, (19, 2): 200, (0, 17): 100, (0, 18): 100, (0, 19): 100},
+        "max_time": max_time, "seed": seed,
+        "nest": {"ants": {"Explorer": 20, "Fighter": 10, "Collector": 30}},
+        "q_learning": {"learning_rate": 0.1, "discount_factor": 0.9, "epsilon": 0.1},
+        "pheromones": {"dissipation_rate": 0.01, "food_reward": 1000, "nest_reward": 1000,
+                       "deadly_reward": -500, "move_reward": -1},
+    }
+    if engine is not None:
+        config["engine"] = engine
+    return config
+
+
+def run(simulation, steps=None):
+    """Runs `steps` steps (or to the end), skipping idle ticks, and returns the simulation."""
+    while not simulation.is_finished() and steps != 0:
+        simulation.run_step()
+        simulation.skip_idle_ticks()
+        if steps is not None:
+            steps -= 1
+    return simulation
+
+
+def outcome(simulation):
+    """Time, food and actions of a run, the ants and the (decayed) Q-values."""
+    pheromone_grid = simulation.pheromone_grid.copy()
+    pheromone_grid.sync_all()
+    # rows of the sparse backend are {x: Q-values} dicts
+    rows = [[row[x] for x in sorted(row)] if isinstance(row, dict) else row
+            for table in (pheromone_grid.food_q_table, pheromone_grid.nest_q_table) for row in table]
+    q_values = [float(v) for row in rows for cell in row for v in cell]
+    ants = sorted((a["x"], a["y"], a["load"], a["mode"].name) for a in simulation.ant_states())
+    return (simulation.time, simulation.grid.remaining_food, simulation.actions_taken, ants), q_values
+
+
+def assert_same_run(a, b):
+    (state_a, q_a), (state_b, q_b) = outcome(a), outcome(b)
+    assert state_a == state_b and len(q_a) == len(q_b)
+    assert all(math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-9) for x, y in zip(q_a, q_b))
+
+
+def ant_set(ants):
+    return sorted((a["x"], a["y"], a["type"], a["load"], a["mode"].name) for a in ants)
@@ -0,0 +1,729 @@
+"""Convergence detection and fast-forward for the "objects" engine.
+
+Once learning has settled, a run spends most of its ticks repeating the same
+trips. FastForward watches the greedy routes of the ants every
+`check_interval` ticks: when the greedy action of every cell of the routes
+is unchanged and their Q-values moved by less than `tolerance` per tick over
+`window` checks in a row, the routes are taken as converged and the
+simulation jumps ahead instead of stepping tick by tick. The Q-values of a
+cell are compared relative to the largest one of the cell, so the uniform
+decay of dissipation alone is not a change; the cells off the routes, which
+exploration keeps rewriting, are not compared. A jump goes as follows:
+
+- each ant follows its greedy route: the walk from its current cell until it
+  repeats, i.e. an optional approach followed by a cycle (a food - nest trip,
+  or a loop that never reaches a goal, such as an ant bouncing on an empty
+  source);
+- exploration is counted statistically: a random move (probability epsilon,
+  uniform over the valid actions) is followed back to the route along the
+  greedy field, which gives the expected number of moves per route step and
+  its variance. The rate at which exploration takes an ant off its route for
+  good (onto a deadly cell, or to food from another source) comes from the
+  Markov chain of the epsilon-greedy walk, where the ant moves at random in
+  the loops that do not do its route's work (its own updates soon break
+  them) and in the cells whose Q-values are under `weak_q` times the
+  largest one (0 by default: any greedy action is followed). The same chain
+  gives the moves per trip, including the detours that rejoin the route
+  several steps further;
+- the jump is cut short so that the expected number of ants leaving their
+  route stays under `max_escapes` (a jump shorter than `check_interval` is
+  not made);
+- pickups and drops are events at the expected move of their route step,
+  processed in time order until `max_time` or until the next event would
+  empty a source, which is left to the tick-by-tick run (the routes change
+  when a source runs out);
+- the ants are then placed along their routes, with their timers, loads and
+  modes, time and action counts exact. The Q-tables are dissipated over
+  the skipped ticks, except on the cells of the routes: the ants keep
+  reinforcing those, and convergence means they stay where they are.
+
+The time and the number of moves are exact; the route progress, hence the
+food picked up and delivered, is an expectation. report() gives the error
+bound of the skipped ticks against a tick-by-tick run with the same frozen
+policy: two standard deviations of the progress of each ant turned into food
+(`food_error`, in units) and into the time at which a source runs out
+(`time_error`, in ticks), and the expected number of ants that left their
+route (`escapes`). With epsilon = 0 the skipped ticks are exact.
+
+The routes settle with exploration as long as the ants travel them more
+often than dissipation wipes them out: in the test world (20x20, 60 ants,
+epsilon 0.1) up to a dissipation rate of about 0.003. With the default rate
+of 0.01 the goal rewards fade from a route between two trips of the few
+ants on it, the ants wander and the greedy actions keep flipping; the check
+then never fires and the run is stepped tick by tick as without
+fast-forward.
+
+    engine: {"fast_forward": true}
+    engine: {"fast_forward": {"check_interval": 1000, "window": 5, "tolerance": 1e-3,
+                              "max_escapes": 0.1, "weak_q": 0.0}}
+"""
+import heapq
+import math
+
+from models import ANT_MODES, ACTIONS
+from rules import EFFECTS, SEARCHING, RETURNING, PICKUP, DROP, DEATH
+
+try:
+    import numpy as np
+except ImportError:  # pure Python checks
+    np = None
+
+# A refused jump delays the next check by up to 2 ** MAX_BACKOFF intervals
+MAX_BACKOFF = 4
+
+
+def create_fast_forward(options):
+    """The FastForward of an engine.fast_forward option (False, True or a dict), or None."""
+    if not options:
+        return None
+    return FastForward(**({} if options is True else options))
+
+
+def q_values(pheromone_grid):
+    """Both Q-tables, decayed up to date, as flat (food, nest) sequences of 4 values per cell.
+
+    Built from the grid's snapshot, so the running simulation is untouched.
+    With NumPy the sequences are float arrays, otherwise lists.
+    """
+    snapshot = pheromone_grid.snapshot()
+    size = pheromone_grid.width * pheromone_grid.height * 4
+    if len(snapshot) == 4:  # sparse backend: keys and values of the stored cells
+        tables = []
+        for keys, values in (snapshot[:2], snapshot[2:]):
+            if np is not None:
+                table = np.zeros((size // 4, 4))
+                table[np.frombuffer(keys, dtype=np.int64)] = np.frombuffer(values).reshape(-1, 4)
+                tables.append(table.ravel())
+                continue
+            table = [0.0] * size
+            for i, key in enumerate(keys):
+                table[key * 4:key * 4 + 4] = values[i * 4:i * 4 + 4]
+            tables.append(table)
+        return tuple(tables)
+    if np is not None:
+        return tuple(np.asarray(table, dtype=float).ravel() for table in snapshot)
+    return tuple(table.ravel().tolist() if hasattr(table, "ravel") else list(table) for table in snapshot)
+
+
+def greedy_field(grid, values):
+    """The action _get_best_action picks in each cell (first highest valid one), -1 without valid action."""
+    if np is not None:
+        valid = np.frombuffer(grid.valid_masks, dtype=np.uint8)[:, None] >> np.arange(4) & 1 == 1
+        masked = np.where(valid, np.reshape(values, (-1, 4)), -np.inf)
+        field = masked.argmax(axis=1)
+        field[~valid.any(axis=1)] = -1
+        return field.tolist()
+    field = []
+    for i, mask in enumerate(grid.valid_masks):
+        best, best_q = -1, -math.inf
+        base = i * 4
+        for action in range(4):
+            if mask >> action & 1 and values[base + action] > best_q:
+                best, best_q = action, values[base + action]
+        field.append(best)
+    return field
+
+
+def _largest_ratio_change(values, previous, cells):
+    """Largest change of the Q-values of `cells` ((mode, flat index) pairs), each
+    cell's values taken relative to its own largest absolute value, so that
+    scaling a cell (the uniform decay of dissipation) is not a change."""
+    change = 0.0
+    if np is not None:
+        for mode in range(len(values)):
+            indices = [i for cell_mode, i in cells if cell_mode == mode]
+            if indices:
+                ratios = []
+                for table in (values[mode], previous[mode]):
+                    cell_values = np.reshape(table, (-1, 4))[indices]
+                    scale = np.abs(cell_values).max(axis=1, keepdims=True)
+                    ratios.append(cell_values / np.where(scale > 0, scale, 1.0))
+                change = max(change, float(np.abs(ratios[0] - ratios[1]).max()))
+        return change
+
+    def ratios(table, i):
+        cell_values = table[i * 4:i * 4 + 4]
+        scale = max(map(abs, cell_values)) or 1.0
+        return [value / scale for value in cell_values]
+
+    for mode, i in cells:
+        for now, before in zip(ratios(values[mode], i), ratios(previous[mode], i)):
+            change = max(change, abs(now - before))
+    return change
+
+
+class Unstable(Exception):
+    """A route that cannot be fast-forwarded; the message says why."""
+
+
+class Route:
+    """The greedy route of one ant, with the expected cost of its steps.
+
+    `states[k]` is the (x, y, mode) of the ant after its k-th greedy move
+    (states[0] is where it stands); move `n` (len(states)) comes back to
+    states[cycle_start], so the steps from cycle_start + 1 on repeat with
+    period `length`. `events[k]` is "pickup", "drop" or None for step k
+    (1 <= k <= n). `mean[k]` and `variance[k]` add up the expected number of
+    moves of the first k steps, detours included.
+    """
+
+    def __init__(self, grid, fields, ant):
+        width = grid.width
+        mode = ANT_MODES.index(ant.mode)
+        state = (ant.x, ant.y, mode)
+        self.states = [state]
+        self.events = [None]
+        # (mode, flat index) of the cells whose greedy action the route relies on
+        self.cells = set()
+        index = {state: 0}
+        limit = len(grid.cells) * 2 + 1
+        while True:
+            x, y, mode = state
+            action = fields[mode][y * width + x]
+            if action < 0:
+                raise Unstable("an ant cannot move")
+            self.cells.add((mode, y * width + x))
+            state, event = _arrive(grid, x + ACTIONS[action][0], y + ACTIONS[action][1], mode)
+            self.events.append(event)
+            if state in index:
+                break
+            index[state] = len(self.states)
+            self.states.append(state)
+            if len(self.states) > limit:
+                raise Unstable("route too long")
+        # The cells of the route itself, without the detours added below
+        self.route_cells = frozenset(self.cells)
+        self.index = index
+        self.n = len(self.states)
+        self.cycle_start = index[state]
+        self.length = self.n - self.cycle_start
+
+        # Cost of each step: 1 greedy move, plus the expected extra moves of a detour
+        self.mean = [0.0]
+        self.variance = [0.0]
+        for k in range(self.n):
+            extra, spread = self._detours(grid, fields, k, ant.epsilon)
+            self.mean.append(self.mean[-1] + max(1.0 + extra, 0.5))
+            self.variance.append(self.variance[-1] + spread)
+        self.epsilon = ant.epsilon
+        self.escape_rate = None
+        self.event_steps = [k for k in range(1, self.n + 1) if self.events[k]]
+
+    def step(self, k):
+        """Index in `states` / `events` of step k, unrolling the cycle."""
+        if k <= self.n:
+            return k
+        return self.cycle_start + 1 + (k - self.cycle_start - 1) % self.length
+
+    def event(self, k):
+        """The event of step k: "pickup", "drop" or None."""
+        return self.events[self.step(k)]
+
+    def state(self, k):
+        """(x, y, mode) after step k."""
+        k = self.step(k)
+        return self.states[self.cycle_start if k == self.n else k]
+
+    def _unrolled(self, table, k):
+        if k <= self.n:
+            return table[k]
+        cycles, rest = divmod(k - self.cycle_start, self.length)
+        start = table[self.cycle_start]
+        return start + cycles * (table[self.n] - start) + table[self.cycle_start + rest] - start
+
+    def moves(self, k):
+        """Expected number of moves to complete the first k steps."""
+        return self._unrolled(self.mean, k)
+
+    def moves_variance(self, k):
+        """Variance of the number of moves to complete the first k steps."""
+        return self._unrolled(self.variance, k)
+
+    def steps_done(self, moves):
+        """Number of steps completed after `moves` moves (the last k with moves(k) <= moves)."""
+        if moves < self.mean[self.n]:
+            low, high = 0, self.n
+        else:
+            cycle = self.mean[self.n] - self.mean[self.cycle_start]
+            low = self.cycle_start + int((moves - self.mean[self.cycle_start]) // cycle) * self.length
+            high = low + self.length
+        while low < high:  # last k in [low, high] with moves(k) <= moves
+            middle = (low + high + 1) // 2
+            if self.moves(middle) <= moves:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def events_after(self, k):
+        """Yields the steps after k that carry an event, in order."""
+        cycle_events = [s for s in self.event_steps if s > self.cycle_start]
+        for s in self.event_steps:
+            if s > k and s <= self.cycle_start:
+                yield s
+        if not cycle_events:
+            return
+        base = max(k - self.cycle_start, 0) // self.length * self.length
+        while True:
+            for s in cycle_events:
+                if s + base > k:
+                    yield s + base
+            base += self.length
+
+    def count_events(self, first, last):
+        """Number of steps in [first, last] carrying an event."""
+        count = 0
+        for s in self.events_after(max(first, 1) - 1):
+            if s > last:
+                break
+            count += 1
+        return count
+
+    def _detours(self, grid, fields, k, epsilon):
+        """(mean, variance) of the extra moves taken by a random move from step k's state.
+
+        Detours that do not come back are left to the escape rate.
+        """
+        if epsilon <= 0:
+            return 0.0, 0.0
+        width = grid.width
+        x, y, mode = self.states[k]
+        valid = grid.valid_actions(x, y)
+        greedy = fields[mode][y * width + x]
+        probability = epsilon / len(valid)
+        mean = square = 0.0
+        for action in valid:
+            if action == greedy:
+                continue
+            detour = self._rejoin(grid, fields, k, x + ACTIONS[action][0], y + ACTIONS[action][1], mode)
+            if detour is None:
+                continue
+            moves, progress, path = detour
+            self.cells.update((pmode, py * width + px) for px, py, pmode in path)
+            extra = moves - progress
+            mean += probability * extra
+            square += probability * extra * extra
+        return mean, square - mean * mean
+
+    def estimate_escape_rate(self, grid, fields, weak, escape_rates):
+        """Sets `escape_rate`, the probability per move that random moves take
+        the ant off its route for good, and corrects the expected moves of a
+        cycle that picks up food. `escape_rates` shares the estimates between
+        the ants on the same cycle."""
+        if self.epsilon <= 0:
+            self.escape_rate = 0.0
+            return
+        key = (frozenset(self.states[self.cycle_start:]), self.epsilon)
+        if key not in escape_rates:
+            escape_rates[key] = self._escape_rate(grid, fields, weak, self.epsilon)
+        self.escape_rate, cycle_moves = escape_rates[key]
+        if cycle_moves:
+            # The chain also counts the longer detours and the equivalent
+            # trips the ant drifts onto: rescale the expected moves to it
+            scale = cycle_moves / (self.mean[self.n] - self.mean[self.cycle_start])
+            self.mean = [moves * scale for moves in self.mean]
+
+    def _escape_rate(self, grid, fields, weak, epsilon):
+        """(escape rate, moves per cycle): the probability per move of leaving
+        the route for good, any number of random moves in a row, and the
+        expected number of moves per cycle (None for a cycle without pickup).
+
+        The ant is a Markov chain over (x, y, mode): the greedy move, or a
+        random valid one with probability epsilon. A state is "settled" when
+        its greedy walk ends in a loop that does the same work as the cycle:
+        pickups from the same sources and drops at the nest, or no event at
+        all for a cycle without events (another trip between the same places
+        only changes its length). The ant escapes when it dies, picks up or
+        drops food away from the nest, or reaches a state whose greedy walk
+        does either. The states whose greedy action does not hold, the weak cells
+        and the loops without the cycle's work (which the ant's own updates
+        soon break), are "unsettled": the ant moves at random there until it
+        finds a settled state or escapes. The rate is that of the
+        quasi-stationary distribution, found by power iteration on the lazy
+        chain (which stays put half of the time, so that the cycle does not
+        make the iteration oscillate); the moves per cycle follow from its
+        rate of pickups.
+        """
+        width = grid.width
+        cycle = set(self.states[self.cycle_start:])
+        # (x, y, "pickup") of the pickups of the cycle, and "drop" if it drops:
+        # every nest cell takes the food alike
+        work = {self.state(k)[:2] + (self.event(k),) if self.event(k) == "pickup" else "drop"
+                for k in range(self.cycle_start + 1, self.n + 1) if self.event(k)}
+
+        def allowed(state, event):
+            return event is None or event in work or state[:2] + (event,) in work
+        # State -> True (settled), False (escapes) or None (leads into unsettled states)
+        settled = {}
+        unsettled = set()
+
+        def step(state):
+            """(next state, allowed) of the greedy move from `state`, None when the ant dies or is stuck."""
+            x, y, mode = state
+            action = fields[mode][y * width + x]
+            if action < 0:
+                return None
+            try:
+                state, event = _arrive(grid, x + ACTIONS[action][0], y + ACTIONS[action][1], mode)
+            except Unstable:
+                return None
+            return state, allowed(state, event)
+
+        def settle(state):
+            path, index = [], {}
+            while True:
+                if state in settled:
+                    result = settled[state]
+                    break
+                if (state[2], state[1] * width + state[0]) in weak:
+                    unsettled.add(state)
+                    result = None
+                    break
+                if state in index:
+                    # A loop: settled if it does work exactly when the cycle does
+                    loop = path[index[state]:]
+                    result = any(step(looped)[0][2] != looped[2] for looped in loop) == bool(work) or None
+                    if result is None:
+                        unsettled.update(loop)
+                    break
+                index[state] = len(path)
+                path.append(state)
+                move = step(state)
+                if move is None or not move[1]:
+                    result = False
+                    break
+                state = move[0]
+            settled.update(dict.fromkeys(path, result))
+            return result
+
+        settled.update(dict.fromkeys(cycle, True))
+        pickups = sum(1 for k in range(self.cycle_start + 1, self.n + 1) if self.event(k) == "pickup")
+        distribution = dict.fromkeys(cycle, 1 / len(cycle))
+        rate = picked = 0.0
+        previous = (0.0, 0.0)
+        for iteration in range(max(200, 4 * len(cycle))):
+            following = {state: mass / 2 for state, mass in distribution.items()}
+            escaped = picked = 0.0
+            for state, mass in distribution.items():
+                x, y, mode = state
+                valid = grid.valid_actions(x, y)
+                greedy = -1 if state in unsettled else fields[mode][y * width + x]
+                explore = 1.0 if greedy < 0 else epsilon
+                for action in valid:
+                    probability = mass / 2 * (explore / len(valid) + (1 - explore if action == greedy else 0.0))
+                    try:
+                        target, event = _arrive(grid, x + ACTIONS[action][0], y + ACTIONS[action][1], mode)
+                    except Unstable:
+                        escaped += probability
+                        continue
+                    if allowed(target, event) and settle(target) is not False:
+                        following[target] = following.get(target, 0.0) + probability
+                        if event == "pickup":
+                            picked += probability
+                    else:
+                        escaped += probability
+            rate = 2 * escaped
+            if escaped >= 1.0:
+                break
+            total = 1.0 - escaped
+            distribution = {state: mass / total for state, mass in following.items() if mass > 1e-12 * total}
+            if iteration > 2 * len(cycle) and all(abs(a - b) <= 1e-3 * a for a, b in zip((rate, picked), previous)):
+                break
+            previous = (rate, picked)
+        return min(rate, 1.0), pickups / (2 * picked) if pickups and picked else None
+
+    def _rejoin(self, grid, fields, k, x, y, mode):
+        """Follows an ant of step k's route that stepped off it onto (x, y) back along the greedy field.
+
+        Returns (moves, progress, path): the moves until it is back on the
+        route, the number of steps it gained (negative if it lost some) and
+        the states it went through, or None if it does not come back cleanly
+        (dead, stuck in another loop, or a pickup or drop off the route).
+        """
+        width = grid.width
+        in_cycle = k >= self.cycle_start
+        path, seen = [], set()
+        try:
+            state, event = _arrive(grid, x, y, mode)
+            while not (state in self.index and (self.index[state] >= self.cycle_start or not in_cycle)):
+                if event or state in seen:
+                    return None
+                path.append(state)
+                seen.add(state)
+                sx, sy, smode = state
+                action = fields[smode][sy * width + sx]
+                if action < 0:
+                    return None
+                state, event = _arrive(grid, sx + ACTIONS[action][0], sy + ACTIONS[action][1], smode)
+        except Unstable:
+            return None
+        progress = self.index[state] - k
+        if in_cycle:
+            progress %= self.length
+            if progress > self.length // 2:
+                progress -= self.length
+            if k + progress <= self.cycle_start:
+                k += self.length  # the same state, one lap later
+        # Skipped or repeated steps must not carry events, apart from the one rejoined
+        if progress > 0:
+            skipped = range(k + 1, k + progress)
+        else:
+            skipped = range(k + progress + 1, k + 1)
+        if any(self.event(s) for s in skipped):
+            return None
+        if event != (self.event(k + progress) if progress > 0 else None):
+            return None
+        return len(path) + 1, progress, path
+
+
+def _arrive(grid, x, y, mode):
+    """(state, event) of an ant in `mode` (ANT_MODES index) stepping onto (x, y)."""
+    effect = EFFECTS[mode][grid.cell_code(x, y)]
+    if effect == DEATH:
+        raise Unstable("a route crosses a deadly cell")
+    if effect == PICKUP:
+        source = grid.food_at.get((x, y))
+        if source and source.quantity > 0:
+            return (x, y, RETURNING), "pickup"
+    elif effect == DROP:
+        return (x, y, SEARCHING), "drop"
+    return (x, y, mode), None
+
+
+class FastForward:
+    """Detects a converged policy and skips ahead along the greedy routes (see the module docstring)."""
+
+    def __init__(self, check_interval=1000, window=5, tolerance=1e-3, max_escapes=0.1, weak_q=0.0):
+        if window < 1:
+            raise ValueError("fast_forward.window must be at least 1")
+        self.check_interval = check_interval
+        self.window = window
+        self.tolerance = tolerance
+        self.max_escapes = max_escapes
+        self.weak_q = weak_q
+        self.next_check = check_interval
+        self.stable_checks = 0
+        self._fields = None
+        self._values = None
+        self._checked_at = None
+        # Cells the routes used when they were last built
+        self._used = None
+        # Jumps refused in a row, see check()
+        self._refusals = 0
+        # Totals over every jump, see report()
+        self.skipped_ticks = 0
+        self.jumps = 0
+        self.moves = 0
+        self.exploration_moves = 0.0
+        self.escapes = 0.0
+        self.time_error = 0.0
+        self.food_error = 0.0
+        self.last_refusal = None
+
+    def check(self, simulation):
+        """Compares the policy with the previous check and jumps ahead once it has converged.
+
+        Only the cells of the ants' greedy routes are compared, not the
+        detours back to them, which exploration keeps rewriting. Building the routes costs more than the rest
+        of a check, so they are only rebuilt when the greedy action of one of
+        those cells changes, and before a jump (comparing the cells of the
+        routes by then). A refused jump doubles the wait before the next check,
+        up to 2 ** MAX_BACKOFF intervals. Called by the simulation every
+        `check_interval` ticks; returns the number of ticks skipped.
+        """
+        self.next_check = simulation.time + self.check_interval
+        values = q_values(simulation.pheromone_grid)
+        fields = tuple(greedy_field(simulation.grid, table) for table in values)
+        stable = False
+        if self._values is not None and self._used is not None:
+            if any(fields[mode][i] != self._fields[mode][i] for mode, i in self._used):
+                self._used = None  # the routes have moved
+            else:
+                stable = self._stable(simulation, fields, values, self._used)
+        routes = None
+        if self._used is None or (stable and self.stable_checks + 1 >= self.window):
+            try:
+                routes = [Route(simulation.grid, fields, ant) for ant in simulation.ants]
+                self.last_refusal = None
+            except Unstable as refusal:
+                self.last_refusal = str(refusal)
+            used = None if routes is None else set().union(*(route.route_cells for route in routes))
+            if self._used is None or used is None:
+                stable = False
+            elif stable and not used <= self._used:
+                # The ants now use cells that were not watched: compare them all
+                stable = self._stable(simulation, fields, values, used)
+            self._used = used
+        self.stable_checks = self.stable_checks + 1 if stable else 0
+        self._fields, self._values, self._checked_at = fields, values, simulation.time
+        if self.stable_checks < self.window:
+            return 0
+        skipped = self.jump(simulation, routes, fields, values)
+        if skipped:
+            # The routes change when a source runs out: wait for a new convergence
+            self.stable_checks = 0
+            self._values = self._used = None
+            self._refusals = 0
+        else:
+            # The same policy would most likely be refused again: wait longer after each refusal
+            self._refusals += 1
+            self.next_check = simulation.time + self.check_interval * 2 ** min(self._refusals, MAX_BACKOFF)
+        return skipped
+
+    def _stable(self, simulation, fields, values, cells):
+        """True if the greedy actions of `cells` are unchanged since the last check and
+        their Q-values, relative to the largest one of their cell, moved by less
+        than `tolerance` per tick."""
+        if any(fields[mode][i] != self._fields[mode][i] for mode, i in cells):
+            return False
+        change = _largest_ratio_change(values, self._values, cells)
+        return change / (simulation.time - self._checked_at) <= self.tolerance
+
+    def _weak_cells(self, values):
+        """(mode, flat index) of the cells whose Q-values are too small for their greedy action to hold."""
+        if not self.weak_q:
+            return set()
+        if np is not None:
+            largest = [np.abs(np.reshape(table, (-1, 4))).max(axis=1) for table in values]
+            threshold = self.weak_q * max(float(cells.max()) for cells in largest)
+            return {(mode, i) for mode, cells in enumerate(largest) for i in np.flatnonzero(cells < threshold).tolist()}
+        peak = max(max(map(abs, table)) for table in values)
+        threshold = self.weak_q * peak
+        return {(mode, i // 4) for mode, table in enumerate(values) for i in range(0, len(table), 4)
+                if max(abs(table[i]), abs(table[i + 1]), abs(table[i + 2]), abs(table[i + 3])) < threshold}
+
+    def jump(self, simulation, routes, fields, values):
+        """Moves the simulation ahead along the ants' greedy routes; returns the number of ticks skipped."""
+        now, max_time = simulation.time, simulation.config["max_time"]
+        ants = simulation.ants
+        escape_rates = {}
+        weak = self._weak_cells(values)
+        for route in routes:
+            route.estimate_escape_rate(simulation.grid, fields, weak, escape_rates)
+        if simulation.scheduler is not None:
+            simulation.scheduler.sync_timers(now)
+        first_move = [now + max(ant.time_to_next_move, 1) - 1 for ant in ants]
+
+        def tick_of(i, step):
+            return first_move[i] + (math.ceil(routes[i].moves(step) - 1e-9) - 1) * ants[i].speed
+
+        def moves_before(i, tick):
+            return (tick - 1 - first_move[i]) // ants[i].speed + 1 if first_move[i] < tick else 0
+
+        def escapes_before(tick):
+            return sum(route.escape_rate * moves_before(i, tick) for i, route in enumerate(routes))
+
+        # Stop early enough that all ants most likely stay on their routes
+        end = max_time
+        if escapes_before(end) > self.max_escapes:
+            low, high = now, end
+            while low < high:
+                middle = (low + high + 1) // 2
+                if escapes_before(middle) <= self.max_escapes:
+                    low = middle
+                else:
+                    high = middle - 1
+            end = low
+            if end - now < self.check_interval:
+                self.last_refusal = "exploration would soon take an ant off its route"
+                return 0
+
+        # Pickups and drops in time order, ties in colony order as in a tick
+        queue = []
+        upcoming = [route.events_after(0) for route in routes]
+        for i, steps in enumerate(upcoming):
+            step = next(steps, None)
+            if step is not None:
+                heapq.heappush(queue, (tick_of(i, step), i, step))
+        grid = simulation.grid
+        loads = [ant.current_load for ant in ants]
+        delivered = pickups = drops = 0
+        exhausting = None
+        while queue and queue[0][0] < end:
+            tick = queue[0][0]
+            batch = []
+            while queue and queue[0][0] == tick:
+                batch.append(heapq.heappop(queue))
+            # The tick in which a source would run out is left to the tick-by-tick run
+            wanted = {}
+            for _, i, step in batch:
+                if routes[i].event(step) == "pickup":
+                    position = routes[i].state(step)[:2]
+                    wanted[position] = wanted.get(position, 0) + ants[i].max_load - loads[i]
+            running_out = [position for position, amount in wanted.items() if amount >= grid.food_at[position].quantity]
+            if running_out:
+                end = tick
+                exhausting = next((i, step) for _, i, step in batch
+                                  if routes[i].event(step) == "pickup" and routes[i].state(step)[:2] in running_out)
+                break
+            for _, i, step in batch:
+                if routes[i].event(step) == "pickup":
+                    source = grid.food_at[routes[i].state(step)[:2]]
+                    loads[i] += grid.take_food(source, ants[i].max_load - loads[i])
+                    pickups += 1
+                else:
+                    delivered += loads[i]
+                    loads[i] = 0
+                    drops += 1
+                following = next(upcoming[i], None)
+                if following is not None:
+                    heapq.heappush(queue, (tick_of(i, following), i, following))
+        if end <= now:
+            return 0
+
+        # Place every ant where its route has taken it by `end`
+        moved = []
+        total_moves = 0
+        for i, (ant, route) in enumerate(zip(ants, routes)):
+            moves = moves_before(i, end)
+            step = route.steps_done(moves)
+            ant.x, ant.y, mode = route.state(step)
+            ant.mode = ANT_MODES[mode]
+            ant.current_load = loads[i]
+            ant.time_to_next_move = first_move[i] + moves * ant.speed - end + 1
+            if moves:
+                moved.append(ant)
+            total_moves += moves
+            self.exploration_moves += ant.epsilon * moves
+            # Food error: pickups or drops within two standard deviations of the expected progress
+            if ant.epsilon > 0 and step:
+                spread = 2 * math.sqrt(route.moves_variance(step)) * step / route.moves(step)
+                window = math.ceil(spread)
+                self.food_error += ant.max_load * route.count_events(step - window + 1, step + window)
+        if exhausting is not None:
+            i, step = exhausting
+            self.time_error += 2 * math.sqrt(routes[i].moves_variance(step)) * ants[i].speed
+
+        self.moves += total_moves
+        self.escapes += escapes_before(end)
+        simulation.food_delivered += delivered
+        self._dissipate(simulation.pheromone_grid, end - now, set().union(*(route.cells for route in routes)), values)
+        simulation.finish_jump(end, moved, total_moves, pickups, drops)
+        skipped = end - now
+        self.skipped_ticks += skipped
+        self.jumps += 1
+        return skipped
+
+    def _dissipate(self, pheromone_grid, skipped, cells, values):
+        """Dissipates the Q-tables over `skipped` ticks, holding `cells` ((mode, flat index) pairs) at `values`."""
+        pheromone_grid.dissipate(skipped)
+        pheromone_grid.mark_all_changed()
+        tables = (pheromone_grid.food_q_table, pheromone_grid.nest_q_table)
+        for mode, i in cells:
+            y, x = divmod(i, pheromone_grid.width)
+            pheromone_grid.sync_cell(x, y)
+            tables[mode][y][x][:] = [float(value) for value in values[mode][i * 4:i * 4 + 4]]
+
+    def report(self):
+        """What was skipped and the error bound of the jumps against a tick-by-tick run."""
+        return {
+            "skipped_ticks": self.skipped_ticks,
+            "jumps": self.jumps,
+            "moves": self.moves,
+            "exploration_moves": round(self.exploration_moves, 1),
+            "escapes": round(self.escapes, 3),
+            "time_error": math.ceil(self.time_error),
+            "food_error": math.ceil(self.food_error),
+            "stable_checks": self.stable_checks,
+            "last_refusal": self.last_refusal,
+        }
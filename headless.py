@@ -0,0 +1,113 @@
+"""Runs simulations without the GUI and streams their metrics as JSON lines.
+
+    python3 headless.py                                  # default config
+    python3 headless.py run.json --interval 1000 --output metrics.jsonl
+    python3 headless.py --map maps/maze.txt --seed 3 --set q_learning.epsilon=0.05
+
+Each config runs to the end with the history turned off. Every `interval`
+ticks one line is written with the tick, the food remaining and delivered,
+the live ants, the actions taken and the ticks per second since the
+previous line, and a last line with "end": true. Only the simulation
+modules are imported, never Tkinter.
+"""
+import argparse
+import json
+import sys
+import time
+
+from config import DEFAULT_CONFIG, load_config, with_map_file, with_params
+from simulation import Simulation
+
+
+def metrics(simulation, elapsed_ticks, elapsed_seconds):
+    """One metrics record of a running simulation."""
+    return {
+        "time": simulation.time,
+        "remaining_food": simulation.grid.remaining_food,
+        "delivered": simulation.food_delivered,
+        "ants": len(simulation.ants),
+        "actions": simulation.actions_taken,
+        "ticks_per_second": round(elapsed_ticks / elapsed_seconds, 1) if elapsed_ticks and elapsed_seconds > 0 else None,
+    }
+
+
+def run(config, out, interval=1000, skip_idle=True, labels=None):
+    """Runs `config` to the end, writing a metrics line to `out` every `interval` ticks.
+
+    `labels` are extra fields added to every line. Returns the last record.
+    """
+    engine = dict(config.get("engine", {}))
+    engine["history"] = False
+    config = dict(config, engine=engine)
+
+    simulation = Simulation(config)
+    labels = labels or {}
+    clock = time.perf_counter
+    last_time, last_clock = simulation.time, clock()
+    next_report = interval
+
+    while not simulation.is_finished():
+        simulation.run_step()
+        if skip_idle:
+            simulation.skip_idle_ticks()
+        # the end record covers the last interval of a finished run
+        if interval and simulation.time >= next_report and not simulation.is_finished():
+            now = clock()
+            out.write(json.dumps({**labels, **metrics(simulation, simulation.time - last_time, now - last_clock)}) + "\n")
+            out.flush()
+            last_time, last_clock = simulation.time, now
+            next_report = (simulation.time // interval + 1) * interval
+
+    simulation.close_trajectory()
+    record = {**labels, **metrics(simulation, simulation.time - last_time, clock() - last_clock), "end": True}
+    if simulation.fast_forward is not None:
+        record["fast_forward"] = simulation.fast_forward.report()
+    out.write(json.dumps(record) + "\n")
+    out.flush()
+    return record
+
+
+def _parse_set(text):
+    """`path=value` with the value read as JSON, or as a string if that fails."""
+    path, _, value = text.partition("=")
+    try:
+        return path, json.loads(value)
+    except ValueError:
+        return path, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs simulations without the GUI, streaming JSONL metrics.")
+    parser.add_argument("configs", nargs="*", help="JSON config files, merged over the default config")
+    parser.add_argument("--map", help="map file (text or binary) replacing the config's map and grid size")
+    parser.add_argument("--seed", type=int, help="seed of every run")
+    parser.add_argument("--max-time", type=int, help="tick budget of every run")
+    parser.add_argument("--set", action="append", default=[], metavar="PATH=VALUE",
+                        help='config override, e.g. q_learning.epsilon=0.05 (repeatable)')
+    parser.add_argument("--interval", type=int, default=1000, help="ticks between metric lines (0: end only)")
+    parser.add_argument("--no-skip", action="store_true", help="step every tick instead of skipping idle ones")
+    parser.add_argument("--output", help="append the metrics to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    overrides = dict(_parse_set(text) for text in args.set)
+    if args.seed is not None:
+        overrides["seed"] = args.seed
+    if args.max_time is not None:
+        overrides["max_time"] = args.max_time
+
+    out = open(args.output, "a") if args.output else sys.stdout
+    try:
+        for path in args.configs or [None]:
+            config = DEFAULT_CONFIG if path is None else load_config(path)
+            if args.map:
+                config = with_map_file(config, args.map)
+            config = with_params(config, overrides)
+            run(config, out, args.interval, not args.no_skip, labels={"config": path or "default"})
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
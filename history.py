@@ -0,0 +1,180 @@
+from array import array
+from bisect import bisect_right
+from models import ANT_TYPES, ANT_MODES
+
+
+def _pack(typecode, values):
+    """Packs a list or a NumPy array into an array.array of the given type."""
+    if hasattr(values, "astype"):
+        packed = array(typecode)
+        packed.frombytes(values.astype(f"int{packed.itemsize * 8}").tobytes())
+        return packed
+    return array(typecode, values)
+
+
+def _nbytes(buffers):
+    return sum(memoryview(buffer).nbytes for buffer in buffers)
+
+
+class _Segment:
+    """A keyframe (every ant at one tick) followed by the per-tick deltas up to the next one."""
+
+    def __init__(self, time, ids, xs, ys, types, loads, modes):
+        self.time = time
+        self.keyframe = (_pack('i', ids), _pack('i', xs), _pack('i', ys),
+                         _pack('b', types), _pack('i', loads), _pack('b', modes))
+        self.downsampled = False
+        self._clear_deltas()
+
+    def _clear_deltas(self):
+        # Delta frame k covers delta_times[k]; its ants are the slice
+        # delta_ends[k-1]:delta_ends[k] of the d_* arrays, its deaths the
+        # slice removed_ends[k-1]:removed_ends[k] of `removed`.
+        self.delta_times = array('q')
+        self.delta_ends = array('i')
+        self.removed_ends = array('i')
+        self.deltas = (array('i'), array('i'), array('i'), array('i'), array('b'))  # ids, xs, ys, loads, modes
+        self.removed = array('i')
+
+    def nbytes(self):
+        return _nbytes(self.keyframe) + _nbytes(self.deltas) + \
+            _nbytes((self.delta_times, self.delta_ends, self.removed_ends, self.removed))
+
+    def drop_deltas(self):
+        """Downsamples the segment to its keyframe only and returns the bytes freed."""
+        freed = self.nbytes()
+        self._clear_deltas()
+        self.downsampled = True
+        return freed - self.nbytes()
+
+
+class HistoryStore:
+    """Bounded history of a simulation, made of keyframes and per-tick deltas.
+
+    A keyframe packs every ant every `keyframe_interval` ticks. In between,
+    each tick only stores the ants that acted and the ids of the ants that
+    died. Pheromone snapshots are taken every `pheromone_interval` ticks
+    (0 disables them); a snapshot larger than `max_bytes` on its own is not
+    stored. When the store grows past `max_bytes`, old pheromone snapshots
+    are dropped first, then the deltas of the oldest segments (keeping their
+    keyframes), the oldest segments themselves, and finally the last
+    pheromone snapshot.
+
+    ``history[t]`` rebuilds the state at tick t in the format the GUI uses.
+    A tick whose frames were evicted falls back to the closest earlier frame
+    still available, or to the oldest one.
+    """
+
+    def __init__(self, keyframe_interval=100, pheromone_interval=1000, max_bytes=256 * 1024 * 1024):
+        self.keyframe_interval = keyframe_interval
+        self.pheromone_interval = pheromone_interval
+        self.max_bytes = max_bytes
+        self.segments = []
+        self.pheromones = []  # (time, snapshot)
+        self._pheromone_time = None  # tick of the last snapshot taken, stored or not
+        self.last_time = -1
+        self.nbytes = 0
+
+    def __len__(self):
+        return self.last_time + 1
+
+    def __getitem__(self, time):
+        if time < 0:
+            time += len(self)
+        if not 0 <= time < len(self):
+            raise IndexError("history tick out of range")
+        return self.state_at(time)
+
+    def record(self, time, changes, removed, full_state, pheromone_snapshot=None):
+        """Records tick `time`.
+
+        `changes` is an (ids, xs, ys, loads, modes) tuple for the ants that
+        acted, `removed` the ids of the ants that died. `full_state()` must
+        return (ids, xs, ys, types, loads, modes) for every living ant and is
+        only called on keyframes, like `pheromone_snapshot()` on pheromone
+        frames.
+        """
+        if not self.segments or time - self.segments[-1].time >= self.keyframe_interval:
+            segment = _Segment(time, *full_state())
+            self.segments.append(segment)
+            self.nbytes += segment.nbytes()
+        elif len(changes[0]) or len(removed):
+            segment = self.segments[-1]
+            before = segment.nbytes()
+            segment.delta_times.append(time)
+            for column, typecode, values in zip(segment.deltas, "iiiib", changes):
+                column.extend(_pack(typecode, values))
+            segment.removed.extend(_pack('i', removed))
+            segment.delta_ends.append(len(segment.deltas[0]))
+            segment.removed_ends.append(len(segment.removed))
+            self.nbytes += segment.nbytes() - before
+
+        if pheromone_snapshot is not None and self.pheromone_interval and \
+           (self._pheromone_time is None or time - self._pheromone_time >= self.pheromone_interval):
+            snapshot = pheromone_snapshot()
+            self._pheromone_time = time
+            if _nbytes(snapshot) <= self.max_bytes:
+                self.pheromones.append((time, snapshot))
+                self.nbytes += _nbytes(snapshot)
+
+        self.last_time = time
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        """Evicts or downsamples old frames until the store fits in max_bytes."""
+        while self.nbytes > self.max_bytes:
+            if len(self.pheromones) > 1:
+                _, snapshot = self.pheromones.pop(0)
+                self.nbytes -= _nbytes(snapshot)
+                continue
+            old = next((seg for seg in self.segments[:-1] if len(seg.delta_times)), None)
+            if old is not None:
+                self.nbytes -= old.drop_deltas()
+            elif len(self.segments) > 1:
+                self.nbytes -= self.segments.pop(0).nbytes()
+            elif self.pheromones:
+                _, snapshot = self.pheromones.pop()
+                self.nbytes -= _nbytes(snapshot)
+            else:
+                break
+
+    def state_at(self, time):
+        """Rebuilds the state at tick `time` as {"time", "ants": [dicts]}."""
+        times = [segment.time for segment in self.segments]
+        segment = self.segments[max(bisect_right(times, time) - 1, 0)]
+
+        ids, xs, ys, types, loads, modes = segment.keyframe
+        ants = {i: [x, y, t, load, mode] for i, x, y, t, load, mode in zip(ids, xs, ys, types, loads, modes)}
+
+        end = bisect_right(segment.delta_times, time)
+        if end:
+            d_ids, d_xs, d_ys, d_loads, d_modes = segment.deltas
+            for k in range(segment.delta_ends[end - 1]):
+                ant = ants.get(d_ids[k])
+                if ant is not None:
+                    ant[0], ant[1], ant[3], ant[4] = d_xs[k], d_ys[k], d_loads[k], d_modes[k]
+            for k in range(segment.removed_ends[end - 1]):
+                ants.pop(segment.removed[k], None)
+
+        # Ticks without deltas are identical to the previous frame; a
+        # downsampled segment is only exact at its keyframe.
+        if segment.downsampled:
+            frame_time = segment.time
+        else:
+            frame_time = min(max(time, segment.time), self.last_time)
+
+        return {
+            "time": frame_time,
+            "ants": [
+                {"x": x, "y": y, "type": ANT_TYPES[t].__name__, "load": load, "mode": ANT_MODES[mode]}
+                for x, y, t, load, mode in ants.values()
+            ],
+        }
+
+    def pheromones_at(self, time):
+        """Returns (time, snapshot) for the closest pheromone frame at or before `time`, or None."""
+        times = [t for t, _ in self.pheromones]
+        index = bisect_right(times, time) - 1
+        if index < 0:
+            return self.pheromones[0] if self.pheromones else None
+        return self.pheromones[index]
@@ -0,0 +1,355 @@
+"""Local job service for headless runs, with a content-addressed result cache.
+
+Tuning scripts keep asking for runs they have already made. JobService takes
+run requests (a config and a seed), runs them in a pool of worker processes
+and remembers the results:
+
+- the cache key hashes the canonical form of the config (see
+  canonical_config) with ENGINE_VERSION, so the same run is recognised
+  whatever the order of its keys, and forgotten when the engine changes;
+- ResultCache keeps the results on disk and evicts the least recently used
+  ones past `max_bytes`;
+- identical requests in flight share a single run.
+
+A run without a seed is random, and a run writing a trajectory log
+(engine.trajectory) has a side effect a cached result cannot replay, so
+neither is cached nor shared.
+
+In-process (inside a coroutine):
+
+    service = JobService(workers=4)
+    result = await service.run(config, seed=3)
+
+Over a Unix socket, one JSON object per line in each direction:
+
+    python3 jobs.py serve --workers 4
+    python3 jobs.py submit run.json --seed 3
+
+A request is {"id": ..., "config": {...}, "seed": 3} with a complete config
+as written by config_to_json (its paths are opened by the service, so prefer
+absolute ones); `submit` sends one. The reply is {"id": ..., "result": {...},
+"source": "cache" | "shared" | "run"} or {"id": ..., "error": "..."}.
+Requests on one connection run concurrently and are answered as they finish.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import stat
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from config import DEFAULT_CONFIG, config_to_json, config_from_json, load_config
+from simulation import Simulation, ENGINE_VERSION
+from warmstart import CACHE_DIR
+
+RESULT_DIR = os.path.join(CACHE_DIR, "results")
+DEFAULT_SOCKET = os.path.join(CACHE_DIR, "jobs.sock")
+# Engine options that never change the outcome of a run
+NEUTRAL_ENGINE_KEYS = ("history", "profile", "warm_start_cache")
+# Longest request line accepted by the server (configs may embed big maps)
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+
+def _file_digest(path):
+    """sha1 of the contents of a file, read in chunks."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def canonical_config(config):
+    """JSON-ready copy of a config keeping only what decides the outcome of a run.
+
+    food_quantities becomes a sorted [[x, y, q], ...] list, the map file and
+    a warm-start checkpoint are replaced by the hash of their contents, and
+    the engine options in NEUTRAL_ENGINE_KEYS are dropped.
+    """
+    config = config_to_json(config)
+    if "food_quantities" in config:
+        config["food_quantities"] = sorted(config["food_quantities"])
+    if config.get("map_file"):
+        config["map_file"] = _file_digest(config["map_file"])
+    engine = {key: value for key, value in config.get("engine", {}).items() if key not in NEUTRAL_ENGINE_KEYS}
+    if engine.get("warm_start") not in (None, False, "distances"):
+        engine["warm_start"] = _file_digest(engine["warm_start"])
+    config["engine"] = engine
+    return config
+
+
+def config_key(config):
+    """Cache key of a seeded config.
+
+    None for an unseeded (random) one and for one writing a trajectory log,
+    which must always run.
+    """
+    if config.get("seed") is None or config.get("engine", {}).get("trajectory"):
+        return None
+    blob = json.dumps([ENGINE_VERSION, canonical_config(config)], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def run_config(config):
+    """Runs a config to the end, without history, and returns its result record."""
+    config = dict(config, engine=dict(config.get("engine", {}), history=False))
+    simulation = Simulation(config)
+    while not simulation.is_finished():
+        simulation.run_step()
+        simulation.skip_idle_ticks()
+    simulation.close_trajectory()
+    return {
+        "time": simulation.time,
+        "remaining_food": simulation.grid.remaining_food,
+        "total_food": simulation.grid.total_food,
+        "delivered": simulation.food_delivered,
+        "actions": simulation.actions_taken,
+        "ants": len(simulation.ants),
+    }
+
+
+class ResultCache:
+    """Run results on disk, one small JSON file per key, at most `max_bytes` in total.
+
+    Reading a result touches its file, so the modification times order the
+    entries from least to most recently used, also across restarts. Several
+    processes may share the directory; each one only evicts the entries it
+    knows of.
+    """
+
+    def __init__(self, directory=RESULT_DIR, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        # key -> file size, least recently used first
+        self._entries = OrderedDict()
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                try:
+                    info = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                files.append((info.st_mtime, name[:-len(".json")], info.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+        self.size = sum(self._entries.values())
+        self._evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        """The result stored under `key`, or None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+            result = json.loads(blob)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.size += len(blob) - self._entries.pop(key, 0)
+        self._entries[key] = len(blob)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Stores a result, then evicts the least recently used ones past max_bytes."""
+        blob = json.dumps(result).encode()
+        path = self._path(key)
+        try:
+            # Written aside then renamed, as several services may share the directory
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as out:
+                out.write(blob)
+            os.replace(temporary, path)
+        except OSError:
+            return  # a read-only cache only costs a new run next time
+        self.size += len(blob) - self._entries.pop(key, 0)
+        self._entries[key] = len(blob)
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+
+def cached_run(config, cache):
+    """run_config, answered from `cache` when the same seeded run is already in it."""
+    key = config_key(config)
+    result = cache.get(key) if key is not None else None
+    if result is None:
+        result = run_config(config)
+        if key is not None:
+            cache.put(key, result)
+    return result
+
+
+class JobService:
+    """Runs requests in a process pool, sharing identical runs and caching their results.
+
+    `cache` is a ResultCache (the default one when None, no cache when False).
+    Must be used from a running event loop.
+    """
+
+    def __init__(self, workers=None, cache=None):
+        self.cache = None if cache is False else ResultCache() if cache is None else cache
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        # Cache key -> future of the run in progress
+        self._running = {}
+        self.runs = 0
+        self.shared = 0
+
+    async def run(self, config, seed=None):
+        """Returns the result record of `config` run with `seed` (the config's own seed when None)."""
+        result, _ = await self.submit(config, seed)
+        return result
+
+    async def submit(self, config, seed=None):
+        """Like run, but returns (result, source), source telling where the
+        result came from: "cache", "shared" (an identical run in flight) or "run"."""
+        if seed is not None:
+            config = dict(config, seed=seed)
+        key = config_key(config)
+        if key is None:
+            self.runs += 1
+            return await asyncio.get_running_loop().run_in_executor(self.pool, run_config, config), "run"
+        if self.cache is not None:
+            result = self.cache.get(key)
+            if result is not None:
+                return result, "cache"
+
+        future = self._running.get(key)
+        if future is not None:
+            self.shared += 1
+            source = "shared"
+        else:
+            future = asyncio.ensure_future(self._execute(key, config))
+            self._running[key] = future
+            source = "run"
+        # Shielded: a waiter that goes away does not cancel the run for the others
+        return await asyncio.shield(future), source
+
+    async def _execute(self, key, config):
+        self.runs += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.pool, run_config, config)
+            if self.cache is not None:
+                self.cache.put(key, result)
+            return result
+        finally:
+            del self._running[key]
+
+    async def serve(self, path=DEFAULT_SOCKET):
+        """Answers requests on a Unix socket at `path` until cancelled."""
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)  # left behind by a service that did not stop cleanly
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        server = await asyncio.start_unix_server(self._handle, path, limit=MAX_REQUEST_BYTES)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    async def _handle(self, reader, writer):
+        """Serves one connection: every request line is answered as soon as its run ends."""
+        replies = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    replies.append(asyncio.ensure_future(self._reply(line, writer)))
+            await asyncio.gather(*replies)
+        finally:
+            writer.close()
+
+    async def _reply(self, line, writer):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            config = config_from_json(request["config"])
+            result, source = await self.submit(config, request.get("seed"))
+            reply = {"id": request_id, "result": result, "source": source}
+        except Exception as error:  # reported to the client, the service keeps going
+            reply = {"id": request_id, "error": f"{type(error).__name__}: {error}"}
+        writer.write((json.dumps(reply) + "\n").encode())
+        await writer.drain()
+
+    def close(self):
+        """Stops the worker processes."""
+        self.pool.shutdown()
+
+
+def submit(config, seed=None, path=DEFAULT_SOCKET, timeout=None):
+    """Sends one request to the service listening on `path` and returns its reply dict."""
+    request = {"config": config_to_json(config), "seed": seed}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(path)
+        connection.sendall((json.dumps(request) + "\n").encode())
+        with connection.makefile("rb") as replies:
+            return json.loads(replies.readline())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local job service for headless runs, with a result cache.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run the service")
+    serve.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    serve.add_argument("--cache-dir", default=RESULT_DIR, help="result cache directory")
+    serve.add_argument("--cache-size", type=int, default=64, help="result cache size in MB")
+    serve.add_argument("--no-cache", action="store_true", help="do not read or write cached results")
+    request = commands.add_parser("submit", help="send runs to a running service")
+    request.add_argument("configs", nargs="*", help="JSON config files, merged over the default config")
+    request.add_argument("--seed", type=int, help="seed of every run")
+    for command in (serve, request):
+        command.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket of the service")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        cache = False if args.no_cache else ResultCache(args.cache_dir, args.cache_size * 1024 * 1024)
+        service = JobService(args.workers, cache)
+        print(f"Serving on {args.socket}", file=sys.stderr)
+        try:
+            asyncio.run(service.serve(args.socket))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.close()
+        return 0
+
+    status = 0
+    for path in args.configs or [None]:
+        config = DEFAULT_CONFIG if path is None else load_config(path)
+        reply = submit(config, args.seed, args.socket)
+        print(json.dumps({"config": path or "default", **reply}))
+        status = status or ("error" in reply)
+    return int(status)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
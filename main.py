@@ -1,79 +1,51 @@
+import argparse
 import tkinter as tk
 from tkinter import ttk
 from simulation import Simulation
-from models import CellType, Explorer, Fighter, Collector
-
-# --- Default Configuration ---
-DEFAULT_CONFIG = {
-    "grid_width": 20,
-    "grid_height": 20,
-    "map": [
-        "NNW................F",
-        ".NW................F",
-        ".W........DD......F.",
-        "....................",
-        "....................",
-        "....................",
-        "....................",
-        "....................",
-        "....................",
-        "....................",
-        "....................",
-        "....................",
-        "....................",
-        "....................",
-        "....................",
-        "....................",
-        "....................",
-        "F...................",
-        "F...................",
-        "F...................",
-    ],
-    "food_quantities": {
-        (19, 0): 20000, (19, 1): 20000, (19, 2): 20000,
-        (0, 17): 1000, (0, 18): 1000, (0, 19): 1000,
-    },
-    "max_time": 100000,
-    "nest": {
-        "ants": {
-            "Explorer": 2,
-            "Fighter": 1,
-            "Collector": 3,
-        }
-    },
-    "q_learning": {
-        "learning_rate": 0.1,
-        "discount_factor": 0.9,
-        "epsilon": 0.1,
-    },
-    "pheromones": {
-        "dissipation_rate": 0.01,
-        "food_reward": 1000,
-        "nest_reward": 1000,
-        "deadly_reward": -500,
-        "move_reward": -1,
-    }
-}
+from renderer import CanvasRenderer
+from stepper import BackgroundStepper
+from config import DEFAULT_CONFIG
+from models import create_pheromone_grid
+from trajectory import TrajectoryReader
 
 class App(tk.Tk):
-    """Main application class for the AI-Fants simulation."""
-    def __init__(self, config):
+    """Main application class for the AI-Fants simulation.
+
+    With `replay`, the path of a trajectory log (trajectory.py), the App
+    only replays that run with the time slider and runs no simulation.
+    """
+    def __init__(self, config, replay=None):
         super().__init__()
         self.title("AI-Fants Simulation")
         self.config = config
         self.cell_size = 25
+        # Largest canvas; bigger grids are panned and zoomed inside it
+        self.max_canvas_size = (900, 700)
+        self.frame_ms = 50
         self.is_running = False
+        # True while the canvas shows the stepper's latest snapshot, which
+        # the next ones only patch; False after drawing a past tick
+        self._showing_live = False
+        self._following = False
 
-        self.simulation = Simulation(self.config)
+        self.replay = TrajectoryReader(replay) if replay is not None else None
+        self.simulation = Simulation(self.config) if self.replay is None else None
 
         # --- UI Elements ---
-        self.canvas = tk.Canvas(
-            self,
-            width=self.config["grid_width"] * self.cell_size,
-            height=self.config["grid_height"] * self.cell_size,
-            bg="white"
-        )
+        grid = self.simulation.grid if self.replay is None else self.replay
+        canvas_width = min(grid.width * self.cell_size, self.max_canvas_size[0])
+        canvas_height = min(grid.height * self.cell_size, self.max_canvas_size[1])
+        self.canvas = tk.Canvas(self, width=canvas_width, height=canvas_height, bg="white")
         self.canvas.pack(pady=10, padx=10)
+        self.renderer = CanvasRenderer(self.canvas, self.cell_size, canvas_width, canvas_height)
+
+        # Drag to pan, wheel to zoom around the pointer (Button-4/5 on X11)
+        self.canvas.bind("<ButtonPress-1>", self.on_drag_start)
+        self.canvas.bind("<B1-Motion>", self.on_drag)
+        self.canvas.bind("<MouseWheel>", lambda event: self.on_zoom(event, event.delta > 0))
+        self.canvas.bind("<Button-4>", lambda event: self.on_zoom(event, True))
+        self.canvas.bind("<Button-5>", lambda event: self.on_zoom(event, False))
+        self._drag = None
 
         controls_frame = tk.Frame(self)
         controls_frame.pack(pady=5)
@@ -87,6 +59,24 @@ class App(tk.Tk):
         self.reset_button = tk.Button(controls_frame, text="Reset", command=self.reset_simulation)
         self.reset_button.pack(side=tk.LEFT, padx=5)
 
+        tk.Button(controls_frame, text="Fit", command=self.renderer.fit).pack(side=tk.LEFT, padx=5)
+
+        # --- Speed ---
+        # The simulation runs on a worker thread; the GUI only samples it once per frame.
+        speed_frame = tk.Frame(self)
+        speed_frame.pack(pady=5)
+        tk.Label(speed_frame, text="Steps/frame:").pack(side=tk.LEFT)
+        self.steps_per_frame_var = tk.IntVar(value=1)
+        tk.Spinbox(speed_frame, from_=1, to=10000, width=6, textvariable=self.steps_per_frame_var, command=self.update_speed).pack(side=tk.LEFT)
+        self.max_speed_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(speed_frame, text="Max speed", variable=self.max_speed_var, command=self.update_speed).pack(side=tk.LEFT, padx=5)
+        self.tps_label = tk.Label(speed_frame, text="0 ticks/s")
+        self.tps_label.pack(side=tk.LEFT, padx=5)
+
+        # Live counters, when engine.profile is enabled
+        self.profile_label = tk.Label(self, text="")
+        self.profile_label.pack(pady=2)
+
         # --- Time Slider ---
         slider_frame = tk.Frame(self)
         slider_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -100,16 +90,74 @@ class App(tk.Tk):
         view_frame.pack(pady=5)
         self.pheromone_view_var = tk.StringVar(value="none")
         tk.Label(view_frame, text="Pheromone View:").pack(side=tk.LEFT)
-        tk.Radiobutton(view_frame, text="None", variable=self.pheromone_view_var, value="none", command=self.draw_world).pack(side=tk.LEFT)
-        tk.Radiobutton(view_frame, text="Food", variable=self.pheromone_view_var, value="food", command=self.draw_world).pack(side=tk.LEFT)
-        tk.Radiobutton(view_frame, text="Nest", variable=self.pheromone_view_var, value="nest", command=self.draw_world).pack(side=tk.LEFT)
+        tk.Radiobutton(view_frame, text="None", variable=self.pheromone_view_var, value="none", command=self.on_view_change).pack(side=tk.LEFT)
+        tk.Radiobutton(view_frame, text="Food", variable=self.pheromone_view_var, value="food", command=self.on_view_change).pack(side=tk.LEFT)
+        tk.Radiobutton(view_frame, text="Nest", variable=self.pheromone_view_var, value="nest", command=self.on_view_change).pack(side=tk.LEFT)
+
+        if self.replay is not None:
+            for button in (self.start_button, self.reset_button):
+                button.config(state=tk.DISABLED)
+            self.stepper = None
+            self.time_slider.config(from_=self.replay.start_time, to=self.replay.last_time)
+            self.draw_world(self.replay.start_time)
+            return
+
+        self.stepper = BackgroundStepper(self.simulation, self.target_tps(), self.pheromone_view_var.get())
 
         # --- Initial Draw ---
         self.draw_world()
 
+    def target_tps(self):
+        """Ticks per second requested by the speed controls (None = as fast as possible)."""
+        if self.max_speed_var.get():
+            return None
+        try:
+            steps = max(1, self.steps_per_frame_var.get())
+        except tk.TclError:
+            steps = 1
+        return steps * 1000 / self.frame_ms
+
+    def update_speed(self):
+        """Applies the speed controls to the worker thread."""
+        if self.stepper is None:
+            return
+        self.stepper.target_tps = self.target_tps()
+
+    def on_view_change(self):
+        """Callback for the pheromone view radio buttons."""
+        if self.replay is not None:
+            self.draw_world(int(float(self.time_slider.get())))
+            return
+        self.stepper.view = self.pheromone_view_var.get()
+        if not self.is_running:
+            self.stepper.publish()
+            self.draw_world()
+
+    def on_drag_start(self, event):
+        self._drag = (event.x, event.y)
+
+    def on_drag(self, event):
+        """Pans the view with the mouse."""
+        if self._drag is not None:
+            self.renderer.pan(event.x - self._drag[0], event.y - self._drag[1])
+        self._drag = (event.x, event.y)
+
+    def on_zoom(self, event, zoom_in):
+        """Zooms the view around the mouse pointer."""
+        self.renderer.zoom(1.25 if zoom_in else 0.8, event.x, event.y)
+
     def on_slider_move(self, value):
         """Callback for when the time slider is moved."""
-        if self.simulation.history:
+        if self._following:
+            return  # moved by update_loop, not by the user
+        if self.replay is not None:
+            # The log may still be growing: follow the running simulation
+            self.replay.refresh()
+            self.time_slider.config(to=self.replay.last_time)
+            time_step = int(float(value))
+            self.draw_world(time_step)
+            self.time_label.config(text=f"Time: {time_step}")
+        elif self.simulation.history:
             time_step = int(float(value))
             self.draw_world(time_step)
             self.time_label.config(text=f"Time: {time_step}")
@@ -119,118 +167,124 @@ class App(tk.Tk):
         self.is_running = True
         self.start_button.config(state=tk.DISABLED)
         self.pause_button.config(state=tk.NORMAL)
+        self.update_speed()
+        self.stepper.resume()
         self.update_loop()
 
     def pause_simulation(self):
         """Pauses the simulation."""
         self.is_running = False
+        self.stepper.pause()
         self.start_button.config(state=tk.NORMAL)
         self.pause_button.config(state=tk.DISABLED)
 
     def reset_simulation(self):
         """Resets the simulation to its initial state."""
         self.is_running = False
+        self.stepper.stop()
+        self.simulation.close_trajectory()
+        if self.config.get("engine", {}).get("trajectory"):
+            # Never replace the log of the run being reset
+            print(f"Trajectory log kept in {self.config['engine']['trajectory']!r}; the new run is not logged.")
+            self.config = dict(self.config, engine=dict(self.config["engine"], trajectory=False))
         self.simulation = Simulation(self.config)
+        self.stepper = BackgroundStepper(self.simulation, self.target_tps(), self.pheromone_view_var.get())
         self.start_button.config(state=tk.NORMAL)
         self.pause_button.config(state=tk.DISABLED)
+        self.renderer.reset()
+        self._showing_live = False
         self.draw_world()
 
     def update_loop(self):
-        """Main loop to update and redraw the simulation."""
+        """Redraws the latest snapshot published by the worker thread, once per frame."""
         if not self.is_running:
             return
 
-        self.simulation.run_step()
-        self.time_slider.config(to=self.simulation.time)
-        self.time_slider.set(self.simulation.time)
-        self.time_label.config(text=f"Time: {self.simulation.time}")
+        snapshot = self.stepper.latest()
+        self._following = True
+        self.time_slider.config(to=snapshot["time"])
+        self.time_slider.set(snapshot["time"])
+        self._following = False
+        self.time_label.config(text=f"Time: {snapshot['time']}")
+        self.tps_label.config(text=f"{self.stepper.ticks_per_second:.0f} ticks/s")
+        if snapshot["profile"] is not None:
+            self.profile_label.config(text=snapshot["profile"])
         self.draw_world()
 
-        if self.simulation.is_finished():
+        if snapshot["finished"]:
             self.pause_simulation()
-            print(f"Simulation finished at time {self.simulation.time}.")
+            print(f"Simulation finished at time {snapshot['time']}.")
+            with self.stepper.lock:
+                self.simulation.close_trajectory()
+            if self.simulation.profiler is not None:
+                print(self.simulation.profiler.report())
         else:
-            self.after(50, self.update_loop) # Update every 50ms
+            self.after(self.frame_ms, self.update_loop)
 
     def draw_world(self, time_step=None):
-        """Draws the entire simulation state on the canvas."""
-        self.canvas.delete("all")
-
-        state = None
-        if time_step is not None and time_step < len(self.simulation.history):
-            state = self.simulation.history[time_step]
-
-        self._draw_pheromones(time_step)
-        self._draw_grid()
-        self._draw_ants(state)
+        """Draws the latest snapshot, or a past tick from the history, on the canvas."""
+        if self.replay is not None:
+            self._draw_replay(time_step)
+            return
+        grid = self.simulation.grid
+        if time_step is None:
+            snapshot = self.stepper.latest()
+            if not snapshot["full"] and not self._showing_live:
+                # The changes are relative to a snapshot the canvas no longer shows
+                self.stepper.publish(full=True)
+                snapshot = self.stepper.latest()
+            if snapshot["full"]:
+                self.renderer.draw(grid.width, grid.height, snapshot["cells"], snapshot["ants"],
+                                   snapshot["heatmap"], snapshot["view"])
+            else:
+                self.renderer.draw_changes(snapshot["cell_changes"], snapshot["ants"], snapshot["heat_changes"])
+            self._showing_live = True
+            return
+        self._showing_live = False
 
-    def _draw_pheromones(self, time_step=None):
-        """Draws the pheromone trails on the canvas."""
+        # The history belongs to the worker thread: read it under its lock
         view = self.pheromone_view_var.get()
+        with self.stepper.lock:
+            history = self.simulation.history
+            if history and time_step < len(history):
+                ants = history[time_step]["ants"]
+            else:
+                ants = self.simulation.ant_states()
+            heatmap = self._pheromone_heatmap(view, time_step)
+            cells = bytes(grid.cells)
+        self.renderer.draw(grid.width, grid.height, cells, ants, heatmap, view)
+
+    def _pheromone_heatmap(self, view, time_step):
+        """Returns the heatmap of the selected pheromone view at a past tick, or None."""
         if view == "none":
-            return
-
-        # Note: For simplicity, this visualizes the *current* pheromone state,
-        # not the historical state, as storing pheromone history is memory-intensive.
-        q_table = self.simulation.pheromone_grid.food_q_table if view == "food" else self.simulation.pheromone_grid.nest_q_table
-
-        max_pheromone = 0.001 # Avoid division by zero
-        for y in range(self.simulation.grid.height):
-            for x in range(self.simulation.grid.width):
-                max_pheromone = max(max_pheromone, max(q_table[y][x]))
-
-        for y in range(self.simulation.grid.height):
-            for x in range(self.simulation.grid.width):
-                q_values = q_table[y][x]
-                if sum(q_values) > 0:
-                    intensity = int((max(q_values) / max_pheromone) * 255)
-                    color = f'#ff{255-intensity:02x}{255-intensity:02x}' # Heatmap (red)
-                    if view == "nest":
-                        color = f'#{255-intensity:02x}{255-intensity:02x}ff' # Heatmap (blue)
-
-                    x1, y1 = x * self.cell_size, y * self.cell_size
-                    x2, y2 = x1 + self.cell_size, y1 + self.cell_size
-                    self.canvas.create_rectangle(x1, y1, x2, y2, fill=color, outline="")
-
-    def _draw_grid(self):
-        """Draws the grid cells (walls, food, nest, etc.)."""
-        colors = {
-            CellType.WALL: "black",
-            CellType.FOOD: "green",
-            CellType.NEST: "blue",
-            CellType.DEADLY: "red",
-        }
-        for y in range(self.simulation.grid.height):
-            for x in range(self.simulation.grid.width):
-                cell_type = self.simulation.grid.grid[y][x]
-                if cell_type != CellType.EMPTY:
-                    x1 = x * self.cell_size
-                    y1 = y * self.cell_size
-                    x2 = x1 + self.cell_size
-                    y2 = y1 + self.cell_size
-                    self.canvas.create_rectangle(x1, y1, x2, y2, fill=colors[cell_type], outline="")
-
-    def _draw_ants(self, state=None):
-        """Draws the ants on the canvas."""
-        ant_colors = {
-            "Explorer": "orange",
-            "Fighter": "purple",
-            "Collector": "brown",
-        }
-
-        ants_to_draw = self.simulation.ants if state is None else state["ants"]
-
-        for ant_data in ants_to_draw:
-            x = ant_data['x'] if isinstance(ant_data, dict) else ant_data.x
-            y = ant_data['y'] if isinstance(ant_data, dict) else ant_data.y
-            ant_type_name = ant_data['type'] if isinstance(ant_data, dict) else type(ant_data).__name__
-
-            x1 = x * self.cell_size + self.cell_size / 4
-            y1 = y * self.cell_size + self.cell_size / 4
-            x2 = x1 + self.cell_size / 2
-            y2 = y1 + self.cell_size / 2
-            self.canvas.create_oval(x1, y1, x2, y2, fill=ant_colors[ant_type_name], outline="black")
+            return None
+
+        # Past ticks show the closest pheromone frame kept by the history,
+        # which only stores them every few hundred ticks.
+        pheromone_grid = self.simulation.pheromone_grid
+        if time_step < self.simulation.time:
+            pheromone_grid = self.simulation.historical_pheromones(time_step) or pheromone_grid
+        q_table = pheromone_grid.food_q_table if view == "food" else pheromone_grid.nest_q_table
+        return pheromone_grid.heatmap(q_table)
+
+    def _draw_replay(self, time_step):
+        """Draws tick `time_step` of the replayed log, with the terrain and
+        pheromones of its closest frame."""
+        replay, view = self.replay, self.pheromone_view_var.get()
+        ants = replay.state_at(time_step)["ants"] if replay.ticks else []
+        frame = replay.frame_at(time_step)
+        cells = bytes(frame[1]) if frame is not None else bytes(replay.width * replay.height)
+        heatmap = None
+        if view != "none" and frame is not None:
+            pheromone_grid = create_pheromone_grid(replay.width, replay.height, backend="numpy")
+            pheromone_grid = type(pheromone_grid).from_snapshot(replay.width, replay.height, frame[2])
+            q_table = pheromone_grid.food_q_table if view == "food" else pheromone_grid.nest_q_table
+            heatmap = pheromone_grid.heatmap(q_table)
+        self.renderer.draw(replay.width, replay.height, cells, ants, heatmap, view)
 
 if __name__ == "__main__":
-    app = App(DEFAULT_CONFIG)
+    parser = argparse.ArgumentParser(description="AI-Fants simulation with a Tkinter GUI.")
+    parser.add_argument("--replay", metavar="LOG", help="replay a trajectory log (engine.trajectory) instead of running")
+    args = parser.parse_args()
+    app = App(DEFAULT_CONFIG, replay=args.replay)
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,184 @@
+"""Map files, read straight into the flat cell array of a Grid.
+
+Two formats:
+
+    text     one row per line, 'W' wall, 'N' nest, 'F' food, 'D' deadly and
+             anything else empty, as in the config's "map". Read line by line
+             into one byte per cell, so the text is never held in memory.
+             Food quantities come from the config.
+    binary   a header (magic b"AIFMAP01", width and height as u32, the flat
+             index of the nest as i64 or -1, the number of food cells as
+             u64), then width * height cell codes (one byte per cell,
+             CellType values, row-major), then the food side table: one
+             (flat index, quantity) pair of int64 per food cell, by index.
+             The cells are memory-mapped copy-on-write, so loading costs
+             nothing until the pages are touched and the file is never
+             modified by the run.
+
+    python3 maps.py maze.txt maze.aifmap      # text -> binary
+    python3 maps.py maze.aifmap maze.txt      # binary -> text
+"""
+import mmap
+import struct
+import sys
+from array import array
+
+from models import Grid, CellType, FOOD_CODE
+
+MAGIC = b"AIFMAP01"
+HEADER = struct.Struct("<8sIIqQ")
+
+# Text character -> cell code, and back
+CHARACTERS = {'W': CellType.WALL, 'N': CellType.NEST, 'F': CellType.FOOD, 'D': CellType.DEADLY}
+TEXT_TO_CODE = bytes(CHARACTERS[chr(c)].value if chr(c) in CHARACTERS else 0 for c in range(256))
+CODE_TO_TEXT = bytes(ord({cell_type.value: char for char, cell_type in CHARACTERS.items()}.get(c, '.'))
+                     for c in range(256))
+
+
+def is_binary(path):
+    """True if `path` is a binary map file."""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _text_rows(f):
+    """The rows of a text map file opened in binary mode, without line endings or trailing blank lines."""
+    blank = 0
+    for line in f:
+        row = line.rstrip(b"\r\n")
+        if not row.strip():
+            blank += 1
+            continue
+        for _ in range(blank):
+            yield b""
+        blank = 0
+        yield row
+
+
+def map_size(path):
+    """(width, height) of a map file: read from the header of a binary map,
+    or the longest line and number of rows of a text map."""
+    with open(path, "rb") as f:
+        head = f.read(HEADER.size)
+        if head[:len(MAGIC)] == MAGIC:
+            _, width, height, _, _ = HEADER.unpack(head)
+            return width, height
+        f.seek(0)
+        width = height = 0
+        for row in _text_rows(f):
+            width = max(width, len(row))
+            height += 1
+        return width, height
+
+
+def read_text_cells(path, width=None, height=None):
+    """Reads a text map into a bytearray of cell codes, streaming its lines.
+
+    The grid is `width` x `height` (the size of the map by default); rows and
+    lines beyond it are dropped, missing cells are empty.
+    """
+    if width is None or height is None:
+        map_width, map_height = map_size(path)
+        width = map_width if width is None else width
+        height = map_height if height is None else height
+    cells = bytearray(width * height)
+    with open(path, "rb") as f:
+        for y, row in enumerate(_text_rows(f)):
+            if y >= height:
+                break
+            row = row[:width].translate(TEXT_TO_CODE)
+            cells[y * width:y * width + len(row)] = row
+    return width, height, cells
+
+
+def read_binary(path, use_mmap=True):
+    """Reads a binary map: returns (width, height, cells, nest, food) where
+    `nest` is the flat index of the nest (-1 if none) and `food` maps the flat
+    index of each food cell to its quantity.
+
+    With `use_mmap` the cells are a writable copy-on-write view of the file,
+    otherwise a bytearray read from it.
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError(f"{path!r} is not a binary map file")
+        magic, width, height, nest, food_count = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"{path!r} is not a binary map file")
+        size = width * height
+        if use_mmap and size:
+            # The mapping outlives the file object; the memoryview keeps it open
+            cells = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))[HEADER.size:HEADER.size + size]
+            f.seek(HEADER.size + size)
+        else:
+            cells = bytearray(f.read(size))
+        if len(cells) != size:
+            raise ValueError(f"binary map {path!r} is truncated")
+        table = array('q')
+        try:
+            table.fromfile(f, 2 * food_count)
+        except EOFError:
+            raise ValueError(f"binary map {path!r} is truncated") from None
+    if sys.byteorder != "little":
+        table.byteswap()
+    return width, height, cells, nest, dict(zip(table[::2], table[1::2]))
+
+
+def load_grid(path, food_quantities=None, use_mmap=True):
+    """Builds a Grid from a text or binary map file.
+
+    `food_quantities` maps (x, y) to a quantity; it completes the side table
+    of a binary map and overrides it where both are set.
+    """
+    if is_binary(path):
+        width, height, cells, nest, food = read_binary(path, use_mmap)
+        quantities = {(i % width, i // width): quantity for i, quantity in food.items()}
+        quantities.update(food_quantities or {})
+        return Grid.from_cells(width, height, cells, quantities, food_cells=sorted(food), nest_index=nest)
+    width, height, cells = read_text_cells(path)
+    return Grid.from_cells(width, height, cells, food_quantities)
+
+
+def save_binary(path, grid):
+    """Writes a grid as a binary map; the quantities are those left in its food sources."""
+    width = grid.width
+    food = {y * width + x: food_source.quantity for (x, y), food_source in grid.food_at.items()}
+    indices = sorted(i for i in food if grid.cells[i] == FOOD_CODE)
+    nest = -1 if grid.nest_position is None else grid.nest_position[1] * grid.width + grid.nest_position[0]
+
+    table = array('q')
+    for i in indices:
+        table.extend((i, food[i]))
+    if sys.byteorder != "little":
+        table.byteswap()
+    with open(path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, grid.width, grid.height, nest, len(indices)))
+        out.write(grid.cells)
+        table.tofile(out)
+
+
+def save_text(path, grid):
+    """Writes the cells of a grid as a text map, one line per row."""
+    width = grid.width
+    with open(path, "wb") as out:
+        for y in range(grid.height):
+            out.write(bytes(grid.cells[y * width:(y + 1) * width]).translate(CODE_TO_TEXT) + b"\n")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("usage: python3 maps.py SOURCE DESTINATION  (text <-> binary, by the source format)")
+        return 2
+    source, destination = argv
+    grid = load_grid(source)
+    if is_binary(source):
+        save_text(destination, grid)
+    else:
+        save_binary(destination, grid)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
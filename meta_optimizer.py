@@ -1,18 +1,31 @@
-import copy
+import argparse
 import time
 from simulation import Simulation
-from main import DEFAULT_CONFIG
+from sweep import Sweep, grid_search
+from config import DEFAULT_CONFIG
+from jobs import cached_run
 
-def run_simulation_headless(config):
+def run_simulation_headless(config, cache=None):
     """
     Runs the simulation without the GUI and returns the final time.
+    With a jobs.ResultCache, a seeded config that already ran is not run again.
     """
+    if cache is not None:
+        return cached_run(config, cache)["time"]
     simulation = Simulation(config)
     while not simulation.is_finished():
         simulation.run_step()
+        simulation.skip_idle_ticks()
     return simulation.time
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the default simulation, then a parameter sweep.")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--seeds", type=int, default=3, help="seeds per configuration")
+    parser.add_argument("--rungs", type=int, default=3, help="successive halving rungs (1 disables early stopping)")
+    parser.add_argument("--log", default=None, help="JSONL file to resume the sweep from")
+    args = parser.parse_args()
+
     print("--- Running a single simulation with default parameters ---")
 
     start_time = time.time()
@@ -25,30 +38,29 @@ if __name__ == "__main__":
     print(f"Simulation finished at time step: {final_time}")
     print(f"Real-world execution time: {end_time - start_time:.2f} seconds")
 
-    # --- Example of a meta-optimization loop ---
-    # This is a conceptual example. A real implementation would explore
-    # a wider range of parameters.
-    print("\n--- Example Meta-Optimization Loop ---")
-
-    best_config = None
-    best_time = float('inf')
-
-    # Example: Test different epsilon values
-    for epsilon in [0.1, 0.3, 0.5]:
-        print(f"Testing with epsilon = {epsilon}...")
+    # --- Meta-optimization ---
+    # Every combination runs on several seeds in a process pool; the worst
+    # ones are cut on a shorter max_time before the full-length rung.
+    print("\n--- Meta-Optimization Sweep ---")
 
-        # Create a copy of the default config to modify
-        test_config = copy.deepcopy(DEFAULT_CONFIG)
-        test_config["q_learning"]["epsilon"] = epsilon
+    space = {
+        "q_learning.epsilon": [0.05, 0.1, 0.3, 0.5],
+        "q_learning.learning_rate": [0.05, 0.1, 0.3],
+        "q_learning.discount_factor": [0.8, 0.9, 0.99],
+    }
+    sweep = Sweep(
+        DEFAULT_CONFIG, grid_search(space),
+        seeds=range(args.seeds), workers=args.workers, rungs=args.rungs, log_path=args.log
+    )
 
-        sim_time = run_simulation_headless(test_config)
-
-        print(f"  -> Finished in {sim_time} steps.")
+    start_time = time.time()
+    results = sweep.run()
+    end_time = time.time()
 
-        if sim_time < best_time:
-            best_time = sim_time
-            best_config = test_config
+    for result in results[:5]:
+        print(f"  score {result['score']:.0f} (+/- {result['score_stdev']:.0f}): {result['params']}")
 
     print("\n--- Meta-Optimization Finished ---")
-    print(f"Best time: {best_time} steps")
-    print(f"Best epsilon found: {best_config['q_learning']['epsilon']}")
\ No newline at end of file
+    print(f"Best mean time: {results[0]['time']:.0f} steps")
+    print(f"Best parameters found: {results[0]['params']}")
+    print(f"Sweep execution time: {end_time - start_time:.2f} seconds")
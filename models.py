@@ -1,4 +1,12 @@
+import copy
 import enum
+import re
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, PheromoneGrid falls back to nested lists
+    np = None
 
 class CellType(enum.Enum):
     """Enumeration for the different types of cells on the grid."""
@@ -23,6 +31,7 @@ class Ant:
         self.epsilon = epsilon
         self.current_load = 0
         self.mode = AntMode.SEARCHING_FOOD
+        self.id = None  # Position in the initial colony, set by the simulation
 
         # To be defined in subclasses
         self.max_load = 0
@@ -64,6 +73,11 @@ class Collector(Ant):
         self.vision_range = 0
         self.time_to_next_move = self.speed
 
+# Integer codes used by the packed representations (colony arrays, history):
+# the type code indexes ANT_TYPES, the mode code indexes ANT_MODES.
+ANT_TYPES = (Explorer, Fighter, Collector)
+ANT_MODES = (AntMode.SEARCHING_FOOD, AntMode.RETURNING_TO_NEST)
+
 class FoodSource:
     """Represents a source of food on the grid."""
     def __init__(self, x, y, quantity):
@@ -84,30 +98,795 @@ class Nest:
             Collector: 0,
         }
 
+# Integer cell codes, as stored in Grid.cells
+EMPTY_CODE, WALL_CODE, FOOD_CODE, NEST_CODE, DEADLY_CODE = (cell_type.value for cell_type in CellType)
+CELL_TYPES = {cell_type.value: cell_type for cell_type in CellType}
+# Byte translation table: 0 for walls, 1 for every other code
+OPEN_TABLE = bytes(0 if code == WALL_CODE else 1 for code in range(256))
+
+ACTIONS = [(0, -1), (1, 0), (0, 1), (-1, 0)]  # N, E, S, W
+# Valid action indices for each 4-bit mask (bit i set = action i allowed)
+VALID_ACTIONS_BY_MASK = tuple(tuple(i for i in range(4) if mask >> i & 1) for mask in range(16))
+
 class Grid:
     """Represents the 2D world grid."""
-    def __init__(self, width, height):
+    def __init__(self, width, height, cells=None):
         self.width = width
         self.height = height
-        self.grid = [[CellType.EMPTY for _ in range(width)] for _ in range(height)]
         self.food_sources = []
         self.nest_position = None
 
+        # Coordinate -> FoodSource index (the first source set on a cell wins)
+        # and running totals, so pickups and termination checks are O(1).
+        self.food_at = {}
+        self.total_food = 0
+        self.remaining_food = 0
+        # Sources emptied by take_food, in the order they ran out
+        self.exhausted_food = []
+
+        # The cells, one integer code per cell in row-major order (CellType
+        # values). Any writable buffer works, e.g. a memory-mapped map file.
+        self.cells = bytearray(width * height) if cells is None else cells
+        # Per-cell bitmask of the actions that stay on the grid and avoid walls.
+        # Walls only change through set_cell, which patches the neighbours.
+        self.valid_masks = compute_valid_masks(self.cells, width, height)
+        # Flat indices of the cells set since the last take_changes, None
+        # while nobody tracks them (see track_changes)
+        self.changed_cells = None
+
+    @classmethod
+    def from_cells(cls, width, height, cells, food_quantities=None, food_cells=None, nest_index=None):
+        """Builds a grid around a filled cell buffer, registering its food sources and nest.
+
+        `food_quantities` maps (x, y) to the quantity of a food cell (1000 by
+        default). `food_cells` (the sorted flat indices of the food cells) and
+        `nest_index` (the flat index of the nest, -1 if none) save scanning the
+        buffer when the caller already knows them.
+        """
+        grid = cls(width, height, cells)
+        food_quantities = food_quantities or {}
+        if food_cells is None:
+            food_cells = _find_all(cells, FOOD_CODE)
+        for i in food_cells:
+            position = (i % width, i // width)
+            food_source = FoodSource(position[0], position[1], food_quantities.get(position, 1000))
+            grid.food_sources.append(food_source)
+            grid.food_at.setdefault(position, food_source)
+            grid.total_food += food_source.quantity
+        grid.remaining_food = grid.total_food
+        # Like drawing the map cell by cell: the last nest cell wins
+        nest = _find_last(cells, NEST_CODE) if nest_index is None else nest_index
+        if nest >= 0:
+            grid.nest_position = (nest % width, nest // width)
+        return grid
+
+    @property
+    def grid(self):
+        """The cells as rows of CellType over the cell codes.
+
+        grid.grid[y][x] reads one cell code; grid.grid[y][x] = cell_type
+        writes one, keeping the valid moves and the food index in sync, but
+        registers no food source or nest (use set_cell for those).
+        """
+        return _CellRows(self)
+
     def set_cell(self, x, y, cell_type, quantity=0):
         """Sets the type of a cell and adds food or nest if applicable."""
         if 0 <= x < self.width and 0 <= y < self.height:
-            self.grid[y][x] = cell_type
+            self._write_cell(x, y, cell_type)
             if cell_type == CellType.FOOD:
-                self.food_sources.append(FoodSource(x, y, quantity))
+                food_source = FoodSource(x, y, quantity)
+                self.food_sources.append(food_source)
+                self.food_at.setdefault((x, y), food_source)
+                self.total_food += quantity
+                self.remaining_food += quantity
             elif cell_type == CellType.NEST:
                 self.nest_position = (x, y)
 
+    def _write_cell(self, x, y, cell_type):
+        """Writes the code of a cell and patches the indexes that depend on it."""
+        i = y * self.width + x
+        was_wall = self.cells[i] == WALL_CODE
+        if self.cells[i] == FOOD_CODE and cell_type != CellType.FOOD:
+            self.food_at.pop((x, y), None)
+        self.cells[i] = cell_type.value
+        if self.changed_cells is not None:
+            self.changed_cells.add(i)
+        if was_wall != (cell_type == CellType.WALL):
+            self._update_valid_masks_around(x, y)
+
+    def track_changes(self):
+        """Starts recording the cells set_cell changes, for a viewer that only redraws those."""
+        if self.changed_cells is None:
+            self.changed_cells = set()
+
+    def take_changes(self):
+        """Returns the flat indices of the cells changed since the last call (see track_changes)."""
+        changed, self.changed_cells = self.changed_cells, set()
+        return changed
+
+    def take_food(self, food_source, amount):
+        """Removes up to `amount` food from a source and returns the quantity taken."""
+        taken = min(amount, food_source.quantity)
+        if taken <= 0:
+            return 0
+        food_source.quantity -= taken
+        self.remaining_food -= taken
+        if food_source.quantity <= 0:
+            self.exhausted_food.append(food_source)
+        return taken
+
+    def clear_exhausted_food(self):
+        """Turns the cells of the exhausted food sources back into empty cells."""
+        for food_source in self.exhausted_food:
+            if self.food_at.get((food_source.x, food_source.y)) is food_source:
+                self.set_cell(food_source.x, food_source.y, CellType.EMPTY)
+        self.exhausted_food.clear()
+
+    def cell_code(self, x, y):
+        """Returns the integer code of a cell (see CellType values)."""
+        return self.cells[y * self.width + x]
+
+    def valid_actions(self, x, y):
+        """Returns the indices of the actions allowed from a cell."""
+        return VALID_ACTIONS_BY_MASK[self.valid_masks[y * self.width + x]]
+
+    def _compute_valid_mask(self, x, y):
+        """Computes the valid-action bitmask of a cell from scratch."""
+        mask = 0
+        for i, (dx, dy) in enumerate(ACTIONS):
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < self.width and 0 <= ny < self.height and \
+               self.cells[ny * self.width + nx] != WALL_CODE:
+                mask |= 1 << i
+        return mask
+
+    def _update_valid_masks_around(self, x, y):
+        """Refreshes the masks of the neighbours of a cell that became or stopped being a wall."""
+        for dx, dy in ACTIONS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < self.width and 0 <= ny < self.height:
+                self.valid_masks[ny * self.width + nx] = self._compute_valid_mask(nx, ny)
+
+    def wall_mask(self):
+        """Returns a height x width table of booleans, True on wall cells."""
+        width = self.width
+        return [[code == WALL_CODE for code in self.cells[y * width:(y + 1) * width]] for y in range(self.height)]
+
+    def copy(self):
+        """Returns an independent copy of the grid, its food sources and totals."""
+        clone = copy.copy(self)
+        clone.cells = bytearray(self.cells)
+        clone.valid_masks = bytearray(self.valid_masks)
+        clone.changed_cells = None
+        sources = {id(fs): copy.copy(fs) for fs in self.food_sources}
+        clone.food_sources = [sources[id(fs)] for fs in self.food_sources]
+        clone.food_at = {position: sources[id(fs)] for position, fs in self.food_at.items()}
+        clone.exhausted_food = [sources[id(fs)] for fs in self.exhausted_food]
+        return clone
+
+
+class _CellRows:
+    """Rows of CellType over the cell codes of a grid (see Grid.grid)."""
+    def __init__(self, grid):
+        self._grid = grid
+
+    def __len__(self):
+        return self._grid.height
+
+    def __getitem__(self, y):
+        if not 0 <= y < self._grid.height:
+            raise IndexError(y)
+        return _CellRow(self._grid, y)
+
+    def __setitem__(self, y, row):
+        raise TypeError("grid.grid rows cannot be replaced; write cells with grid.grid[y][x] = cell_type")
+
+    def __iter__(self):
+        return (_CellRow(self._grid, y) for y in range(self._grid.height))
+
+
+class _CellRow:
+    """One row of _CellRows: reads or writes a single cell code per access."""
+    def __init__(self, grid, y):
+        self._grid = grid
+        self._start = y * grid.width
+
+    def __len__(self):
+        return self._grid.width
+
+    def __getitem__(self, x):
+        if not 0 <= x < self._grid.width:
+            raise IndexError(x)
+        return CELL_TYPES[self._grid.cells[self._start + x]]
+
+    def __setitem__(self, x, cell_type):
+        if not 0 <= x < self._grid.width:
+            raise IndexError(x)
+        self._grid._write_cell(x, self._start // self._grid.width, cell_type)
+
+    def __iter__(self):
+        return (CELL_TYPES[code] for code in self._grid.cells[self._start:self._start + self._grid.width])
+
+
+def compute_valid_masks(cells, width, height):
+    """Valid-action bitmasks of a flat cell buffer (see Grid.valid_masks).
+
+    Each row is handled as one big integer holding a 0/1 byte per cell (1 if
+    not a wall), so the neighbours of a whole row are combined with a few
+    shifts instead of a loop over the cells. Reads the buffer row by row.
+    """
+    masks = bytearray(width * height)
+    if not width or not height:
+        return masks
+    row_bits = (1 << 8 * width) - 1
+
+    def open_row(y):
+        return int.from_bytes(bytes(cells[y * width:(y + 1) * width]).translate(OPEN_TABLE), "little")
+
+    above, row = 0, open_row(0)
+    for y in range(height):
+        below = open_row(y + 1) if y + 1 < height else 0
+        # Bits in ACTIONS order: N, E, S, W
+        mask = above | (row >> 8) << 1 | below << 2 | ((row << 8) & row_bits) << 3
+        masks[y * width:(y + 1) * width] = mask.to_bytes(width, "little")
+        above, row = row, below
+    return masks
+
+
+def _find_all(cells, code):
+    """Flat indices of the cells holding `code`, in order.
+
+    A memory-mapped view has no find(): it is searched in place with a
+    regular expression rather than copied.
+    """
+    needle = bytes([code])
+    if not hasattr(cells, "find"):
+        return [match.start() for match in re.finditer(re.escape(needle), cells)]
+    found = []
+    i = cells.find(needle)
+    while i >= 0:
+        found.append(i)
+        i = cells.find(needle, i + 1)
+    return found
+
+
+def _find_last(cells, code):
+    """Flat index of the last cell holding `code`, -1 if there is none."""
+    needle = bytes([code])
+    if hasattr(cells, "rfind"):
+        return cells.rfind(needle)
+    last = -1
+    for match in re.finditer(re.escape(needle), cells):
+        last = match.start()
+    return last
+
+
 class PheromoneGrid:
     """Represents the Q-tables for the simulation."""
-    def __init__(self, width, height):
+    def __init__(self, width, height, dissipation_rate=0.0, lazy=False):
         self.width = width
         self.height = height
         # Q-table for finding food
         self.food_q_table = [[[0.0, 0.0, 0.0, 0.0] for _ in range(width)] for _ in range(height)] # N, E, S, W
         # Q-table for returning to the nest
-        self.nest_q_table = [[[0.0, 0.0, 0.0, 0.0] for _ in range(width)] for _ in range(height)] # N, E, S, W
\ No newline at end of file
+        self.nest_q_table = [[[0.0, 0.0, 0.0, 0.0] for _ in range(width)] for _ in range(height)] # N, E, S, W
+
+        self.decay_factor = 1 - dissipation_rate
+        # Lazy mode: instead of sweeping the whole grid every step, each cell
+        # remembers how many dissipation steps it has absorbed and catches up
+        # with (1 - rate)^dt the next time it is read or written.
+        self.lazy = lazy
+        self.decay_steps = 0
+        self.last_decayed = [[0] * width for _ in range(height)] if lazy else None
+        # Flat indices of the cells whose Q-values were written since the
+        # last take_changes, None while nobody tracks them (see track_changes)
+        self.changed_cells = None
+        self.all_changed = False
+
+    def dissipate(self, steps=1):
+        """Applies `steps` dissipation steps to both Q-tables."""
+        if self.lazy:
+            self.decay_steps += steps
+            return
+        factor = self.decay_factor ** steps
+        for food_row, nest_row in zip(self.food_q_table, self.nest_q_table):
+            for food_q, nest_q in zip(food_row, nest_row):
+                for i in range(4):
+                    food_q[i] *= factor
+                    nest_q[i] *= factor
+
+    def sync_cell(self, x, y):
+        """Brings a lazily decayed cell up to the current dissipation step."""
+        if not self.lazy:
+            return
+        stamps = self.last_decayed[y]
+        elapsed = self.decay_steps - stamps[x]
+        if elapsed:
+            factor = self.decay_factor ** elapsed
+            food_q = self.food_q_table[y][x]
+            nest_q = self.nest_q_table[y][x]
+            for i in range(4):
+                food_q[i] *= factor
+                nest_q[i] *= factor
+            stamps[x] = self.decay_steps
+
+    def sync_all(self):
+        """Brings every cell up to date (e.g. before copying the raw Q-tables)."""
+        if not self.lazy:
+            return
+        for y in range(self.height):
+            for x in range(self.width):
+                self.sync_cell(x, y)
+
+    def decay_state(self):
+        """(decay_steps, next_sweep) of the dissipation clock, e.g. for a
+        checkpoint; next_sweep is None for the grids without eviction sweeps."""
+        return self.decay_steps, None
+
+    def restore_decay_state(self, decay_steps, next_sweep=None):
+        """Sets the dissipation clock saved by decay_state (the Q-values and
+        stamps are restored separately)."""
+        self.decay_steps = decay_steps
+
+    def track_changes(self):
+        """Starts recording the cells whose Q-values are written (decay aside),
+        for a viewer that only redraws those."""
+        if self.changed_cells is None:
+            self.changed_cells = set()
+
+    def mark_all_changed(self):
+        """Tells the viewer that any cell may have changed, e.g. after a non-uniform decay."""
+        if self.changed_cells is not None:
+            self.all_changed = True
+
+    def take_changes(self):
+        """Returns the flat indices of the cells written since the last call,
+        or None if any of them may have changed (see track_changes)."""
+        changed = None if self.all_changed else self.changed_cells
+        self.changed_cells, self.all_changed = set(), False
+        return changed
+
+    def peek_cell_max(self, q_table, indices):
+        """(highest Q-value, drawn) of the cells at flat `indices`, decayed up to
+        date without writing them back; as in heatmap(), a cell is drawn when
+        its Q-values sum to a positive value."""
+        result = []
+        for i in indices:
+            y, x = divmod(i, self.width)
+            q_values = q_table[y][x]
+            factor = self.decay_factor ** (self.decay_steps - int(self.last_decayed[y][x])) if self.lazy else 1.0
+            result.append((float(max(q_values)) * factor, float(sum(q_values)) > 0))
+        return result
+
+    def copy(self):
+        """Returns an independent copy of the Q-tables (e.g. for snapshots)."""
+        clone = copy.copy(self)
+        clone.food_q_table = [[q[:] for q in row] for row in self.food_q_table]
+        clone.nest_q_table = [[q[:] for q in row] for row in self.nest_q_table]
+        if self.lazy:
+            clone.last_decayed = [row[:] for row in self.last_decayed]
+        clone.changed_cells = None
+        return clone
+
+    def snapshot(self):
+        """Returns both Q-tables, decayed up to date, as a compact (food, nest) pair of flat arrays.
+
+        Unlike sync_all this leaves the grid untouched, so taking snapshots
+        does not change the arithmetic of the running simulation.
+        """
+        if not self.lazy:
+            return (
+                array('d', [v for row in self.food_q_table for q in row for v in q]),
+                array('d', [v for row in self.nest_q_table for q in row for v in q]),
+            )
+        factors = [[self.decay_factor ** (self.decay_steps - stamp) for stamp in row] for row in self.last_decayed]
+        return tuple(
+            array('d', [v * f for row, row_factors in zip(table, factors) for q, f in zip(row, row_factors) for v in q])
+            for table in (self.food_q_table, self.nest_q_table)
+        )
+
+    @classmethod
+    def from_snapshot(cls, width, height, snapshot, dissipation_rate=0.0):
+        """Builds a grid holding the Q-values of a snapshot."""
+        pheromone_grid = cls(width, height, dissipation_rate)
+        food, nest = snapshot
+        for y in range(height):
+            for x in range(width):
+                i = (y * width + x) * 4
+                pheromone_grid.food_q_table[y][x] = [float(v) for v in food[i:i + 4]]
+                pheromone_grid.nest_q_table[y][x] = [float(v) for v in nest[i:i + 4]]
+        return pheromone_grid
+
+    def _decayed(self, q_table):
+        """The rows of a Q-table decayed up to date, without writing them back."""
+        if not self.lazy:
+            return q_table
+        return [
+            [[v * factor for v in q_values] for q_values, factor in
+             zip(row, [self.decay_factor ** (self.decay_steps - stamp) for stamp in stamps])]
+            for row, stamps in zip(q_table, self.last_decayed)
+        ]
+
+    def cell_max(self, q_table, wall_mask=None):
+        """Returns the highest Q-value of each cell, 0.0 on masked cells.
+
+        Like the other views below, reads lazily decayed cells without
+        syncing them, so drawing does not change the running simulation.
+        """
+        q_table = self._decayed(q_table)
+        return [
+            [0.0 if wall_mask and wall_mask[y][x] else max(q_table[y][x]) for x in range(self.width)]
+            for y in range(self.height)
+        ]
+
+    def cell_argmax(self, q_table, wall_mask=None):
+        """Returns the index of the best action of each cell, -1 on masked cells."""
+        q_table = self._decayed(q_table)
+        result = []
+        for y in range(self.height):
+            row = []
+            for x in range(self.width):
+                if wall_mask and wall_mask[y][x]:
+                    row.append(-1)
+                else:
+                    q_values = q_table[y][x]
+                    row.append(q_values.index(max(q_values)))
+            result.append(row)
+        return result
+
+    def heatmap(self, q_table, wall_mask=None):
+        """Returns per-cell intensities in [0, 1] relative to the strongest cell.
+
+        Cells whose Q-values do not sum to a positive value are reported as 0.
+        """
+        q_table = self._decayed(q_table)
+        cell_max = [[max(q_values) for q_values in row] for row in q_table]
+        peak = max([0.001] + [max(row) for row in cell_max])
+        return [
+            [
+                cell_max[y][x] / peak
+                if sum(q_table[y][x]) > 0 and not (wall_mask and wall_mask[y][x]) else 0.0
+                for x in range(self.width)
+            ]
+            for y in range(self.height)
+        ]
+
+
+class ArrayPheromoneGrid(PheromoneGrid):
+    """PheromoneGrid storing each Q-table as a contiguous (H, W, 4) NumPy array.
+
+    ``q_table[y][x][a]`` keeps working for existing callers, while bulk
+    operations (dissipation, heatmaps, copies) run vectorized.
+    """
+    def __init__(self, width, height, dissipation_rate=0.0, lazy=False):
+        self.width = width
+        self.height = height
+        self.food_q_table = np.zeros((height, width, 4)) # N, E, S, W
+        self.nest_q_table = np.zeros((height, width, 4)) # N, E, S, W
+
+        self.decay_factor = 1 - dissipation_rate
+        self.lazy = lazy
+        self.decay_steps = 0
+        self.last_decayed = np.zeros((height, width), dtype=np.int64) if lazy else None
+        self.changed_cells = None
+        self.all_changed = False
+
+    def dissipate(self, steps=1):
+        """Applies `steps` dissipation steps to both Q-tables."""
+        if self.lazy:
+            self.decay_steps += steps
+            return
+        factor = self.decay_factor ** steps
+        self.food_q_table *= factor
+        self.nest_q_table *= factor
+
+    def sync_cell(self, x, y):
+        """Brings a lazily decayed cell up to the current dissipation step."""
+        if not self.lazy:
+            return
+        elapsed = self.decay_steps - int(self.last_decayed[y, x])
+        if elapsed:
+            factor = self.decay_factor ** elapsed
+            self.food_q_table[y, x] *= factor
+            self.nest_q_table[y, x] *= factor
+            self.last_decayed[y, x] = self.decay_steps
+
+    def sync_cells(self, xs, ys):
+        """Vectorized sync_cell for arrays of coordinates (duplicates allowed)."""
+        if not self.lazy:
+            return
+        factors = self.decay_factor ** (self.decay_steps - self.last_decayed[ys, xs])
+        self.food_q_table[ys, xs] *= factors[:, None]
+        self.nest_q_table[ys, xs] *= factors[:, None]
+        self.last_decayed[ys, xs] = self.decay_steps
+
+    def peek_cells(self, q_table, xs, ys):
+        """Q-values of the given cells, decayed up to date without writing them back."""
+        if not self.lazy:
+            return q_table[ys, xs]
+        return q_table[ys, xs] * (self.decay_factor ** (self.decay_steps - self.last_decayed[ys, xs]))[:, None]
+
+    def sync_all(self):
+        """Brings every cell up to date (e.g. before copying the raw Q-tables)."""
+        if not self.lazy:
+            return
+        factors = self.decay_factor ** (self.decay_steps - self.last_decayed)
+        self.food_q_table *= factors[..., None]
+        self.nest_q_table *= factors[..., None]
+        self.last_decayed[...] = self.decay_steps
+
+    def copy(self):
+        """Returns an independent copy of the Q-tables (e.g. for snapshots)."""
+        clone = copy.copy(self)
+        clone.food_q_table = self.food_q_table.copy()
+        clone.nest_q_table = self.nest_q_table.copy()
+        if self.lazy:
+            clone.last_decayed = self.last_decayed.copy()
+        clone.changed_cells = None
+        return clone
+
+    def snapshot(self):
+        """Returns both Q-tables, decayed up to date, as a compact (food, nest) pair of arrays."""
+        if not self.lazy:
+            return (self.food_q_table.copy(), self.nest_q_table.copy())
+        factors = (self.decay_factor ** (self.decay_steps - self.last_decayed))[..., None]
+        return (self.food_q_table * factors, self.nest_q_table * factors)
+
+    @classmethod
+    def from_snapshot(cls, width, height, snapshot, dissipation_rate=0.0):
+        """Builds a grid holding the Q-values of a snapshot."""
+        pheromone_grid = cls(width, height, dissipation_rate)
+        food, nest = snapshot
+        pheromone_grid.food_q_table[...] = np.asarray(food).reshape(height, width, 4)
+        pheromone_grid.nest_q_table[...] = np.asarray(nest).reshape(height, width, 4)
+        return pheromone_grid
+
+    def _decayed(self, q_table):
+        """A Q-table decayed up to date, without writing it back."""
+        if not self.lazy:
+            return q_table
+        return q_table * (self.decay_factor ** (self.decay_steps - self.last_decayed))[..., None]
+
+    def cell_max(self, q_table, wall_mask=None):
+        """Returns the highest Q-value of each cell, 0.0 on masked cells."""
+        cell_max = self._decayed(q_table).max(axis=2)
+        if wall_mask is not None:
+            cell_max[np.asarray(wall_mask, dtype=bool)] = 0.0
+        return cell_max
+
+    def cell_argmax(self, q_table, wall_mask=None):
+        """Returns the index of the best action of each cell, -1 on masked cells."""
+        best = self._decayed(q_table).argmax(axis=2)
+        if wall_mask is not None:
+            best[np.asarray(wall_mask, dtype=bool)] = -1
+        return best
+
+    def heatmap(self, q_table, wall_mask=None):
+        """Returns per-cell intensities in [0, 1] relative to the strongest cell.
+
+        Cells whose Q-values do not sum to a positive value are reported as 0.
+        """
+        q_table = self._decayed(q_table)
+        cell_max = q_table.max(axis=2)
+        peak = max(0.001, float(cell_max.max()) if cell_max.size else 0.0)
+        drawn = q_table.sum(axis=2) > 0
+        if wall_mask is not None:
+            drawn &= ~np.asarray(wall_mask, dtype=bool)
+        return np.where(drawn, cell_max / peak, 0.0)
+
+
+class _SparseRow(dict):
+    """Row of a sparse Q-table: x -> [N, E, S, W], created as zeros on first access."""
+    __slots__ = ()
+
+    def __missing__(self, x):
+        q_values = self[x] = [0.0, 0.0, 0.0, 0.0]
+        return q_values
+
+
+class SparsePheromoneGrid(PheromoneGrid):
+    """PheromoneGrid storing only the cells that hold Q-values.
+
+    Each Q-table is a list of rows and each row a dict x -> [N, E, S, W], so
+    ``q_table[y][x][a]`` keeps working; a missing cell reads as zeros and is
+    created when accessed. Memory and dissipation then scale with the cells
+    the ants visited rather than with the area of the map.
+
+    Cells whose values all decay below `threshold` (in absolute value) are
+    evicted, i.e. reset to zero: on every step with eager dissipation, and
+    every `sweep_interval` steps in lazy mode.
+    """
+    def __init__(self, width, height, dissipation_rate=0.0, lazy=False, threshold=1e-6, sweep_interval=100):
+        self.width = width
+        self.height = height
+        self.food_q_table = [_SparseRow() for _ in range(height)]
+        self.nest_q_table = [_SparseRow() for _ in range(height)]
+
+        self.decay_factor = 1 - dissipation_rate
+        self.threshold = threshold
+        self.sweep_interval = sweep_interval
+        # Lazy mode: stamps only exist for the cells that were accessed
+        self.lazy = lazy
+        self.decay_steps = 0
+        self.last_decayed = [{} for _ in range(height)] if lazy else None
+        self._next_sweep = sweep_interval
+        self.changed_cells = None
+        self.all_changed = False
+
+    def active_cells(self, q_table):
+        """Yields (x, y, q_values) for every stored cell of a Q-table."""
+        for y, row in enumerate(q_table):
+            for x, q_values in row.items():
+                yield x, y, q_values
+
+    def dissipate(self, steps=1):
+        """Applies `steps` dissipation steps to the stored cells and evicts the faded ones."""
+        if self.lazy:
+            self.decay_steps += steps
+            if self.threshold > 0 and self.decay_steps >= self._next_sweep:
+                self.sync_all()
+                self._evict()
+                self._next_sweep = self.decay_steps + self.sweep_interval
+            return
+        factor = self.decay_factor ** steps
+        for table in (self.food_q_table, self.nest_q_table):
+            for row in table:
+                for q_values in row.values():
+                    for i in range(4):
+                        q_values[i] *= factor
+        self._evict()
+
+    def decay_state(self):
+        return self.decay_steps, self._next_sweep
+
+    def restore_decay_state(self, decay_steps, next_sweep=None):
+        self.decay_steps = decay_steps
+        self._next_sweep = decay_steps + self.sweep_interval if next_sweep is None else next_sweep
+
+    def _evict(self):
+        """Drops the cells whose Q-values are all below the threshold."""
+        threshold = self.threshold
+        for y in range(self.height):
+            food_row, nest_row = self.food_q_table[y], self.nest_q_table[y]
+            for row in (food_row, nest_row):
+                faded = [x for x, q_values in row.items() if max(map(abs, q_values)) < threshold]
+                for x in faded:
+                    del row[x]
+                if faded and self.changed_cells is not None:
+                    self.changed_cells.update(y * self.width + x for x in faded)
+            if self.lazy:
+                stamps = self.last_decayed[y]
+                for x in [x for x in stamps if x not in food_row and x not in nest_row]:
+                    del stamps[x]
+
+    def sync_cell(self, x, y):
+        """Brings a lazily decayed cell up to the current dissipation step."""
+        if not self.lazy:
+            return
+        stamps = self.last_decayed[y]
+        last = stamps.get(x)
+        if last == self.decay_steps:
+            return
+        stamps[x] = self.decay_steps
+        if last is None:
+            return  # not stored yet, so all zeros
+        factor = self.decay_factor ** (self.decay_steps - last)
+        for q_values in (self.food_q_table[y].get(x), self.nest_q_table[y].get(x)):
+            if q_values is not None:
+                for i in range(4):
+                    q_values[i] *= factor
+
+    def sync_all(self):
+        """Brings every stored cell up to date."""
+        if not self.lazy:
+            return
+        for y, stamps in enumerate(self.last_decayed):
+            for x in list(stamps):
+                self.sync_cell(x, y)
+
+    def peek_cell_max(self, q_table, indices):
+        """(highest Q-value, drawn) of the cells at flat `indices`, without creating the missing ones."""
+        result = []
+        for i in indices:
+            y, x = divmod(i, self.width)
+            q_values = q_table[y].get(x)
+            if q_values is None:
+                result.append((0.0, False))
+                continue
+            factor = self.decay_factor ** (self.decay_steps - self.last_decayed[y].get(x, self.decay_steps)) if self.lazy else 1.0
+            result.append((max(q_values) * factor, sum(q_values) > 0))
+        return result
+
+    def copy(self):
+        """Returns an independent copy of the Q-tables (e.g. for snapshots)."""
+        clone = copy.copy(self)
+        clone.food_q_table = [_SparseRow({x: q[:] for x, q in row.items()}) for row in self.food_q_table]
+        clone.nest_q_table = [_SparseRow({x: q[:] for x, q in row.items()}) for row in self.nest_q_table]
+        if self.lazy:
+            clone.last_decayed = [dict(stamps) for stamps in self.last_decayed]
+        clone.changed_cells = None
+        return clone
+
+    def snapshot(self):
+        """Returns the stored cells as (food_keys, food_values, nest_keys, nest_values) flat arrays.
+
+        Keys are flat cell indices (y * width + x), with 4 values per key.
+        """
+        snapshot = []
+        for table in (self.food_q_table, self.nest_q_table):
+            keys, values = array('q'), array('d')
+            for x, y, q_values in self.active_cells(table):
+                keys.append(y * self.width + x)
+                if self.lazy:
+                    factor = self.decay_factor ** (self.decay_steps - self.last_decayed[y].get(x, self.decay_steps))
+                    values.extend([v * factor for v in q_values])
+                else:
+                    values.extend(q_values)
+            snapshot += [keys, values]
+        return tuple(snapshot)
+
+    @classmethod
+    def from_snapshot(cls, width, height, snapshot, dissipation_rate=0.0):
+        """Builds a grid holding the Q-values of a snapshot."""
+        pheromone_grid = cls(width, height, dissipation_rate)
+        food_keys, food_values, nest_keys, nest_values = snapshot
+        for table, keys, values in ((pheromone_grid.food_q_table, food_keys, food_values),
+                                    (pheromone_grid.nest_q_table, nest_keys, nest_values)):
+            for i, key in enumerate(keys):
+                table[key // width][key % width] = [float(v) for v in values[i * 4:i * 4 + 4]]
+        return pheromone_grid
+
+    def _decayed_cells(self, q_table):
+        """active_cells with the Q-values decayed up to date, without writing them back."""
+        if not self.lazy:
+            yield from self.active_cells(q_table)
+            return
+        for x, y, q_values in self.active_cells(q_table):
+            factor = self.decay_factor ** (self.decay_steps - self.last_decayed[y].get(x, self.decay_steps))
+            yield x, y, [v * factor for v in q_values]
+
+    def cell_max(self, q_table, wall_mask=None):
+        """Returns the highest Q-value of each cell, 0.0 on masked and empty cells."""
+        result = [[0.0] * self.width for _ in range(self.height)]
+        for x, y, q_values in self._decayed_cells(q_table):
+            if not (wall_mask and wall_mask[y][x]):
+                result[y][x] = max(q_values)
+        return result
+
+    def cell_argmax(self, q_table, wall_mask=None):
+        """Returns the index of the best action of each cell, -1 on masked cells."""
+        result = [[-1 if wall_mask and wall_mask[y][x] else 0 for x in range(self.width)] for y in range(self.height)]
+        for x, y, q_values in self._decayed_cells(q_table):
+            if result[y][x] != -1:
+                result[y][x] = q_values.index(max(q_values))
+        return result
+
+    def heatmap(self, q_table, wall_mask=None):
+        """Returns per-cell intensities in [0, 1] relative to the strongest cell.
+
+        Cells whose Q-values do not sum to a positive value are reported as 0.
+        """
+        cells = list(self._decayed_cells(q_table))
+        peak = max([0.001] + [max(q_values) for _, _, q_values in cells])
+        result = [[0.0] * self.width for _ in range(self.height)]
+        for x, y, q_values in cells:
+            if sum(q_values) > 0 and not (wall_mask and wall_mask[y][x]):
+                result[y][x] = max(q_values) / peak
+        return result
+
+
+def create_pheromone_grid(width, height, dissipation_rate=0.0, lazy=False, backend="python", threshold=1e-6):
+    """Builds the PheromoneGrid for the requested backend ("python", "numpy" or "sparse").
+
+    The "numpy" backend falls back to the pure-Python grid when NumPy is not
+    installed. `threshold` is the eviction threshold of the "sparse" backend.
+    """
+    if backend == "numpy":
+        if np is not None:
+            return ArrayPheromoneGrid(width, height, dissipation_rate, lazy)
+    elif backend == "sparse":
+        return SparsePheromoneGrid(width, height, dissipation_rate, lazy, threshold)
+    elif backend != "python":
+        raise ValueError(f"Unknown pheromone backend: {backend!r}")
+    return PheromoneGrid(width, height, dissipation_rate, lazy)
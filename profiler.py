@@ -0,0 +1,71 @@
+import time
+
+# Phases of a tick. The first three are timed per ant action (Ant objects),
+# "colony" is the whole vectorized step of the batched colony.
+PHASES = ("select", "update", "interact", "colony", "remove", "clear_food", "dissipate", "history")
+
+COUNTERS = (
+    "ticks", "skipped_ticks", "actions", "explorations", "exploitations",
+    "pickups", "drops", "deaths", "q_cells",
+)
+
+
+class Profiler:
+    """Per-phase timers and event counters for a Simulation.
+
+    Attach one with ``Simulation(config, profiler=Profiler())`` or
+    ``engine.profile = True``. While no profiler is attached the simulation
+    runs its uninstrumented code paths. `q_cells` counts the Q-table cells
+    read or written by action selection and updates.
+
+    Callbacks registered with `subscribe` are called as
+    ``callback(time, profiler)`` every `hook_interval` ticks, e.g. to export
+    the counters while the simulation runs.
+    """
+
+    def __init__(self, hook_interval=1):
+        self.clock = time.perf_counter
+        self.hook_interval = hook_interval
+        self.hooks = []
+        self.reset()
+
+    def reset(self):
+        """Zeroes every timer and counter."""
+        self.times = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self._next_hook = self.hook_interval
+
+    def subscribe(self, callback):
+        """Registers a callback(time, profiler); returns it so it can be used as a decorator."""
+        self.hooks.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self.hooks.remove(callback)
+
+    def tick(self, now, ticks=1):
+        """Counts `ticks` elapsed ticks and calls the hooks when their interval is reached."""
+        self.counts["ticks"] += ticks
+        if self.hooks and self.counts["ticks"] >= self._next_hook:
+            self._next_hook = self.counts["ticks"] + self.hook_interval
+            for callback in self.hooks:
+                callback(now, self)
+
+    def snapshot(self):
+        """Returns a copy of the timers and counters."""
+        return {"times": dict(self.times), "counts": dict(self.counts)}
+
+    def summary(self):
+        """One line of the main counters, e.g. for a status bar."""
+        counts = self.counts
+        decisions = counts["explorations"] + counts["exploitations"]
+        explored = counts["explorations"] / decisions if decisions else 0.0
+        return (f"actions {counts['actions']}  explore {explored:.0%}  pickups {counts['pickups']}  "
+                f"drops {counts['drops']}  deaths {counts['deaths']}  Q cells {counts['q_cells']}")
+
+    def report(self):
+        """Multi-line report of the time spent in each phase and of the counters."""
+        total = sum(self.times.values()) or 1.0
+        lines = [f"{phase:<12} {seconds:10.4f} s  {seconds / total:6.1%}" for phase, seconds in self.times.items() if seconds]
+        lines += [f"{name:<12} {value:10d}" for name, value in self.counts.items()]
+        return "\n".join(lines)
@@ -0,0 +1,512 @@
+import math
+
+from models import CellType
+
+try:
+    import numpy as np
+except ImportError:  # heatmaps are then nested lists
+    np = None
+
+CELL_COLORS = {
+    CellType.WALL.value: "black",
+    CellType.FOOD.value: "green",
+    CellType.NEST.value: "blue",
+    CellType.DEADLY.value: "red",
+}
+
+ANT_COLORS = {
+    "Explorer": "orange",
+    "Fighter": "purple",
+    "Collector": "brown",
+}
+
+# When blocks of cells are drawn as one, the block shows its most important
+# cell: nest, then food, deadly, wall and empty
+TERRAIN_PRIORITY = {
+    CellType.EMPTY.value: 0,
+    CellType.WALL.value: 1,
+    CellType.DEADLY.value: 2,
+    CellType.FOOD.value: 3,
+    CellType.NEST.value: 4,
+}
+PRIORITY_TABLE = bytes(TERRAIN_PRIORITY.get(code, 0) for code in range(256))
+PRIORITY_COLORS = {priority: CELL_COLORS.get(code) for code, priority in TERRAIN_PRIORITY.items()}
+
+
+def heat_color(bucket, view):
+    """Colour of a heatmap bucket (1..64) for the "food" (red) or "nest" (blue) view."""
+    fade = 255 - ((bucket - 1) << 2)
+    if view == "nest":
+        return f'#{fade:02x}{fade:02x}ff'
+    return f'#ff{fade:02x}{fade:02x}'
+
+
+def heat_buckets(heatmap):
+    """Quantizes a heatmap to flat buckets (0 = not drawn, 1..64), a NumPy array or bytes."""
+    if hasattr(heatmap, "ravel"):
+        ratios = heatmap.ravel()
+        return ((((ratios * 255).astype(int) >> 2) + 1) * (ratios > 0)).astype("uint8")
+    return bytes((int(ratio * 255) >> 2) + 1 if ratio > 0 else 0 for row in heatmap for ratio in row)
+
+
+def density_color(count):
+    """Grey level of a block holding `count` ants (darker with more ants, log scale)."""
+    shade = max(0, 200 - int(25 * math.log2(count)))
+    return f'#{shade:02x}{shade:02x}{shade:02x}'
+
+
+class BlockPyramid:
+    """Max of a width x height layer of bytes over blocks of 2^k x 2^k cells, for every k.
+
+    `levels[0]` holds the cells, `levels[k]` one value per block, row-major
+    with `sizes[k]` = (columns, rows). The top level is a single block.
+    Levels are built a row at a time, and update() only recomputes the blocks
+    above the cells that changed.
+    """
+
+    def __init__(self, width, height, values):
+        self.sizes = [(width, height)]
+        self.levels = [bytearray(values)]
+        while width > 1 or height > 1:
+            level, width, height = self._reduce(self.levels[-1], width, height)
+            self.levels.append(level)
+            self.sizes.append((width, height))
+
+    @staticmethod
+    def _reduce(values, width, height):
+        """The next level up: max of each 2x2 block (missing cells count as 0)."""
+        columns, rows = (width + 1) // 2, (height + 1) // 2
+        level = bytearray(columns * rows)
+        blank = bytes(width + width % 2)
+        for row in range(rows):
+            top = bytes(values[2 * row * width:(2 * row + 1) * width])
+            bottom = bytes(values[(2 * row + 1) * width:(2 * row + 2) * width]) if 2 * row + 1 < height else blank
+            if width % 2:
+                top += b"\0"
+                bottom = bottom[:width] + b"\0"
+            level[row * columns:(row + 1) * columns] = bytes(map(max, top[0::2], top[1::2], bottom[0::2], bottom[1::2]))
+        return level, columns, rows
+
+    def update(self, indices, values):
+        """Sets the cells at `indices` to `values`, then refreshes the blocks above them.
+
+        Returns, for every level, the set of block indices whose value changed.
+        """
+        base = self.levels[0]
+        changed = set()
+        for i, value in zip(indices, values):
+            if base[i] != value:
+                base[i] = value
+                changed.add(i)
+        result = [changed]
+        for k in range(1, len(self.levels)):
+            if not changed:
+                result.append(set())
+                continue
+            width, height = self.sizes[k - 1]
+            columns = self.sizes[k][0]
+            child, level = self.levels[k - 1], self.levels[k]
+            parents = {(i % width >> 1) + (i // width >> 1) * columns for i in changed}
+            changed = set()
+            for parent in parents:
+                x, y = parent % columns * 2, parent // columns * 2
+                i = y * width + x
+                value = child[i]
+                if x + 1 < width:
+                    value = max(value, child[i + 1])
+                if y + 1 < height:
+                    value = max(value, child[i + width])
+                    if x + 1 < width:
+                        value = max(value, child[i + width + 1])
+                if level[parent] != value:
+                    level[parent] = value
+                    changed.add(parent)
+            result.append(changed)
+        return result
+
+
+class Viewport:
+    """The part of the grid shown on a canvas of `width` x `height` pixels.
+
+    `x0`, `y0` is the (fractional) cell at the top-left corner and `scale`
+    the size of a cell in pixels.
+    """
+
+    def __init__(self, width, height, scale):
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.x0 = 0.0
+        self.y0 = 0.0
+
+    def level(self, min_block_pixels, max_level):
+        """Smallest k such that 2^k x 2^k cell blocks are at least `min_block_pixels` wide."""
+        level = 0
+        while level < max_level and self.scale * (1 << level) < min_block_pixels:
+            level += 1
+        return level
+
+    def window(self, level, columns, rows):
+        """(bx0, by0, bx1, by1): the blocks of `level` at least partly on screen, ends excluded."""
+        size = (1 << level) * self.scale
+        bx0 = max(0, int(self.x0 * self.scale // size))
+        by0 = max(0, int(self.y0 * self.scale // size))
+        bx1 = min(columns, int((self.x0 * self.scale + self.width) // size) + 1)
+        by1 = min(rows, int((self.y0 * self.scale + self.height) // size) + 1)
+        return bx0, by0, max(bx0, bx1), max(by0, by1)
+
+    def to_screen(self, x, y):
+        """Pixel position of the top-left corner of cell (x, y), fractional cells allowed."""
+        return (x - self.x0) * self.scale, (y - self.y0) * self.scale
+
+    def clamp(self, grid_width, grid_height):
+        """Keeps the grid on screen: it cannot be dragged further than its own edges."""
+        for attribute, cells, pixels in (("x0", grid_width, self.width), ("y0", grid_height, self.height)):
+            shown = pixels / self.scale
+            low, high = sorted((0.0, cells - shown))
+            setattr(self, attribute, min(max(getattr(self, attribute), low), high))
+
+
+class CanvasRenderer:
+    """Draws the simulation on a Tk canvas, reusing canvas items between frames.
+
+    Only the part of the grid inside the viewport is drawn, and the view can
+    be panned and zoomed. When a cell is smaller than `min_block_pixels`,
+    blocks of 2^k x 2^k cells are drawn as one rectangle: the strongest
+    pheromone of the block, its most important terrain (see
+    TERRAIN_PRIORITY) and a grey level for the number of ants on it instead
+    of one oval per ant. The terrain and heatmap block values are kept in
+    BlockPyramids that each frame only patches where cells changed.
+
+    Terrain and heatmap rectangles are only created, recoloured or deleted
+    where a visible block changed, and ant ovals come from a pool and are
+    moved with ``coords``. Each frame therefore costs roughly what changed
+    on screen since the previous one, rather than the area of the grid.
+    """
+
+    def __init__(self, canvas, cell_size, width=None, height=None, min_block_pixels=4, max_cell_pixels=64):
+        self.canvas = canvas
+        self.cell_size = cell_size
+        self.view_width = width
+        self.view_height = height
+        self.min_block_pixels = min_block_pixels
+        self.max_cell_pixels = max_cell_pixels
+        self.reset()
+
+    def reset(self):
+        """Forgets every item, e.g. when a new simulation is loaded."""
+        self.canvas.delete("all")
+        self.viewport = None
+        self._size = None            # (width, height) of the grid
+        self._level = 0
+        self._window = None
+        self._cells = None           # Grid.cells as last drawn (bytearray)
+        self._terrain = None         # BlockPyramid of terrain priorities
+        self._heat_view = None
+        self._heat_values = None     # flat buckets as last drawn (bytearray)
+        self._heat = None            # BlockPyramid of heatmap buckets
+        self._items = {"terrain": {}, "heat": {}}  # layer -> block index -> rectangle
+        self._ants = []
+        self._ant_items = []         # pool of ovals
+        self._ant_drawn = []         # (x, y, type) drawn by each pooled oval, in pixels
+        self._density_items = {}     # block -> rectangle
+        self._density_drawn = {}     # block -> colour
+
+    def draw(self, width, height, cells, ants, heatmap=None, view="none"):
+        """Draws a frame: heatmap below terrain, ants on top.
+
+        `cells` holds the flat cell codes (Grid.cells), `ants` a list of ant
+        dicts (as in the history) and `heatmap` the per-cell intensities from
+        PheromoneGrid.heatmap, or None.
+        """
+        if self._size != (width, height):
+            self.reset()
+            self._size = (width, height)
+            self.fit()
+        self._update_heatmap(heatmap, view)
+        self._update_terrain(cells)
+        self._ants = ants
+        self._draw_ants()
+
+    def draw_changes(self, cell_changes, ants, heat_changes=None):
+        """Draws a frame given by what changed since the frame drawn last.
+
+        `cell_changes` maps flat cell indices to their new code and
+        `heat_changes` to their new heatmap bucket (see heat_buckets), or is
+        None without a pheromone view; both are relative to the previous
+        frame, which must show the same grid and view (BackgroundStepper
+        frames). Costs what changed rather than the area of the grid.
+        """
+        if cell_changes:
+            indices = list(cell_changes)
+            for i in indices:
+                self._cells[i] = cell_changes[i]
+            changed = self._terrain.update(indices, [PRIORITY_TABLE[cell_changes[i]] for i in indices])
+            self._sync("terrain", changed[self._level])
+        if heat_changes is None:
+            self._update_heatmap(None, self._heat_view)
+        elif heat_changes and self._heat is not None:
+            indices = list(heat_changes)
+            values = [heat_changes[i] for i in indices]
+            for i, value in zip(indices, values):
+                self._heat_values[i] = value
+            changed = self._heat.update(indices, values)
+            self._sync("heat", changed[self._level])
+        self._ants = ants
+        self._draw_ants()
+
+    # --- Viewport ---
+
+    def fit(self):
+        """Shows the whole grid, at `cell_size` pixels per cell at most."""
+        width, height = self._size
+        view_width = self.view_width or width * self.cell_size
+        view_height = self.view_height or height * self.cell_size
+        scale = min(self.cell_size, view_width / width, view_height / height)
+        self.viewport = Viewport(view_width, view_height, scale)
+        self.viewport.clamp(width, height)
+        self._redraw()
+
+    def pan(self, dx, dy):
+        """Moves the view by (dx, dy) pixels, shifting the items already drawn."""
+        if self.viewport is None:
+            return
+        viewport = self.viewport
+        x0, y0 = viewport.x0, viewport.y0
+        viewport.x0 -= dx / viewport.scale
+        viewport.y0 -= dy / viewport.scale
+        viewport.clamp(*self._size)
+        shift_x = (x0 - viewport.x0) * viewport.scale
+        shift_y = (y0 - viewport.y0) * viewport.scale
+        if shift_x or shift_y:
+            self.canvas.move("all", shift_x, shift_y)
+            self._ant_drawn = [None if drawn is None else (drawn[0] + shift_x, drawn[1] + shift_y, drawn[2])
+                               for drawn in self._ant_drawn]
+            self._scroll()
+
+    def zoom(self, factor, x, y):
+        """Scales the view by `factor`, keeping the cell under pixel (x, y) in place."""
+        if self.viewport is None:
+            return
+        viewport = self.viewport
+        width, height = self._size
+        smallest = min(viewport.width / width, viewport.height / height, self.cell_size)
+        scale = min(max(viewport.scale * factor, smallest), self.max_cell_pixels)
+        if scale == viewport.scale:
+            return
+        cell_x, cell_y = viewport.x0 + x / viewport.scale, viewport.y0 + y / viewport.scale
+        viewport.scale = scale
+        viewport.x0, viewport.y0 = cell_x - x / scale, cell_y - y / scale
+        viewport.clamp(width, height)
+        self._redraw()
+
+    def _redraw(self):
+        """Draws the visible blocks from scratch (after a zoom)."""
+        for layer, items in self._items.items():
+            for item in items.values():
+                self.canvas.delete(item)
+            items.clear()
+        self._clear_density()
+        self._level = self.viewport.level(self.min_block_pixels, len(self._pyramid_sizes()) - 1)
+        self._window = self._current_window()
+        everything = self._window_blocks(self._window)
+        self._sync("heat", everything)
+        self._sync("terrain", everything)
+        self._draw_ants()
+
+    def _scroll(self):
+        """After a pan: drops the items that left the view and draws the blocks that entered it."""
+        old, new = self._window, self._current_window()
+        self._window = new
+        for items in self._items.values():
+            for block in [block for block in items if not self._in_window(block, new)]:
+                self.canvas.delete(items.pop(block))
+        entered = [block for block in self._window_blocks(new) if not self._in_window(block, old)]
+        self._sync("heat", entered)
+        self._sync("terrain", entered)
+        self._draw_ants()
+
+    def _pyramid_sizes(self):
+        """Block grid size at every level (also when no pyramid is built yet)."""
+        if self._terrain is not None:
+            return self._terrain.sizes
+        width, height = self._size
+        sizes = [(width, height)]
+        while width > 1 or height > 1:
+            width, height = (width + 1) // 2, (height + 1) // 2
+            sizes.append((width, height))
+        return sizes
+
+    def _current_window(self):
+        columns, rows = self._pyramid_sizes()[self._level]
+        return self.viewport.window(self._level, columns, rows)
+
+    def _in_window(self, block, window):
+        columns = self._pyramid_sizes()[self._level][0]
+        bx0, by0, bx1, by1 = window
+        return bx0 <= block % columns < bx1 and by0 <= block // columns < by1
+
+    def _window_blocks(self, window):
+        columns = self._pyramid_sizes()[self._level][0]
+        bx0, by0, bx1, by1 = window
+        return [by * columns + bx for by in range(by0, by1) for bx in range(bx0, bx1)]
+
+    # --- Terrain and heatmap layers ---
+
+    def _block_rectangle(self, block, **options):
+        columns = self._pyramid_sizes()[self._level][0]
+        size = 1 << self._level
+        x1, y1 = self.viewport.to_screen(block % columns * size, block // columns * size)
+        pixels = size * self.viewport.scale
+        return self.canvas.create_rectangle(x1, y1, x1 + pixels, y1 + pixels, outline="", **options)
+
+    def _sync(self, layer, blocks):
+        """Creates, recolours or deletes the items of the visible `blocks` of a layer."""
+        pyramid = self._heat if layer == "heat" else self._terrain
+        values = pyramid.levels[self._level] if pyramid is not None else None
+        items = self._items[layer]
+        columns = self._pyramid_sizes()[self._level][0]
+        bx0, by0, bx1, by1 = self._window
+        created = False
+        for block in blocks:
+            if not (bx0 <= block % columns < bx1 and by0 <= block // columns < by1):
+                continue
+            value = values[block] if values is not None else 0
+            color = heat_color(value, self._heat_view) if layer == "heat" and value else PRIORITY_COLORS.get(value) if value else None
+            item = items.get(block)
+            if color is None:
+                if item is not None:
+                    self.canvas.delete(items.pop(block))
+            elif item is None:
+                items[block] = self._block_rectangle(block, fill=color, tags=layer)
+                created = True
+            else:
+                self.canvas.itemconfigure(item, fill=color)
+        if created:
+            if layer == "heat":
+                self.canvas.tag_lower("heat")
+            else:
+                self.canvas.tag_raise("ant")
+
+    def _update_terrain(self, cells):
+        """Patches the terrain pyramid and items where the cells changed."""
+        cells = bytes(cells)
+        if cells == self._cells:
+            return
+        width, height = self._size
+        if self._cells is None:
+            self._terrain = BlockPyramid(width, height, cells.translate(PRIORITY_TABLE))
+            changed = [set(self._window_blocks(self._window))] * (self._level + 1)
+        else:
+            indices = [i for i, (old, new) in enumerate(zip(self._cells, cells)) if old != new]
+            changed = self._terrain.update(indices, [PRIORITY_TABLE[cells[i]] for i in indices])
+        self._cells = bytearray(cells)
+        self._sync("terrain", changed[self._level])
+
+    def _update_heatmap(self, heatmap, view):
+        """Patches the heatmap pyramid and recolours the visible blocks whose bucket changed."""
+        width, height = self._size
+        if heatmap is None:
+            if self._heat is not None:
+                self._heat = self._heat_values = None
+                self._sync("heat", list(self._items["heat"]))
+            self._heat_view = view
+            return
+
+        buckets = heat_buckets(heatmap)
+        values = buckets.tobytes() if hasattr(buckets, "tobytes") else buckets
+        if self._heat is None or view != self._heat_view:
+            self._heat = BlockPyramid(width, height, values)
+            self._heat_view = view
+            self._heat_values = bytearray(values)
+            self._sync("heat", self._window_blocks(self._window))
+            return
+        if values == self._heat_values:
+            return
+        if hasattr(buckets, "tobytes"):
+            indices = (buckets != np.frombuffer(self._heat_values, dtype=np.uint8)).nonzero()[0].tolist()
+        else:
+            indices = [i for i, (old, new) in enumerate(zip(self._heat_values, values)) if old != new]
+        self._heat_values = bytearray(values)
+        changed = self._heat.update(indices, [values[i] for i in indices])
+        self._sync("heat", changed[self._level])
+
+    # --- Ants ---
+
+    def _draw_ants(self):
+        """Ovals for the visible ants when cells are large enough, density blocks otherwise."""
+        if self._level == 0 and self.viewport.scale >= self.min_block_pixels:
+            self._clear_density()
+            self._draw_ant_ovals()
+        else:
+            self._hide_ovals(0)
+            self._draw_density()
+
+    def _draw_ant_ovals(self):
+        """Moves pooled ovals to the visible ants' cells, hiding the ones left over."""
+        viewport = self.viewport
+        size = viewport.scale
+        bx0, by0, bx1, by1 = self._window
+        count = 0
+        for ant in self._ants:
+            if not (bx0 <= ant["x"] < bx1 and by0 <= ant["y"] < by1):
+                continue
+            x1, y1 = viewport.to_screen(ant["x"] + 0.25, ant["y"] + 0.25)
+            drawn = (x1, y1, ant["type"])
+            if count == len(self._ant_items):
+                self._ant_items.append(self.canvas.create_oval(
+                    x1, y1, x1 + size / 2, y1 + size / 2,
+                    fill=ANT_COLORS[ant["type"]], outline="black", tags="ant"
+                ))
+                self._ant_drawn.append(drawn)
+                count += 1
+                continue
+            previous = self._ant_drawn[count]
+            item = self._ant_items[count]
+            count += 1
+            if previous == drawn:
+                continue
+            if previous is None:
+                self.canvas.itemconfigure(item, state="normal")
+            if previous is None or previous[:2] != drawn[:2]:
+                self.canvas.coords(item, x1, y1, x1 + size / 2, y1 + size / 2)
+            if previous is None or previous[2] != drawn[2]:
+                self.canvas.itemconfigure(item, fill=ANT_COLORS[ant["type"]])
+            self._ant_drawn[count - 1] = drawn
+        self._hide_ovals(count)
+
+    def _hide_ovals(self, start):
+        for i in range(start, len(self._ant_items)):
+            if self._ant_drawn[i] is not None:
+                self.canvas.itemconfigure(self._ant_items[i], state="hidden")
+                self._ant_drawn[i] = None
+
+    def _draw_density(self):
+        """One grey block per visible block holding ants, darker with more ants."""
+        shift = self._level
+        columns = self._pyramid_sizes()[self._level][0]
+        bx0, by0, bx1, by1 = self._window
+        counts = {}
+        for ant in self._ants:
+            bx, by = ant["x"] >> shift, ant["y"] >> shift
+            if bx0 <= bx < bx1 and by0 <= by < by1:
+                block = by * columns + bx
+                counts[block] = counts.get(block, 0) + 1
+
+        for block in [block for block in self._density_items if block not in counts]:
+            self.canvas.delete(self._density_items.pop(block))
+            del self._density_drawn[block]
+        for block, count in counts.items():
+            color = density_color(count)
+            item = self._density_items.get(block)
+            if item is None:
+                self._density_items[block] = self._block_rectangle(block, fill=color, tags="ant")
+            elif self._density_drawn[block] != color:
+                self.canvas.itemconfigure(item, fill=color)
+            self._density_drawn[block] = color
+
+    def _clear_density(self):
+        for item in self._density_items.values():
+            self.canvas.delete(item)
+        self._density_items.clear()
+        self._density_drawn.clear()
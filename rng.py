@@ -0,0 +1,80 @@
+"""Counter-based random numbers for the ants.
+
+Each draw is a pure function of (seed, ant id, tick, slot), hashed with the
+splitmix64 finalizer, so an ant's random stream does not depend on which
+process steps it, on the other ants or on the order in which the ants are
+processed. Slot 0 is the exploration draw of an action and slot 1 the choice
+among the valid moves when exploring.
+
+The pure Python and the NumPy versions return the same floats.
+"""
+try:
+    import numpy as np
+except ImportError:  # the pure Python version is used instead
+    np = None
+
+MASK_64 = (1 << 64) - 1
+GOLDEN = 0x9E3779B97F4A7C15
+MIX_1 = 0xBF58476D1CE4E5B9
+MIX_2 = 0x94D049BB133111EB
+SCALE = 1.0 / (1 << 53)
+
+# Below this many ants, a block is drawn in pure Python (NumPy's call
+# overhead is larger than the work)
+NUMPY_BLOCK = 32
+
+
+def _mix(z):
+    """splitmix64 finalizer on a 64-bit Python int."""
+    z = ((z ^ (z >> 30)) * MIX_1) & MASK_64
+    z = ((z ^ (z >> 27)) * MIX_2) & MASK_64
+    return z ^ (z >> 31)
+
+
+def ant_uniform(seed, ant_id, tick, slot):
+    """Uniform float in [0, 1): draw `slot` of ant `ant_id` at `tick`."""
+    key = _mix((ant_id * GOLDEN + seed) & MASK_64)
+    return (_mix(key ^ ((tick * 4 + slot) & MASK_64)) >> 11) * SCALE
+
+
+if np is not None:
+    _GOLDEN, _MIX_1, _MIX_2 = np.uint64(GOLDEN), np.uint64(MIX_1), np.uint64(MIX_2)
+
+    def _mix_array(z):
+        """splitmix64 finalizer on a uint64 array."""
+        z = (z ^ (z >> np.uint64(30))) * _MIX_1
+        z = (z ^ (z >> np.uint64(27))) * _MIX_2
+        return z ^ (z >> np.uint64(31))
+
+    def ant_uniforms(seed, ids, tick, slot):
+        """Vectorized ant_uniform: one float per ant id."""
+        with np.errstate(over="ignore"):
+            key = _mix_array(np.asarray(ids, dtype=np.uint64) * _GOLDEN + np.uint64(seed & MASK_64))
+            z = _mix_array(key ^ np.uint64((tick * 4 + slot) & MASK_64))
+        return (z >> np.uint64(11)) * SCALE
+
+
+class AntStreams:
+    """The random streams of the ants of one simulation.
+
+    The owner sets `tick` before each step; `uniforms` (NumPy, for the
+    batched colony) and `block` (Python floats, for Ant objects) then hand
+    out the draws of that tick. Two simulations with the same seed give the
+    same draws to the same ant at the same tick, whatever engine or process
+    runs them.
+    """
+
+    def __init__(self, seed):
+        self.seed = seed & MASK_64
+        self.tick = 0
+
+    def uniforms(self, ids, slot):
+        """NumPy array with draw `slot` of each ant in `ids` at the current tick."""
+        return ant_uniforms(self.seed, ids, self.tick, slot)
+
+    def block(self, ids):
+        """Pre-draws the current tick for a list of ant ids: returns (explore draws, pick draws) lists."""
+        if np is not None and len(ids) >= NUMPY_BLOCK:
+            return self.uniforms(ids, 0).tolist(), self.uniforms(ids, 1).tolist()
+        seed, tick = self.seed, self.tick
+        return [ant_uniform(seed, i, tick, 0) for i in ids], [ant_uniform(seed, i, tick, 1) for i in ids]
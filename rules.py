@@ -0,0 +1,55 @@
+"""Rewards and interactions of a move, as tables indexed by (ant mode, cell code).
+
+What happens when an ant steps on a cell only depends on its mode and on the
+cell's code. RULES lists the pairs that do something, with the reward they
+earn and their effect (pick up food, drop it at the nest, die); every other
+pair is a plain move. Rules compiles them with the rewards of a config once
+per simulation into dense tables over the 256 cell codes, so the engines get
+the reward and the effect of a move from one lookup (Ant objects) or one
+gather for the whole batch (colony arrays, tiles) instead of a chain of
+comparisons. A new cell type or reward term is a new entry in RULES.
+"""
+from models import ANT_MODES, AntMode, FOOD_CODE, NEST_CODE, DEADLY_CODE
+
+try:
+    import numpy as np
+except ImportError:  # the Ant objects only use the lists
+    np = None
+
+# Effects of arriving on a cell
+MOVE, PICKUP, DROP, DEATH = range(4)
+
+SEARCHING, RETURNING = ANT_MODES.index(AntMode.SEARCHING_FOOD), ANT_MODES.index(AntMode.RETURNING_TO_NEST)
+
+# (mode code, cell code) -> (reward key of config["pheromones"], effect);
+# any other pair earns the move reward and does nothing
+RULES = {
+    (SEARCHING, FOOD_CODE): ("food_reward", PICKUP),
+    (RETURNING, NEST_CODE): ("nest_reward", DROP),
+    (SEARCHING, DEADLY_CODE): ("deadly_reward", DEATH),
+    (RETURNING, DEADLY_CODE): ("deadly_reward", DEATH),
+}
+DEFAULT_RULE = ("move_reward", MOVE)
+
+# Effect of each cell code, one row per mode code (the effects do not depend on the config)
+EFFECTS = tuple(bytes(RULES.get((mode, code), DEFAULT_RULE)[1] for code in range(256))
+                for mode in range(len(ANT_MODES)))
+
+
+class Rules:
+    """The rewards of a config["pheromones"] section, compiled with RULES.
+
+    `rewards[mode][code]` and `effects[mode][code]` index rows by mode code;
+    `by_mode` holds the same (rewards, effects) rows keyed by AntMode, for Ant
+    objects. With NumPy, `reward_table` and `effect_table` are (modes, 256)
+    arrays to gather from with the mode and cell code arrays of a batch.
+    """
+
+    def __init__(self, rewards):
+        self.rewards = tuple([rewards[RULES.get((mode, code), DEFAULT_RULE)[0]] for code in range(256)]
+                             for mode in range(len(ANT_MODES)))
+        self.effects = EFFECTS
+        self.by_mode = {mode: (self.rewards[i], self.effects[i]) for i, mode in enumerate(ANT_MODES)}
+        if np is not None:
+            self.reward_table = np.array(self.rewards, dtype=float)
+            self.effect_table = np.frombuffer(b"".join(self.effects), dtype=np.uint8).reshape(len(ANT_MODES), 256)
@@ -0,0 +1,38 @@
+import heapq
+
+
+class EventScheduler:
+    """Min-heap of ants keyed on the tick of their next action.
+
+    Each tick only the ants that actually act are touched. Ties are broken by
+    the ant's position in the colony list, so ants acting in the same tick
+    are processed in the same order as in the tick-by-tick loop.
+    """
+
+    def __init__(self, ants, now):
+        # An ant whose timer reads t at the start of tick `now` acts at now + t - 1
+        self._queue = [(now + max(ant.time_to_next_move, 1) - 1, order, ant) for order, ant in enumerate(ants)]
+        heapq.heapify(self._queue)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def next_tick(self):
+        """Returns the next tick at which an ant acts, or None if none is scheduled."""
+        return self._queue[0][0] if self._queue else None
+
+    def pop_due(self, now):
+        """Removes and returns the (tick, order, ant) entries due at or before `now`."""
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            due.append(heapq.heappop(self._queue))
+        return due
+
+    def schedule(self, ant, tick, order):
+        """Schedules the ant's next action at the given tick."""
+        heapq.heappush(self._queue, (tick, order, ant))
+
+    def sync_timers(self, now):
+        """Writes each ant's time_to_next_move as the tick loop would have it at `now`."""
+        for tick, _, ant in self._queue:
+            ant.time_to_next_move = tick - now + 1
@@ -1,177 +1,557 @@
+import copy
 import random
-from models import Grid, PheromoneGrid, Ant, Explorer, Fighter, Collector, CellType, AntMode
+from models import (
+    Grid, create_pheromone_grid, Ant, Explorer, Fighter, Collector, CellType, AntMode, ACTIONS,
+    ANT_TYPES, ANT_MODES,
+)
+from rules import Rules, PICKUP, DROP, DEATH
+from scheduler import EventScheduler
+from history import HistoryStore
+from trajectory import create_trajectory
+from profiler import Profiler
+from rng import AntStreams
+from warmstart import warm_start
+from maps import load_grid
+from convergence import create_fast_forward
+
+try:
+    import numpy as np
+    from colony import Colony
+except ImportError:  # the batched colony needs NumPy
+    np = None
+    Colony = None
+
+# Bumped whenever a change to the engine alters the outcome of a seeded run,
+# which invalidates the cached results of jobs.py
+ENGINE_VERSION = 3
+
+def setup_world(grid, map_layout, food_quantities, y_offset=0):
+    """Configures the grid based on a map layout, drawn `y_offset` rows down."""
+    for y, row in enumerate(map_layout):
+        for x, char in enumerate(row):
+            if char == 'W':
+                grid.set_cell(x, y + y_offset, CellType.WALL)
+            elif char == 'N':
+                grid.set_cell(x, y + y_offset, CellType.NEST)
+            elif char == 'F':
+                quantity = food_quantities.get((x, y), 1000)
+                grid.set_cell(x, y + y_offset, CellType.FOOD, quantity=quantity)
+            elif char == 'D':
+                grid.set_cell(x, y + y_offset, CellType.DEADLY)
+
+
+def world_grid(config):
+    """Returns the Grid of a config, read from its "map_file" (text or binary,
+    see maps.py) if it has one, else drawn from its "map" rows."""
+    food_quantities = config.get("food_quantities", {})
+    if config.get("map_file"):
+        return load_grid(config["map_file"], food_quantities)
+    grid = Grid(config["grid_width"], config["grid_height"])
+    setup_world(grid, config["map"], food_quantities)
+    return grid
+
+
+def create_ants(config, nest_position):
+    """Creates the initial set of ants of a configuration, at the nest."""
+    ants = []
+    nest_x, nest_y = nest_position
+    q_params = config["q_learning"]
+
+    ant_counts = config["nest"]["ants"]
+    ant_classes = {"Explorer": Explorer, "Fighter": Fighter, "Collector": Collector}
+
+    for name, count in ant_counts.items():
+        for _ in range(count):
+            ant = ant_classes[name](
+                nest_x, nest_y,
+                q_params["learning_rate"],
+                q_params["discount_factor"],
+                q_params["epsilon"]
+            )
+            ant.id = len(ants)
+            ants.append(ant)
+    return ants
+
 
 class Simulation:
     """Manages the entire ant simulation."""
 
-    def __init__(self, config):
+    def __init__(self, config, profiler=None):
         """Initializes the simulation with a given configuration."""
         self.config = config
         self.time = 0
-        self.history = []
+        self.actions_taken = 0
+        # Food units dropped off at the nest
+        self.food_delivered = 0
 
         # Setup the world
-        self.grid = Grid(config["grid_width"], config["grid_height"])
-        self.pheromone_grid = PheromoneGrid(config["grid_width"], config["grid_height"])
-        self._setup_world_from_map(config["map"], config.get("food_quantities", {}))
+        self.grid = world_grid(config)
+        engine = config.get("engine", {})
+        # The "arrays" colony steps all ants at once and needs the NumPy grid;
+        # without NumPy the simulation keeps using Ant objects.
+        self.batched = engine.get("colony", "objects") == "arrays" and Colony is not None
+        self.pheromone_grid = create_pheromone_grid(
+            self.grid.width, self.grid.height,
+            config["pheromones"]["dissipation_rate"],
+            lazy=engine.get("lazy_dissipation", False),
+            backend="numpy" if self.batched else engine.get("pheromone_backend", "python"),
+            threshold=engine.get("sparse_threshold", 1e-6)
+        )
+        # Optional non-zero initial Q-tables (distance fields or a trained run)
+        warm_start(self.grid, self.pheromone_grid, config)
+
+        # Per-phase timers and counters; without a profiler the simulation
+        # runs its uninstrumented code paths
+        if profiler is None and engine.get("profile", False):
+            profiler = Profiler()
+        self.profiler = profiler
+
+        # Reward and effect of a move by (ant mode, cell code), see rules.py
+        self.rules = Rules(config["pheromones"])
+
+        # Random draws: "streams" gives every ant its own counter-based stream
+        # derived from the seed (rng.py), so a seed gives the same run in any
+        # process or batch; "shared" draws from the simulation's own
+        # random.Random (Ant objects) or one NumPy generator (batched colony),
+        # so simulations in one process never disturb each other.
+        seed = config.get("seed")
+        if engine.get("rng", "shared") == "streams":
+            self.streams = AntStreams(random.getrandbits(64) if seed is None else seed)
+            self.rng = self.streams
+        else:
+            self.streams = None
+            self.rng = np.random.default_rng(seed) if self.batched else None
+        # Without a seed, seeded from the global `random` module
+        self.random = random.Random(random.getrandbits(64) if seed is None else seed)
 
         # Setup Q-learning
-        self.q_learning = QLearning(self.grid, self.pheromone_grid)
+        self.q_learning = QLearning(self.grid, self.pheromone_grid, profiler, self.random)
 
         # Create ants
         self.ants = self._create_ants()
+        if self.batched:
+            self.ants = Colony.from_ants(self.ants)
+
+        # Off by default: an empty source still rewards ants stepping on it
+        self.clear_exhausted_food = engine.get("clear_exhausted_food", False)
+
+        # The event scheduler only wakes the ants that act in a tick. The
+        # batched colony already handles all ants in one pass and ignores it.
+        self.scheduler = None
+        if not self.batched and engine.get("scheduler", "tick") == "event":
+            self.scheduler = EventScheduler(self.ants, self.time)
+        # Optional jump ahead once the policy has converged (convergence.py);
+        # the batched colony ignores it
+        self.fast_forward = None if self.batched else create_fast_forward(engine.get("fast_forward", False))
         self.nest = self.grid.nest_position # Assuming nest position is stored after setup
 
-    def _setup_world_from_map(self, map_layout, food_quantities):
-        """Configures the grid based on a map layout."""
-        for y, row in enumerate(map_layout):
-            for x, char in enumerate(row):
-                if char == 'W':
-                    self.grid.set_cell(x, y, CellType.WALL)
-                elif char == 'N':
-                    self.grid.set_cell(x, y, CellType.NEST)
-                elif char == 'F':
-                    quantity = food_quantities.get((x, y), 1000)
-                    self.grid.set_cell(x, y, CellType.FOOD, quantity=quantity)
-                elif char == 'D':
-                    self.grid.set_cell(x, y, CellType.DEADLY)
+        # Keyframes + per-tick deltas; engine.history = False turns it off.
+        # engine.trajectory also appends them to a log on disk (trajectory.py).
+        self.trajectory = None
+        self._reset_history()
+
+    def _reset_history(self, trajectory=True):
+        """Starts a new history at the current tick, and a new trajectory log
+        unless `trajectory` is False."""
+        engine = self.config.get("engine", {})
+        history_options = engine.get("history", {})
+        self.history = None if history_options is False else HistoryStore(**history_options)
+        if trajectory:
+            self.close_trajectory()
+            self.trajectory = create_trajectory(engine.get("trajectory", False), self.grid, self.config)
+        self._acted_ants = []
+        self._dead_ants = []
+        self._record_history()
+
+    def fork(self):
+        """Returns an independent copy of the simulation, e.g. to branch experiments from a trained colony.
+
+        The fork shares the (read-only) config and copies the mutable state:
+        grid and food, Q-tables, ants and scheduler, time and the random
+        streams or generators, so it draws the numbers the original would
+        have drawn. Its history starts at the current tick and it has no
+        profiler nor trajectory log.
+        """
+        clone = copy.copy(self)
+        clone.grid = self.grid.copy()
+        clone.pheromone_grid = self.pheromone_grid.copy()
+        clone.profiler = None
+        clone.rng = copy.deepcopy(self.rng)
+        clone.random = copy.deepcopy(self.random)
+        clone.q_learning = QLearning(clone.grid, clone.pheromone_grid, rng=clone.random)
+        if self.streams is not None:
+            clone.streams = clone.rng
+        if self.batched:
+            clone.ants = self.ants.copy()
+        else:
+            if self.scheduler is not None:
+                self.scheduler.sync_timers(self.time)
+            clone.ants = [copy.copy(ant) for ant in self.ants]
+            if self.scheduler is not None:
+                clone.scheduler = EventScheduler(clone.ants, clone.time)
+            clone.fast_forward = create_fast_forward(self.config.get("engine", {}).get("fast_forward", False))
+        clone.trajectory = None
+        clone._reset_history(trajectory=False)
+        return clone
 
     def _create_ants(self):
         """Creates the initial set of ants."""
-        ants = []
-        nest_x, nest_y = self.grid.nest_position
-        q_params = self.config["q_learning"]
-
-        ant_counts = self.config["nest"]["ants"]
-        ant_classes = {"Explorer": Explorer, "Fighter": Fighter, "Collector": Collector}
-
-        for name, count in ant_counts.items():
-            for _ in range(count):
-                ant = ant_classes[name](
-                    nest_x, nest_y,
-                    q_params["learning_rate"],
-                    q_params["discount_factor"],
-                    q_params["epsilon"]
-                )
-                ants.append(ant)
-        return ants
+        return create_ants(self.config, self.grid.nest_position)
 
     def run_step(self):
         """Runs a single time step of the simulation."""
         if self.is_finished():
             return
+        if self.streams is not None:
+            self.streams.tick = self.time
+        if self.profiler is not None:
+            self._run_step_profiled()
+            return
+
+        if self.batched:
+            acted = self.ants.step(self.grid, self.pheromone_grid, self.rules, self.rng)
+            self.food_delivered += self.ants.last_delivered
+        elif self.scheduler is not None:
+            acted = self._step_scheduled_ants()
+        else:
+            acted = self._step_ants()
+        self.actions_taken += acted
+
+        # Exhausted sources can optionally go back to being empty cells
+        if self.clear_exhausted_food and self.grid.exhausted_food:
+            self.grid.clear_exhausted_food()
+
+        # Dissipate pheromones
+        self._dissipate_pheromones()
+
+        self.time += 1
+        self._record_history()
+        if self.fast_forward is not None and self.time >= self.fast_forward.next_check:
+            self.fast_forward.check(self)
+
+    def _run_step_profiled(self):
+        """run_step with each phase timed by the profiler."""
+        profiler = self.profiler
+        clock, times, counts = profiler.clock, profiler.times, profiler.counts
+
+        # Ant objects time select / update / interact per action and remove
+        # per tick; the batched colony is timed as a whole
+        if self.batched:
+            start = clock()
+            acted = self.ants.step(self.grid, self.pheromone_grid, self.rules, self.rng, counts)
+            times["colony"] += clock() - start
+            self.food_delivered += self.ants.last_delivered
+        elif self.scheduler is not None:
+            acted = self._step_scheduled_ants()
+        else:
+            acted = self._step_ants()
+        self.actions_taken += acted
+        counts["actions"] += acted
+
+        start = clock()
+        if self.clear_exhausted_food and self.grid.exhausted_food:
+            self.grid.clear_exhausted_food()
+        cleared = clock()
+        self._dissipate_pheromones()
+        dissipated = clock()
 
-        # Process each ant
+        self.time += 1
+        self._record_history()
+        times["clear_food"] += cleared - start
+        times["dissipate"] += dissipated - cleared
+        times["history"] += clock() - dissipated
+        profiler.tick(self.time)
+        if self.fast_forward is not None and self.time >= self.fast_forward.next_check:
+            self.fast_forward.check(self)
+
+    def _step_ants(self):
+        """Processes the ants one at a time, in order, and returns how many acted."""
+        if self.streams is not None:
+            return self._step_ants_streams()
+        acted = 0
         ants_to_remove = []
         for ant in self.ants:
             ant.time_to_next_move -= 1
             if ant.time_to_next_move <= 0:
-                self._process_ant_action(ant)
+                died = self._process_ant_action(ant)
+                self._acted_ants.append(ant)
+                acted += 1
                 ant.time_to_next_move = ant.speed # Reset timer
-                if self.grid.grid[ant.y][ant.x] == CellType.DEADLY:
+                if died:
                     ants_to_remove.append(ant)
 
         # Remove dead ants
-        for ant in ants_to_remove:
-            self.ants.remove(ant)
+        if ants_to_remove:
+            self._remove_ants(ants_to_remove)
+        return acted
 
-        # Dissipate pheromones
-        self._dissipate_pheromones()
+    def _step_ants_streams(self):
+        """_step_ants with the random draws of the due ants taken in one block."""
+        due = []
+        for ant in self.ants:
+            ant.time_to_next_move -= 1
+            if ant.time_to_next_move <= 0:
+                due.append(ant)
+        explore_draws, pick_draws = self.streams.block([ant.id for ant in due])
 
-        self.time += 1
+        ants_to_remove = []
+        for ant, explore_draw, pick_draw in zip(due, explore_draws, pick_draws):
+            died = self._process_ant_action(ant, (explore_draw, pick_draw))
+            self._acted_ants.append(ant)
+            ant.time_to_next_move = ant.speed # Reset timer
+            if died:
+                ants_to_remove.append(ant)
+
+        if ants_to_remove:
+            self._remove_ants(ants_to_remove)
+        return len(due)
+
+    def _step_scheduled_ants(self):
+        """Processes only the ants the event scheduler has due this tick and returns how many acted."""
+        ants_to_remove = []
+        due = self.scheduler.pop_due(self.time)
+        if self.streams is not None:
+            draws = zip(*self.streams.block([ant.id for _, _, ant in due]))
+        else:
+            draws = [None] * len(due)
+        for (_, order, ant), ant_draws in zip(due, draws):
+            died = self._process_ant_action(ant, ant_draws)
+            self._acted_ants.append(ant)
+            ant.time_to_next_move = ant.speed # Reset timer
+            if died:
+                ants_to_remove.append(ant)
+            else:
+                self.scheduler.schedule(ant, self.time + ant.speed, order)
+
+        if ants_to_remove:
+            self._remove_ants(ants_to_remove)
+        return len(due)
+
+    def _remove_ants(self, dead_ants):
+        """Removes the given ants in a single pass over the colony."""
+        profiler = self.profiler
+        if profiler is not None:
+            start = profiler.clock()
+        dead = set(map(id, dead_ants))
+        self.ants = [ant for ant in self.ants if id(ant) not in dead]
+        self._dead_ants.extend(dead_ants)
+        if profiler is not None:
+            profiler.times["remove"] += profiler.clock() - start
+            profiler.counts["deaths"] += len(dead_ants)
+
+    def _next_action_tick(self):
+        """Returns the next tick at which some ant acts, or None if no ant is left."""
+        if self.scheduler is not None:
+            return self.scheduler.next_tick()
+        if not len(self.ants):
+            return None
+        if self.batched:
+            return self.time + max(int(self.ants.timer.min()), 1) - 1
+        return self.time + max(min(ant.time_to_next_move for ant in self.ants), 1) - 1
+
+    def skip_idle_ticks(self):
+        """Jumps over the upcoming ticks in which no ant acts.
+
+        The skipped ticks are applied in bulk (timers, dissipation, history),
+        which gives the same state as calling run_step for each of them.
+        Returns the number of ticks skipped.
+        """
+        if self.is_finished():
+            return 0
+        max_time = self.config["max_time"]
+        next_tick = self._next_action_tick()
+        target = max_time if next_tick is None else min(next_tick, max_time)
+        skipped = target - self.time
+        if skipped <= 0:
+            return 0
+
+        if self.batched:
+            self.ants.timer -= skipped
+        elif self.scheduler is None:
+            for ant in self.ants:
+                ant.time_to_next_move -= skipped
+        self.pheromone_grid.dissipate(skipped)
+
+        self.time = target
         self._record_history()
-
-    def _process_ant_action(self, ant):
-        """Handles the logic for a single ant's action."""
+        if self.profiler is not None:
+            self.profiler.counts["skipped_ticks"] += skipped
+            self.profiler.tick(self.time, skipped)
+        return skipped
+
+    def finish_jump(self, time, moved_ants, moves, pickups, drops):
+        """Completes a fast-forward jump to `time`, after FastForward has placed the ants.
+
+        `moved_ants` moved `moves` times in total, with `pickups` and `drops`
+        along the way. FastForward has already dissipated the Q-tables over
+        the jump (see convergence.py).
+        """
+        skipped = time - self.time
+        self.actions_taken += moves
+        self.time = time
+        if self.scheduler is not None:
+            self.scheduler = EventScheduler(self.ants, self.time)
+        self._acted_ants.extend(moved_ants)
+        self._record_history()
+        if self.profiler is not None:
+            counts = self.profiler.counts
+            counts["actions"] += moves
+            counts["pickups"] += pickups
+            counts["drops"] += drops
+            counts["skipped_ticks"] += skipped
+            self.profiler.tick(self.time, skipped)
+
+    def _process_ant_action(self, ant, draws=None):
+        """Handles the logic for a single ant's action; returns True if the ant died.
+
+        `draws` are the ant's (explore, pick) random draws for this tick, or
+        None to draw from the simulation's `random` generator.
+        """
+        if self.profiler is not None:
+            return self._process_ant_action_profiled(ant, draws)
         old_pos = (ant.x, ant.y)
-        action_index = self.q_learning.choose_action(ant)
+        action_index = self.q_learning.choose_action(ant, draws)
         action = self.q_learning.actions[action_index]
 
         new_x, new_y = ant.x + action[0], ant.y + action[1]
         new_pos = (new_x, new_y)
 
-        reward = self._get_reward(new_pos, ant)
-        self.q_learning.update_q_value(ant, old_pos, action_index, reward, new_pos)
+        # The cell is read once: the rules give both the reward and the effect
+        rewards, effects = self.rules.by_mode[ant.mode]
+        cell = self.grid.cell_code(new_x, new_y)
+        self.q_learning.update_q_value(ant, old_pos, action_index, rewards[cell], new_pos)
 
         # Move ant
         ant.x, ant.y = new_x, new_y
 
         # Interact with the environment
-        self._handle_environment_interaction(ant)
-
-    def _get_reward(self, pos, ant):
-        """Calculates the reward for moving to a new position."""
-        x, y = pos
-        cell = self.grid.grid[y][x]
-        rewards = self.config["pheromones"]
-
-        if cell == CellType.DEADLY:
-            return rewards["deadly_reward"]
-        if ant.mode == AntMode.SEARCHING_FOOD and cell == CellType.FOOD:
-            return rewards["food_reward"]
-        if ant.mode == AntMode.RETURNING_TO_NEST and cell == CellType.NEST:
-            return rewards["nest_reward"]
-
-        return rewards["move_reward"]
-
-    def _handle_environment_interaction(self, ant):
-        """Handles the ant's interaction with its current cell."""
-        cell_type = self.grid.grid[ant.y][ant.x]
-
-        if cell_type == CellType.FOOD and ant.mode == AntMode.SEARCHING_FOOD:
-            # Pick up food
-            food_source = next((fs for fs in self.grid.food_sources if fs.x == ant.x and fs.y == ant.y), None)
+        effect = effects[cell]
+        return effect and self._handle_environment_interaction(ant, effect)
+
+    def _process_ant_action_profiled(self, ant, draws=None):
+        """_process_ant_action with the select, update and interact phases timed."""
+        profiler = self.profiler
+        clock, times, counts = profiler.clock, profiler.times, profiler.counts
+
+        start = clock()
+        old_pos = (ant.x, ant.y)
+        action_index = self.q_learning.choose_action(ant, draws)
+        action = self.q_learning.actions[action_index]
+        selected = clock()
+
+        new_x, new_y = ant.x + action[0], ant.y + action[1]
+        new_pos = (new_x, new_y)
+        rewards, effects = self.rules.by_mode[ant.mode]
+        cell = self.grid.cell_code(new_x, new_y)
+        self.q_learning.update_q_value(ant, old_pos, action_index, rewards[cell], new_pos)
+        ant.x, ant.y = new_x, new_y
+        updated = clock()
+
+        mode = ant.mode
+        effect = effects[cell]
+        died = effect and self._handle_environment_interaction(ant, effect)
+        if ant.mode != mode:
+            counts["pickups" if mode == AntMode.SEARCHING_FOOD else "drops"] += 1
+
+        times["select"] += selected - start
+        times["update"] += updated - selected
+        times["interact"] += clock() - updated
+        return died
+
+    def _handle_environment_interaction(self, ant, effect):
+        """Applies the effect of the cell the ant just stepped on (see rules.py); returns True if it died."""
+        if effect == PICKUP:
+            food_source = self.grid.food_at.get((ant.x, ant.y))
             if food_source and food_source.quantity > 0:
-                pickup_amount = min(ant.max_load - ant.current_load, food_source.quantity)
-                ant.current_load += pickup_amount
-                food_source.quantity -= pickup_amount
+                ant.current_load += self.grid.take_food(food_source, ant.max_load - ant.current_load)
                 ant.switch_mode()
-
-        elif cell_type == CellType.NEST and ant.mode == AntMode.RETURNING_TO_NEST:
-            # Drop off food
+        elif effect == DROP:
             # For now, let's assume the Nest class will be developed further
             # self.nest.food_collected += ant.current_load
+            self.food_delivered += ant.current_load
             ant.current_load = 0
             ant.switch_mode()
-
+        return effect == DEATH
 
     def _dissipate_pheromones(self):
         """Reduces the intensity of all pheromones over time."""
-        rate = self.config["pheromones"]["dissipation_rate"]
-        for y in range(self.grid.height):
-            for x in range(self.grid.width):
-                for i in range(4):
-                    self.pheromone_grid.food_q_table[y][x][i] *= (1 - rate)
-                    self.pheromone_grid.nest_q_table[y][x][i] *= (1 - rate)
+        # In lazy mode this only advances the decay clock; cells catch up
+        # when QLearning or the GUI touches them.
+        self.pheromone_grid.dissipate()
 
     def _record_history(self):
-        """Saves the current state of the simulation for rewinding."""
-        state = {
-            "time": self.time,
-            "ants": [{"x": a.x, "y": a.y, "type": type(a).__name__, "load": a.current_load} for a in self.ants],
-            # To save space, we might not save pheromones every step or save them differently
-            # "food_pheromones": [row[:] for row in self.pheromone_grid.food_q_table],
-            # "nest_pheromones": [row[:] for row in self.pheromone_grid.nest_q_table],
-        }
-        self.history.append(state)
+        """Saves what changed during the tick so the GUI can rewind."""
+        if self.history is None and self.trajectory is None:
+            self._acted_ants.clear()
+            self._dead_ants.clear()
+            return
+        if self.batched:
+            changes, removed = self.ants.last_changes, self.ants.last_removed
+            if changes is None:
+                changes, removed = ((),) * 5, ()
+            self.ants.last_changes = self.ants.last_removed = None
+        else:
+            dead = set(map(id, self._dead_ants))
+            acted = [ant for ant in self._acted_ants if id(ant) not in dead]
+            changes = (
+                [a.id for a in acted], [a.x for a in acted], [a.y for a in acted],
+                [a.current_load for a in acted], [ANT_MODES.index(a.mode) for a in acted],
+            )
+            removed = [a.id for a in self._dead_ants]
+        self._acted_ants = []
+        self._dead_ants = []
+        if self.history is not None:
+            self.history.record(self.time, changes, removed, self.ant_columns, self.pheromone_grid.snapshot)
+        if self.trajectory is not None:
+            self.trajectory.record(self.time, changes, removed, self.ant_columns, self.grid.cells,
+                                   self.pheromone_grid.snapshot)
+
+    def close_trajectory(self):
+        """Writes the end of the trajectory log, if any, and closes it."""
+        if self.trajectory is not None:
+            self.trajectory.close()
+            self.trajectory = None
+
+    def ant_columns(self):
+        """Returns (ids, xs, ys, types, loads, modes) for every living ant."""
+        if self.batched:
+            return self.ants.columns()
+        return (
+            [a.id for a in self.ants], [a.x for a in self.ants], [a.y for a in self.ants],
+            [ANT_TYPES.index(type(a)) for a in self.ants], [a.current_load for a in self.ants],
+            [ANT_MODES.index(a.mode) for a in self.ants],
+        )
+
+    def historical_pheromones(self, time):
+        """Returns a PheromoneGrid rebuilt from the pheromone frame closest to `time`, or None."""
+        frame = self.history.pheromones_at(time) if self.history is not None else None
+        if frame is None:
+            return None
+        return type(self.pheromone_grid).from_snapshot(self.grid.width, self.grid.height, frame[1])
+
+    def ant_states(self):
+        """Returns the ants as a list of dicts (position, type and load)."""
+        if self.batched:
+            return self.ants.ant_states()
+        return [{"x": a.x, "y": a.y, "type": type(a).__name__, "load": a.current_load, "mode": a.mode} for a in self.ants]
 
     def is_finished(self):
         """Checks if the simulation has ended."""
-        total_food = sum(fs.initial_quantity for fs in self.grid.food_sources)
         # food_collected_at_nest = self.nest.food_collected
         # For now, check if sources are empty, as nest logic is simple
-        food_remaining = sum(fs.quantity for fs in self.grid.food_sources)
-
-        return self.time >= self.config["max_time"] or food_remaining <= 0
+        return self.time >= self.config["max_time"] or self.grid.remaining_food <= 0
 
 
 class QLearning:
     """Handles the Q-learning logic for an ant."""
 
-    def __init__(self, grid, pheromone_grid):
+    def __init__(self, grid, pheromone_grid, profiler=None, rng=random):
         self.grid = grid
         self.pheromone_grid = pheromone_grid
-        self.actions = [(0, -1), (1, 0), (0, 1), (-1, 0)]  # N, E, S, W
+        self.profiler = profiler
+        # Source of the draws when the ants have no streams
+        self.random = rng
+        self.actions = ACTIONS  # N, E, S, W
 
     def get_q_table(self, ant_mode):
         """Returns the appropriate Q-table based on the ant's mode."""
@@ -180,29 +560,40 @@ class QLearning:
         else:
             return self.pheromone_grid.nest_q_table
 
-    def choose_action(self, ant):
-        """Chooses an action for the ant using an epsilon-greedy strategy."""
-        if random.random() < ant.epsilon:
+    def choose_action(self, ant, draws=None):
+        """Chooses an action for the ant using an epsilon-greedy strategy.
+
+        `draws` is an (explore, pick) pair of uniform draws from the ant's
+        stream; without it the choice draws from `self.random`.
+        """
+        explore = (self.random.random() if draws is None else draws[0]) < ant.epsilon
+        if self.profiler is not None:
+            counts = self.profiler.counts
+            if explore:
+                counts["explorations"] += 1
+            else:
+                counts["exploitations"] += 1
+                counts["q_cells"] += 1
+        if explore:
             # Explore: choose a random valid action
             possible_actions = self._get_valid_actions(ant.x, ant.y)
-            return random.choice(possible_actions) if possible_actions else (0, 0)
+            if not possible_actions:
+                return (0, 0)
+            if draws is None:
+                return self.random.choice(possible_actions)
+            return possible_actions[int(draws[1] * len(possible_actions))]
         else:
             # Exploit: choose the best action from the Q-table
             return self._get_best_action(ant.x, ant.y, ant.mode)
 
     def _get_valid_actions(self, x, y):
-        """Gets a list of valid actions from a given position."""
-        valid_actions = []
-        for i, (dx, dy) in enumerate(self.actions):
-            nx, ny = x + dx, y + dy
-            if 0 <= nx < self.grid.width and 0 <= ny < self.grid.height and \
-               self.grid.grid[ny][nx] != CellType.WALL:
-                valid_actions.append(i)
-        return valid_actions
+        """Gets the valid actions from a given position (precomputed by the Grid)."""
+        return self.grid.valid_actions(x, y)
 
     def _get_best_action(self, x, y, ant_mode):
         """Finds the best action from the Q-table for a given state."""
         q_table = self.get_q_table(ant_mode)
+        self.pheromone_grid.sync_cell(x, y)
         q_values = q_table[y][x]
         valid_actions = self._get_valid_actions(x,y)
 
@@ -224,8 +615,12 @@ class QLearning:
     def update_q_value(self, ant, old_pos, action_index, reward, new_pos):
         """Updates the Q-value for a given state-action pair."""
         q_table = self.get_q_table(ant.mode)
+        if self.profiler is not None:
+            self.profiler.counts["q_cells"] += 2  # old and new state
         old_x, old_y = old_pos
         new_x, new_y = new_pos
+        self.pheromone_grid.sync_cell(old_x, old_y)
+        self.pheromone_grid.sync_cell(new_x, new_y)
 
         # Old Q-value
         old_q_value = q_table[old_y][old_x][action_index]
@@ -238,4 +633,7 @@ class QLearning:
         new_q_value = old_q_value + ant.learning_rate * \
             (reward + ant.discount_factor * max_future_q - old_q_value)
 
-        q_table[old_y][old_x][action_index] = new_q_value
\ No newline at end of file
+        q_table[old_y][old_x][action_index] = new_q_value
+        changed = self.pheromone_grid.changed_cells
+        if changed is not None:
+            changed.add(old_y * self.pheromone_grid.width + old_x)
\ No newline at end of file
@@ -0,0 +1,271 @@
+import threading
+import time
+from array import array
+
+from renderer import heat_buckets
+
+try:
+    import numpy as np
+except ImportError:  # the heat tracker then uses arrays and loops
+    np = None
+
+
+class HeatTracker:
+    """Heatmap buckets of one Q-table, patched from the cells the engine wrote.
+
+    Keeps the highest Q-value of every cell in units of `scale`, which
+    absorbs the dissipation: it scales every cell alike, so the intensities
+    relative to the strongest cell only change where a cell was written, or
+    everywhere when the strongest cell changes. `heatmap` is the full
+    heatmap when the tracker was built, until the stepper takes it.
+    """
+
+    def __init__(self, simulation, view):
+        pheromone_grid = simulation.pheromone_grid
+        pheromone_grid.track_changes()
+        pheromone_grid.take_changes()
+        self.pheromone_grid = pheromone_grid
+        self.view = view
+        self.time = simulation.time
+        self.scale = 1.0
+        q_table = self._q_table()
+        self.heatmap = pheromone_grid.heatmap(q_table)
+        cell_max = pheromone_grid.cell_max(q_table)
+        if np is not None:
+            self.values = np.asarray(cell_max, dtype=float).ravel()
+            self.drawn = np.asarray(self.heatmap).ravel() > 0
+            self.peak = float(self.values.max()) if self.values.size else 0.0
+            self.buckets = heat_buckets(np.asarray(self.heatmap, dtype=float))
+        else:
+            self.values = array('d', [value for row in cell_max for value in row])
+            self.drawn = bytearray(1 if ratio > 0 else 0 for row in self.heatmap for ratio in row)
+            self.peak = max(self.values, default=0.0)
+            self.buckets = bytearray(heat_buckets(self.heatmap))
+        self.divisor = max(0.001, self.peak)
+        # Whether a bucket may be lit since the last full bucketing
+        self.lit = self.peak > 0
+
+    def _q_table(self):
+        pheromone_grid = self.pheromone_grid
+        return pheromone_grid.food_q_table if self.view == "food" else pheromone_grid.nest_q_table
+
+    def update(self, simulation):
+        """Returns {flat index: bucket} for the cells whose bucket changed since
+        the last call, or None if the tracker has to be rebuilt."""
+        pheromone_grid = simulation.pheromone_grid
+        if pheromone_grid is not self.pheromone_grid:
+            return None
+        written = pheromone_grid.take_changes()
+        if written is None:
+            return None
+        self.scale *= pheromone_grid.decay_factor ** (simulation.time - self.time)
+        self.time = simulation.time
+        if self.scale < 1e-200:
+            self._rescale()
+
+        written = list(written)
+        values, drawn = self.values, self.drawn
+        weakened = False
+        for i, (value, shown) in zip(written, pheromone_grid.peek_cell_max(self._q_table(), written)):
+            value /= self.scale
+            weakened = weakened or (values[i] >= self.peak and value < values[i])
+            values[i] = value
+            drawn[i] = shown
+            self.peak = max(self.peak, value)
+        if weakened:  # the strongest cell may be another one now
+            self.peak = float(values.max()) if np is not None else max(values)
+
+        divisor = max(0.001 / self.scale, self.peak)
+        if divisor != self.divisor and (self.peak > 0 or self.lit):
+            return self._rebucket(divisor)
+        self.lit = self.lit or self.peak > 0
+        changes = {}
+        for i in written:
+            value = values[i]
+            bucket = (int(value / divisor * 255) >> 2) + 1 if drawn[i] and value > 0 else 0
+            if bucket != self.buckets[i]:
+                self.buckets[i] = changes[i] = bucket
+        return changes
+
+    def _rescale(self):
+        """Folds `scale` back into the values before it underflows."""
+        if np is not None:
+            self.values *= self.scale
+        else:
+            self.values = array('d', [value * self.scale for value in self.values])
+        self.peak *= self.scale
+        self.divisor *= self.scale
+        self.scale = 1.0
+
+    def _rebucket(self, divisor):
+        """Buckets every cell against a new strongest value; returns the ones that changed."""
+        self.divisor = divisor
+        self.lit = self.peak > 0
+        if np is not None:
+            ratios = np.where(self.drawn, self.values / divisor, 0.0)
+            buckets = heat_buckets(ratios)
+            changed = np.flatnonzero(buckets != self.buckets)
+            self.buckets = buckets
+            return dict(zip(changed.tolist(), buckets[changed].tolist()))
+        changes = {}
+        for i, value in enumerate(self.values):
+            bucket = (int(value / divisor * 255) >> 2) + 1 if self.drawn[i] and value > 0 else 0
+            if bucket != self.buckets[i]:
+                self.buckets[i] = changes[i] = bucket
+        return changes
+
+
+class BackgroundStepper:
+    """Runs a Simulation on a worker thread, decoupled from the GUI frame rate.
+
+    The worker steps as fast as it can (`target_tps` None) or at a target
+    number of ticks per second. About `publish_hz` times per second it builds
+    a snapshot of the state (time, ants, terrain, heatmap of `view`) and swaps
+    it in as the front buffer, so the GUI always reads a complete frame and
+    never the simulation itself. Code that needs the live simulation (the
+    time slider reading the history, for instance) must hold `lock`; the
+    worker holds it for each step.
+
+    A "full" snapshot holds all the cells and the heatmap. The others only
+    hold the cells (`cell_changes`) and heatmap buckets (`heat_changes`)
+    that changed since the previous snapshot the GUI took with latest(),
+    from the changes the grid and the pheromone grid record, so a frame
+    costs what changed rather than the area of the grid. publish(full=True)
+    asks for a full one, e.g. after drawing something else.
+    """
+
+    def __init__(self, simulation, target_tps=None, view="none", publish_hz=30):
+        self.simulation = simulation
+        self.target_tps = target_tps
+        self.view = view
+        self.publish_interval = 1 / publish_hz
+        self.lock = threading.Lock()
+        self.ticks_per_second = 0.0
+
+        # Guards the front buffer and whether the GUI took it
+        self._front_lock = threading.Lock()
+        self._front = None
+        self._taken = False
+        self._heat = None
+        self._publish(full=True)
+        self._running = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def latest(self):
+        """Returns the most recent complete snapshot; the next ones are relative to it."""
+        with self._front_lock:
+            self._taken = True
+            return self._front
+
+    def resume(self):
+        """Starts or resumes stepping."""
+        self._running.set()
+
+    def pause(self):
+        """Stops stepping, waits for the current step to finish and publishes the state it left."""
+        self._running.clear()
+        with self.lock:
+            self._publish()
+
+    def stop(self):
+        """Ends the worker thread (the stepper cannot be resumed afterwards)."""
+        self._stopped = True
+        self._running.set()
+        self._thread.join()
+
+    def is_running(self):
+        return self._running.is_set() and not self._stopped
+
+    def publish(self, full=False):
+        """Rebuilds the front buffer now, e.g. after the view changed while paused."""
+        with self.lock:
+            self._publish(full)
+
+    def _publish(self, full=False):
+        """Swaps in a new snapshot; called with `lock` held."""
+        with self._front_lock:
+            pending = None if self._taken else self._front
+        snapshot = self._snapshot(full or (pending is not None and pending["full"]))
+        if pending is not None and not snapshot["full"]:
+            # The GUI has not drawn the pending changes: carry them over (they
+            # are new values, so applying them twice is harmless)
+            snapshot["cell_changes"] = {**pending["cell_changes"], **snapshot["cell_changes"]}
+            if snapshot["heat_changes"] is not None:
+                snapshot["heat_changes"] = {**pending["heat_changes"], **snapshot["heat_changes"]}
+        with self._front_lock:
+            self._front, self._taken = snapshot, False
+
+    def _snapshot(self, full):
+        simulation = self.simulation
+        grid, pheromone_grid = simulation.grid, simulation.pheromone_grid
+        cell_changes = heat_changes = None
+        if not full and grid.changed_cells is not None:
+            cell_changes = {i: grid.cells[i] for i in grid.take_changes()}
+        if self.view == "none":
+            self._heat = None
+            if pheromone_grid.changed_cells is not None:
+                pheromone_grid.take_changes()
+        elif not full and self._heat is not None and self._heat.view == self.view:
+            heat_changes = self._heat.update(simulation)
+            full = heat_changes is None
+        else:
+            full = True
+        full = full or cell_changes is None
+
+        snapshot = {
+            "time": simulation.time,
+            "finished": simulation.is_finished(),
+            "ants": simulation.ant_states(),
+            "view": self.view,
+            "full": full,
+            "cells": None,
+            "heatmap": None,
+            "cell_changes": cell_changes,
+            "heat_changes": heat_changes,
+            "profile": simulation.profiler.summary() if simulation.profiler is not None else None,
+        }
+        if full:
+            grid.track_changes()
+            grid.take_changes()
+            snapshot["cells"] = bytes(grid.cells)
+            snapshot["cell_changes"] = snapshot["heat_changes"] = None
+            if self.view != "none":
+                self._heat = HeatTracker(simulation, self.view)
+                snapshot["heatmap"], self._heat.heatmap = self._heat.heatmap, None
+        return snapshot
+
+    def _run(self):
+        last_publish = rate_start = time.perf_counter()
+        rate_ticks = 0
+        while True:
+            self._running.wait()
+            if self._stopped:
+                return
+
+            start = time.perf_counter()
+            with self.lock:
+                # pause() may have cleared the flag after the wait above: it
+                # publishes under the lock, so check again before stepping
+                if not self._running.is_set() or self._stopped:
+                    continue
+                before = self.simulation.time
+                self.simulation.run_step()
+                if self.target_tps is None:
+                    self.simulation.skip_idle_ticks()
+                rate_ticks += self.simulation.time - before
+                finished = self.simulation.is_finished()
+
+                now = time.perf_counter()
+                if finished or now - last_publish >= self.publish_interval:
+                    self._publish()
+                    last_publish = now
+
+            if now - rate_start >= 0.5:
+                self.ticks_per_second = rate_ticks / (now - rate_start)
+                rate_start, rate_ticks = now, 0
+            if finished:
+                self._running.clear()
+            elif self.target_tps:
+                time.sleep(max(0.0, 1 / self.target_tps - (time.perf_counter() - start)))
@@ -0,0 +1,177 @@
+import hashlib
+import itertools
+import json
+import os
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from config import with_params
+from jobs import canonical_config
+from simulation import Simulation, ENGINE_VERSION
+
+
+def grid_search(space):
+    """Yields every combination of a {path: [values]} search space."""
+    paths = list(space)
+    for values in itertools.product(*(space[path] for path in paths)):
+        yield dict(zip(paths, values))
+
+
+def random_search(space, count, seed=0):
+    """Yields `count` random draws from a search space.
+
+    A list is sampled uniformly, a (low, high) tuple as a uniform number
+    (an integer when both bounds are integers).
+    """
+    rng = random.Random(seed)
+    for _ in range(count):
+        params = {}
+        for path, domain in space.items():
+            if isinstance(domain, tuple):
+                low, high = domain
+                if isinstance(low, int) and isinstance(high, int):
+                    params[path] = rng.randint(low, high)
+                else:
+                    params[path] = rng.uniform(low, high)
+            else:
+                params[path] = rng.choice(domain)
+        yield params
+
+
+def score_run(simulation, budget):
+    """Scores a finished or truncated run; lower is better.
+
+    A run that collected all the food scores its final time. A run cut at
+    `budget` scores budget * (1 + fraction of food left), so it always ranks
+    behind any run that finished.
+    """
+    if simulation.grid.remaining_food <= 0:
+        return simulation.time
+    total = simulation.grid.total_food or 1
+    return budget * (1 + simulation.grid.remaining_food / total)
+
+
+def evaluate(base_config, params, seed, budget):
+    """Runs one configuration for one seed, for at most `budget` ticks."""
+    config = with_params(base_config, params)
+    config["max_time"] = min(budget, config["max_time"])
+    config["seed"] = seed
+    engine = dict(config.get("engine", {}))
+    engine["history"] = False
+    config["engine"] = engine
+
+    simulation = Simulation(config)
+    while not simulation.is_finished():
+        simulation.run_step()
+        simulation.skip_idle_ticks()
+    return {
+        "time": simulation.time,
+        "remaining_food": simulation.grid.remaining_food,
+        "score": score_run(simulation, config["max_time"]),
+    }
+
+
+def config_digest(config):
+    """Hash of the canonical form of a base config (see jobs.canonical_config)."""
+    blob = json.dumps([ENGINE_VERSION, canonical_config(config)], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+def run_key(params, seed, budget, base_digest):
+    """Identifies one evaluation in the sweep log.
+
+    `base_digest` is the config_digest of the base config, so a log resumed
+    with another base config (map, rewards, engine...) does not reuse runs.
+    """
+    blob = json.dumps([base_digest, params, seed, budget], sort_keys=True)
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+class Sweep:
+    """Parallel parameter sweep with successive halving and a resumable log.
+
+    Every candidate is run for each seed in a process pool and scored by the
+    mean over the seeds. With `rungs` > 1, candidates first run on a
+    fraction of `max_time` and only the best 1/`eta` of them move on to the
+    next rung, whose budget is `eta` times larger; the last rung uses the
+    full `max_time`. Each finished run is appended to `log_path` (JSON
+    lines), so an interrupted sweep resumes without redoing them.
+    """
+
+    def __init__(self, base_config, candidates, seeds=(0, 1, 2), workers=None,
+                 rungs=1, eta=3, log_path=None):
+        self.base_config = base_config
+        self.base_digest = config_digest(base_config)
+        self.candidates = list(candidates)
+        self.seeds = list(seeds)
+        self.workers = workers or os.cpu_count()
+        self.rungs = rungs
+        self.eta = eta
+        self.log_path = log_path
+        self.done = self._load_log()
+
+    def _load_log(self):
+        done = {}
+        if self.log_path and os.path.exists(self.log_path):
+            with open(self.log_path) as log:
+                for line in log:
+                    line = line.strip()
+                    if line:
+                        entry = json.loads(line)
+                        done[entry["key"]] = entry["result"]
+        return done
+
+    def _log(self, key, params, seed, budget, result):
+        self.done[key] = result
+        if self.log_path:
+            entry = {"key": key, "params": params, "seed": seed, "budget": budget, "result": result}
+            with open(self.log_path, "a") as log:
+                log.write(json.dumps(entry) + "\n")
+
+    def budgets(self):
+        """Returns the max_time budget of each rung."""
+        max_time = self.base_config["max_time"]
+        return [max(1, max_time // self.eta ** (self.rungs - 1 - rung)) for rung in range(self.rungs)]
+
+    def _run_rung(self, pool, candidates, budget):
+        """Evaluates every candidate on every seed and returns them with their mean score."""
+        pending = {}
+        submitted = set()
+        for params in candidates:
+            for seed in self.seeds:
+                key = run_key(params, seed, budget, self.base_digest)
+                if key not in self.done and key not in submitted:
+                    future = pool.submit(evaluate, self.base_config, params, seed, budget)
+                    pending[future] = (key, params, seed)
+                    submitted.add(key)
+        # Log each run as soon as it finishes so an interruption loses little
+        for future in as_completed(pending):
+            key, params, seed = pending[future]
+            self._log(key, params, seed, budget, future.result())
+
+        results = []
+        for params in candidates:
+            runs = [self.done[run_key(params, seed, budget, self.base_digest)] for seed in self.seeds]
+            scores = [run["score"] for run in runs]
+            results.append({
+                "params": params,
+                "budget": budget,
+                "score": statistics.mean(scores),
+                "score_stdev": statistics.pstdev(scores),
+                "time": statistics.mean(run["time"] for run in runs),
+            })
+        results.sort(key=lambda result: result["score"])
+        return results
+
+    def run(self):
+        """Runs the sweep and returns the results of the last rung, best first."""
+        candidates = self.candidates
+        results = []
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for rung, budget in enumerate(self.budgets()):
+                results = self._run_rung(pool, candidates, budget)
+                if rung < self.rungs - 1:
+                    keep = max(1, len(results) // self.eta)
+                    candidates = [result["params"] for result in results[:keep]]
+        return results
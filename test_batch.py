@@ -0,0 +1,25 @@
+"""Lockstep batch runner: each environment ends as its single run would."""
+import pytest
+
+from batch import BatchRunner
+from conftest import small_config, run
+from simulation import Simulation
+
+
+@pytest.mark.parametrize("rng", ["shared", "streams"])
+def test_batch_matches_single_runs(rng):
+    configs = [small_config({"colony": "arrays", "rng": rng, "history": False}, seed=seed) for seed in range(3)]
+    configs[1]["max_time"] = 900
+    results = BatchRunner(configs).run()
+    for config, result in zip(configs, results):
+        single = run(Simulation(config))
+        assert (result["time"], result["remaining_food"], result["actions"]) == \
+            (single.time, single.grid.remaining_food, single.actions_taken)
+
+
+def test_batch_rejects_configs_of_other_maps():
+    other = small_config()
+    other["map"] = list(other["map"])
+    other["map"][5] = "W" * 20
+    with pytest.raises(ValueError):
+        BatchRunner([small_config(), other])
@@ -0,0 +1,40 @@
+"""Benchmark cases: speed-ups against the baseline engine, tiled runs against one process."""
+from benchmark import ENGINES, MAPS, SUITES, TILINGS, make_config, run_case, add_speedups, add_scaling
+
+
+def test_every_engine_and_map_runs():
+    for engine in ENGINES:
+        result = run_case(("open", 20, 10, engine, 50, False))
+        assert result["engine"] == engine and result["actions"] > 0
+    for kind in MAPS:
+        config = make_config(kind, 21, 8, "baseline")
+        assert len(config["map"]) == 21 and config["food_quantities"]
+
+
+def test_baseline_is_the_default_engine():
+    assert make_config("open", 20, 10, "baseline")["engine"] == {"history": False}
+    assert {case[3] for case in SUITES["quick"]()} >= set(ENGINES)
+
+
+def test_speedups_are_relative_to_the_baseline_case():
+    results = [
+        {"map": "open", "size": 20, "ants": 10, "ticks": 100, "history": False, "engine": "baseline",
+         "ticks_per_second": 100.0},
+        {"map": "open", "size": 20, "ants": 10, "ticks": 100, "history": False, "engine": "objects",
+         "ticks_per_second": 250.0},
+        {"map": "maze", "size": 21, "ants": 10, "ticks": 100, "history": False, "engine": "objects",
+         "ticks_per_second": 50.0},
+    ]
+    add_speedups(results)
+    assert [result.get("speedup") for result in results] == [1.0, 2.5, None]
+
+
+def test_tiled_cases_run_and_scale_against_one_process():
+    single = run_case(("open", 30, 20, "streams", 30, False))
+    tiled = run_case(("open", 30, 20, "tiled-2x1", 30, False))
+    assert tiled["actions"] == single["actions"] > 0
+    assert make_config("open", 30, 20, "tiled-2x2")["engine"] == dict(ENGINES["streams"], history=False)
+    results = [single, tiled]
+    add_scaling(results)
+    assert "scaling" not in single and tiled["scaling"] == tiled["ticks_per_second"] / single["ticks_per_second"]
+    assert {case[3] for case in SUITES["full"]()} >= set(TILINGS)
@@ -0,0 +1,53 @@
+"""Checkpoint round-trips and fork() continue the run exactly."""
+import random
+
+import pytest
+
+from checkpoint import save_checkpoint, load_checkpoint
+from conftest import small_config, run, assert_same_run
+from simulation import Simulation
+
+
+@pytest.mark.parametrize("engine", [
+    {"scheduler": "event", "lazy_dissipation": True},
+    {"scheduler": "tick"},
+    {"colony": "arrays", "lazy_dissipation": True},
+    {"pheromone_backend": "sparse"},
+    {"pheromone_backend": "sparse", "lazy_dissipation": True},
+])
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_checkpoint_and_fork_continue_the_run(tmp_path, engine, use_mmap):
+    path = str(tmp_path / "run.ckpt")
+    original = run(Simulation(small_config(engine, max_time=2500)), 300)
+    save_checkpoint(original, path)
+    restored = load_checkpoint(path, use_mmap=use_mmap)
+    assert_same_run(original, restored)
+    assert restored.pheromone_grid.decay_state() == original.pheromone_grid.decay_state()
+
+    fork = original.fork()
+    reference = run(original.fork(), 500)
+    for simulation in (restored, fork):
+        assert_same_run(reference, run(simulation, 500))
+    assert original.time < reference.time
+
+
+def test_loading_a_checkpoint_leaves_other_simulations_alone(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    save_checkpoint(run(Simulation(small_config(seed=3)), 200), path)
+    reference = run(Simulation(small_config()), 600)
+
+    random.seed(1)
+    state = random.getstate()
+    other = run(Simulation(small_config()), 300)
+    restored = load_checkpoint(path)
+    assert random.getstate() == state
+    # Interleaved with the restored run, the other one draws the same numbers
+    run(restored, 300)
+    assert_same_run(reference, run(other, 300))
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "not.ckpt"
+    path.write_bytes(b"not a checkpoint at all")
+    with pytest.raises(ValueError):
+        load_checkpoint(str(path))
@@ -0,0 +1,65 @@
+"""Batched colony kernel: same-entry conflicts and compaction after deaths."""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from colony import Colony, COLUMNS
+from models import Grid, CellType, ArrayPheromoneGrid
+from rules import Rules
+
+REWARDS = {"food_reward": 1000, "nest_reward": 1000, "deadly_reward": -500, "move_reward": -1}
+
+
+def due_colony(x, y, types, learning_rate):
+    colony = Colony(x, y, types, learning_rate, 0.9, 0.0)  # greedy
+    colony.timer[:] = 1  # every ant acts on the next step
+    return colony
+
+
+def test_ants_read_the_tick_start_tables_and_the_last_update_wins():
+    grid = Grid(3, 3)
+    pheromone_grid = ArrayPheromoneGrid(3, 3)
+    pheromone_grid.food_q_table[1, 1] = [0.0, 5.0, 0.0, 0.0]
+    pheromone_grid.food_q_table[1, 0] = [0.0, 1.0, 0.0, 0.0]
+    # Ants 0 and 1 update the same (table, cell, action) entry; ant 2 moves
+    # into that cell and reads it as the next state.
+    colony = due_colony([1, 1, 0], [1, 1, 1], [0, 0, 0], [0.1, 0.5, 0.2])
+    assert colony.step(grid, pheromone_grid, Rules(REWARDS), np.random.default_rng(0)) == 3
+
+    # Ant 1 comes last: its update overwrites ant 0's and starts from the
+    # value before ant 0's update
+    assert pheromone_grid.food_q_table[1, 1, 1] == pytest.approx(5.0 + 0.5 * (-1 + 0.9 * 0.0 - 5.0))
+    # Ant 2 sees the cell's value as of the start of the tick, not the updated one
+    assert pheromone_grid.food_q_table[1, 0, 1] == pytest.approx(1.0 + 0.2 * (-1 + 0.9 * 5.0 - 1.0))
+    assert colony.x.tolist() == [2, 2, 1] and colony.y.tolist() == [1, 1, 1]
+
+
+def test_dead_ants_are_compacted_out_with_their_columns_aligned():
+    grid = Grid(4, 3)
+    grid.set_cell(1, 0, CellType.DEADLY)
+    grid.set_cell(3, 0, CellType.DEADLY)
+    pheromone_grid = ArrayPheromoneGrid(4, 3)
+    # With empty Q-tables every ant goes north: ants 1 and 3 die
+    colony = due_colony([0, 1, 2, 3, 0], [1, 1, 2, 1, 2], [0, 1, 2, 0, 1], [0.1, 0.2, 0.3, 0.4, 0.5])
+    before = {name: getattr(colony, name).copy() for name in COLUMNS}
+    colony.step(grid, pheromone_grid, Rules(REWARDS), np.random.default_rng(0))
+
+    survivors = [0, 2, 4]
+    assert len(colony) == 3
+    assert colony.last_removed.tolist() == [1, 3]
+    assert colony.last_changes[0].tolist() == survivors
+    assert colony.ids.tolist() == survivors
+    for name in ("type", "speed", "max_load", "learning_rate", "discount_factor", "epsilon"):
+        assert getattr(colony, name).tolist() == before[name][survivors].tolist()
+    assert colony.x.tolist() == before["x"][survivors].tolist()
+    assert colony.y.tolist() == (before["y"][survivors] - 1).tolist()
+    assert colony.timer.tolist() == colony.speed.tolist()
+
+    # The next step works on the compacted arrays: ant 0, blocked by the
+    # edge, turns east into the other deadly cell
+    colony.timer[:] = 1
+    assert colony.step(grid, pheromone_grid, Rules(REWARDS), np.random.default_rng(0)) == 3
+    assert colony.last_removed.tolist() == [0]
+    assert colony.ids.tolist() == [2, 4] and colony.type.tolist() == [2, 1]
+    # (ant 0's first move made north the worst action of (0, 1))
+    assert list(zip(colony.x.tolist(), colony.y.tolist())) == [(2, 0), (1, 1)]
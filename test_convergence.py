@@ -0,0 +1,104 @@
+"""Fast-forward: exact without exploration, within its error bound with it."""
+import random
+
+import pytest
+
+from conftest import run, outcome, small_config
+from convergence import FastForward, _largest_ratio_change
+from simulation import Simulation
+
+MAZE = [
+    "NNWWWWWWWWWWWWW",
+    "NNW.........W.W",
+    "W.W.WWWWWWW.W.W",
+    "W...W.....W...W",
+    "WWWWW.WWW.WWW.W",
+    "W...W.W.....W.W",
+    "W.W.W.WWWWWWW.W",
+    "W.W...W.......W",
+    "W.WWWWW.WWWWWWW",
+    "W...W...W.....W",
+    "WWW.W.WWW.WWW.W",
+    "W...W.....W.W.W",
+    "W.WWWWWWWWW.W.W",
+    "W............FW",
+    "WWWWWWWWWWWWWWW",
+]
+
+
+def maze_config(epsilon, fast_forward, seed=1):
+    """A warm-started maze without dissipation, where the greedy routes hold from the start."""
+    engine = {"warm_start": "distances", "warm_start_cache": False, "history": False}
+    if fast_forward:
+        engine["fast_forward"] = {"check_interval": 500, "window": 2}
+    return {
+        "grid_width": 15, "grid_height": 15, "map": MAZE,
+        "food_quantities": {(13, 13): 10 ** 6},
+        "max_time": 12000, "seed": seed,
+        "nest": {"ants": {"Explorer": 3, "Fighter": 1, "Collector": 2}},
+        "q_learning": {"learning_rate": 0.1, "discount_factor": 0.9, "epsilon": epsilon},
+        "pheromones": {"dissipation_rate": 0.0, "food_reward": 1000, "nest_reward": 1000,
+                       "deadly_reward": -500, "move_reward": -1},
+        "engine": engine,
+    }
+
+
+def stepped_and_forwarded(epsilon, seed=1):
+    random.seed(seed)
+    stepped = run(Simulation(maze_config(epsilon, False, seed)))
+    random.seed(seed)
+    forwarded = run(Simulation(maze_config(epsilon, True, seed)))
+    return stepped, forwarded
+
+
+def test_greedy_ants_skip_ticks_exactly():
+    stepped, forwarded = stepped_and_forwarded(0.0)
+    assert forwarded.fast_forward.skipped_ticks > forwarded.time // 2
+    # Time, food, actions and ants; the Q-values of the routes are held during a jump
+    assert outcome(stepped)[0] == outcome(forwarded)[0]
+    assert stepped.food_delivered == forwarded.food_delivered > 0
+
+
+@pytest.mark.parametrize("seed", [1, 4])
+def test_exploring_ants_stay_within_the_error_bound(seed):
+    stepped, forwarded = stepped_and_forwarded(0.01, seed)
+    report = forwarded.fast_forward.report()
+    assert report["skipped_ticks"] > 0 and report["exploration_moves"] > 0
+    assert forwarded.time == stepped.time
+    assert abs(forwarded.food_delivered - stepped.food_delivered) <= report["food_error"]
+    assert abs(forwarded.grid.remaining_food - stepped.grid.remaining_food) <= report["food_error"]
+
+
+def test_exploring_ants_with_dissipation_skip_ticks_within_the_error_bound():
+    # The default exploration and a slow decay: the routes between the nest
+    # and the food hold while the cells off them fade
+    def config(fast_forward):
+        engine = {"warm_start": "distances", "warm_start_cache": False, "history": False}
+        if fast_forward:
+            engine["fast_forward"] = {"check_interval": 500, "window": 3}
+        config = small_config(engine, seed=1, max_time=8000)
+        config["food_quantities"] = dict.fromkeys(config["food_quantities"], 10 ** 6)
+        config["pheromones"]["dissipation_rate"] = 0.003
+        return config
+
+    stepped = run(Simulation(config(False)))
+    forwarded = run(Simulation(config(True)))
+    report = forwarded.fast_forward.report()
+    assert report["skipped_ticks"] > forwarded.time // 4
+    assert forwarded.time == stepped.time
+    assert abs(forwarded.food_delivered - stepped.food_delivered) <= report["food_error"]
+    assert abs(forwarded.grid.remaining_food - stepped.grid.remaining_food) <= report["food_error"]
+
+
+def test_uniform_decay_is_not_a_change():
+    values = ([1.0, -2.0, 0.5, 0.0] * 3, [0.0] * 12)
+    decayed = tuple([value * 0.25 for value in table] for table in values)
+    cells = [(0, 0), (0, 2), (1, 1)]
+    assert _largest_ratio_change(decayed, values, cells) == 0.0
+    moved = (values[0][:4] + [1.0, 2.0, 0.5, 0.0] + values[0][8:], values[1])
+    assert _largest_ratio_change(moved, values, [(0, 1)]) == 2.0
+
+
+def test_window_must_be_positive():
+    with pytest.raises(ValueError):
+        FastForward(window=0)
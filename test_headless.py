@@ -0,0 +1,34 @@
+"""Headless runner: JSONL metrics at a fixed interval, without Tkinter."""
+import io
+import json
+import subprocess
+import sys
+
+import headless
+from conftest import small_config
+
+
+def records(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def test_one_line_per_interval_then_the_end():
+    out = io.StringIO()
+    last = headless.run(small_config(max_time=1000), out, interval=250, skip_idle=False,
+                        labels={"config": "small"})
+    lines = records(out.getvalue())
+    # A run ending on a boundary only writes its end record there
+    assert [line["time"] for line in lines] == [250, 500, 750, 1000]
+    assert [line.get("end", False) for line in lines] == [False, False, False, True]
+    assert lines[-1] == last and all(line["config"] == "small" for line in lines)
+
+
+def test_main_applies_the_overrides_without_importing_tkinter(tmp_path):
+    output = tmp_path / "metrics.jsonl"
+    code = ("import sys, headless; "
+            f"headless.main(['--max-time', '300', '--seed', '2', '--set', 'q_learning.epsilon=0.5', "
+            f"'--interval', '0', '--output', {str(output)!r}]); "
+            "assert 'tkinter' not in sys.modules")
+    subprocess.run([sys.executable, "-c", code], check=True)
+    (line,) = records(output.read_text())
+    assert line["end"] and line["time"] == 300 and line["config"] == "default"
@@ -0,0 +1,51 @@
+"""Keyframe/delta history: replay of every tick and the memory bound."""
+from array import array
+
+import pytest
+
+from conftest import small_config, ant_set
+from history import HistoryStore
+from simulation import Simulation
+
+
+@pytest.mark.parametrize("engine", [{}, {"colony": "arrays"}, {"pheromone_backend": "numpy"}])
+def test_history_replays_every_tick(engine):
+    engine = dict(engine, history={"keyframe_interval": 50, "pheromone_interval": 500})
+    simulation = Simulation(small_config(engine))
+    states = {0: ant_set(simulation.ant_states())}
+    while not simulation.is_finished():
+        simulation.run_step()
+        states[simulation.time] = ant_set(simulation.ant_states())
+
+    for time, ants in states.items():
+        assert ant_set(simulation.history[time]["ants"]) == ants
+    assert simulation.historical_pheromones(1000) is not None
+
+
+def test_history_stays_under_its_byte_budget():
+    simulation = Simulation(small_config({"history": {"keyframe_interval": 50, "pheromone_interval": 0, "max_bytes": 20000}}))
+    while not simulation.is_finished():
+        simulation.run_step()
+    history = simulation.history
+    assert history.nbytes <= 20000
+    assert history.segments[0].downsampled or history.segments[0].time > 0
+    assert len(history) == simulation.time + 1
+    # The latest keyframe is always kept, so the end of the run is exact
+    assert ant_set(history[-1]["ants"]) == ant_set(simulation.ant_states())
+
+
+def test_a_snapshot_larger_than_the_budget_is_not_kept():
+    history = HistoryStore(keyframe_interval=10, pheromone_interval=5, max_bytes=2000)
+    ants = ([0, 1], [1, 2], [1, 2], [0, 0], [0, 0], [0, 0])
+    snapshots = []
+
+    def huge_snapshot():
+        snapshots.append((array('f', [0.0]) * 1000,))
+        return snapshots[-1]
+
+    for time in range(40):
+        history.record(time, ([0], [time % 3], [1], [0], [0]), [], lambda: ants, huge_snapshot)
+        assert history.nbytes <= history.max_bytes
+    assert not history.pheromones
+    assert len(snapshots) == 8  # still taken once per pheromone_interval, not every tick
+    assert history[-1]["time"] == 39
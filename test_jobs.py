@@ -0,0 +1,49 @@
+"""Job service: content-addressed keys, shared runs and the LRU result cache."""
+import asyncio
+
+import jobs
+from conftest import small_config
+from jobs import JobService, ResultCache, config_key
+
+
+def test_key_ignores_key_order_and_neutral_options(monkeypatch):
+    config = small_config({"lazy_dissipation": True})
+    reordered = dict(reversed(list(config.items())), engine={"profile": True, "lazy_dissipation": True})
+    assert config_key(config) == config_key(reordered)
+    assert config_key(config) != config_key(small_config())
+    assert config_key(dict(config, seed=None)) is None
+    assert config_key(small_config({"trajectory": "runs"})) is None
+    key = config_key(config)
+    monkeypatch.setattr(jobs, "ENGINE_VERSION", jobs.ENGINE_VERSION + 1)
+    assert config_key(config) != key
+
+
+def test_identical_requests_run_once(tmp_path):
+    async def scenario():
+        service = JobService(workers=2, cache=ResultCache(str(tmp_path)))
+        try:
+            config = small_config(max_time=300)
+            first, second = await asyncio.gather(service.submit(config, seed=1), service.submit(config, seed=1))
+            third = await service.submit(config, seed=1)
+            other = await service.submit(config, seed=2)
+        finally:
+            service.pool.shutdown()
+        return service, first, second, third, other
+
+    service, first, second, third, other = asyncio.run(scenario())
+    assert (first[1], second[1], third[1], other[1]) == ("run", "shared", "cache", "run")
+    assert first[0] == second[0] == third[0] != other[0]
+    assert service.runs == 2 and service.shared == 1
+
+
+def test_cache_evicts_the_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=30)
+    cache.put("a", {"time": 1})
+    cache.put("b", {"time": 2})
+    assert cache.get("a") == {"time": 1}
+    cache.put("c", {"time": 3})
+    assert "b" not in cache and cache.get("b") is None
+    assert cache.get("a") == {"time": 1} and cache.get("c") == {"time": 3}
+    # The order survives a restart, through the modification times
+    reopened = ResultCache(str(tmp_path), max_bytes=30)
+    assert len(reopened) == 2 and reopened.size <= 30
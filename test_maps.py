@@ -0,0 +1,56 @@
+"""Map files: text and binary formats round-trip the cells and food quantities."""
+import random
+
+import pytest
+
+from config import with_map_file
+from conftest import small_config, run, assert_same_run
+from maps import load_grid, save_binary, save_text, map_size
+from simulation import Simulation, world_grid
+
+
+def grid_state(grid):
+    quantities = {position: source.quantity for position, source in grid.food_at.items()}
+    return bytes(grid.cells), bytes(grid.valid_masks), grid.nest_position, quantities, grid.total_food
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_text_binary_round_trip_keeps_cells_and_quantities(tmp_path, use_mmap):
+    config = small_config()
+    text, binary, back = tmp_path / "map.txt", tmp_path / "map.aifmap", tmp_path / "back.txt"
+    text.write_text("\n".join(config["map"]) + "\n")
+    assert map_size(str(text)) == (20, 20)
+
+    grid = load_grid(str(text), config["food_quantities"])
+    assert grid_state(grid) == grid_state(world_grid(config))
+    save_binary(str(binary), grid)
+    assert map_size(str(binary)) == (20, 20)
+    # The quantities come from the side table of the binary map
+    assert grid_state(load_grid(str(binary), use_mmap=use_mmap)) == grid_state(grid)
+
+    save_text(str(back), load_grid(str(binary), use_mmap=use_mmap))
+    assert back.read_text() == text.read_text()
+
+
+def test_map_file_gives_the_same_run(tmp_path):
+    config = small_config()
+    binary = tmp_path / "map.aifmap"
+    save_binary(str(binary), world_grid(config))
+    from_file = with_map_file(config, str(binary))
+    del from_file["food_quantities"]
+    random.seed(1)
+    reference = run(Simulation(config))
+    random.seed(1)
+    assert_same_run(reference, run(Simulation(from_file)))
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_truncated_binary_maps_raise_value_error(tmp_path, use_mmap):
+    binary = tmp_path / "map.aifmap"
+    save_binary(str(binary), world_grid(small_config()))
+    data = binary.read_bytes()
+    # In the food table, in the cells, in the header
+    for size in (len(data) - 4, len(data) - 100, 10):
+        binary.write_bytes(data[:size])
+        with pytest.raises(ValueError):
+            load_grid(str(binary), use_mmap=use_mmap)
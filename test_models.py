@@ -0,0 +1,157 @@
+"""Grid indexes and pheromone backends."""
+import math
+import random
+
+import pytest
+
+from conftest import small_config, run, outcome
+from convergence import q_values
+from models import Grid, CellType, ACTIONS, PheromoneGrid, ArrayPheromoneGrid, SparsePheromoneGrid, np
+from simulation import Simulation
+
+
+def test_valid_actions_follow_walls_and_edges():
+    grid = Grid(4, 3)
+    grid.set_cell(1, 1, CellType.WALL)
+    for y in range(3):
+        for x in range(4):
+            expected = tuple(i for i, (dx, dy) in enumerate(ACTIONS)
+                             if 0 <= x + dx < 4 and 0 <= y + dy < 3 and (x + dx, y + dy) != (1, 1))
+            assert grid.valid_actions(x, y) == expected
+    grid.set_cell(1, 1, CellType.EMPTY)
+    assert grid.valid_actions(1, 0) == (1, 2, 3)
+
+
+def test_grid_rows_read_the_cell_codes():
+    grid = Grid(3, 2)
+    grid.set_cell(2, 0, CellType.FOOD, quantity=5)
+    grid.set_cell(0, 1, CellType.NEST)
+    assert grid.grid[0][2] == CellType.FOOD and grid.grid[1][0] == CellType.NEST
+    assert [list(row) for row in grid.grid] == [
+        [CellType.EMPTY, CellType.EMPTY, CellType.FOOD],
+        [CellType.NEST, CellType.EMPTY, CellType.EMPTY],
+    ]
+    assert len(grid.grid) == 2 and len(grid.grid[0]) == 3
+
+
+def test_grid_rows_write_the_cell_codes():
+    grid = Grid(3, 2)
+    grid.set_cell(2, 0, CellType.FOOD, quantity=5)
+    grid.grid[1][1] = CellType.WALL
+    assert grid.cell_code(1, 1) == CellType.WALL.value
+    assert grid.valid_actions(1, 0) == (1, 3)  # the wall below is no longer a move
+    grid.grid[0][2] = CellType.EMPTY
+    assert grid.grid[0][2] == CellType.EMPTY and (2, 0) not in grid.food_at
+    with pytest.raises(IndexError):
+        grid.grid[0][3] = CellType.WALL
+    with pytest.raises(TypeError):
+        grid.grid[0] = [CellType.EMPTY] * 3
+
+
+def assert_close_tables(a, b):
+    for row_a, row_b in zip(a, b):
+        assert all(math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-12) for x, y in zip(row_a, row_b))
+
+
+def test_food_index_and_totals_follow_pickups_to_exhaustion():
+    grid = Grid(4, 3)
+    grid.set_cell(1, 1, CellType.FOOD, quantity=3)
+    grid.set_cell(3, 2, CellType.FOOD, quantity=4)
+    first, second = grid.food_sources
+    assert grid.food_at == {(1, 1): first, (3, 2): second}
+    assert grid.total_food == grid.remaining_food == 7
+
+    assert grid.take_food(first, 2) == 2 and grid.remaining_food == 5
+    assert not grid.exhausted_food
+    assert grid.take_food(first, 5) == 1 and grid.remaining_food == 4
+    assert grid.exhausted_food == [first]
+    # Exhausted but not cleared yet: still indexed and still a food cell
+    assert grid.food_at[(1, 1)] is first and grid.grid[1][1] == CellType.FOOD
+    assert grid.take_food(first, 1) == 0 and grid.exhausted_food == [first]
+
+    grid.clear_exhausted_food()
+    assert not grid.exhausted_food
+    assert grid.food_at == {(3, 2): second}
+    assert grid.grid[1][1] == CellType.EMPTY and grid.grid[2][3] == CellType.FOOD
+    assert grid.remaining_food == 4 and grid.total_food == 7
+    assert grid.remaining_food == sum(fs.quantity for fs in grid.food_at.values())
+
+    assert grid.take_food(second, 10) == 4 and grid.remaining_food == 0
+    grid.clear_exhausted_food()
+    assert grid.food_at == {} and grid.grid[2][3] == CellType.EMPTY
+
+
+def test_food_index_of_a_loaded_map():
+    cells = bytearray(4 * 3)
+    cells[1 * 4 + 1] = cells[2 * 4 + 3] = CellType.FOOD.value
+    grid = Grid.from_cells(4, 3, cells, food_quantities={(1, 1): 6})
+    assert sorted(grid.food_at) == [(1, 1), (3, 2)]
+    assert grid.food_at[(1, 1)].quantity == 6 and grid.food_at[(3, 2)].quantity == 1000
+    assert grid.remaining_food == grid.total_food == 1006
+    grid.take_food(grid.food_at[(1, 1)], 6)
+    grid.clear_exhausted_food()
+    assert sorted(grid.food_at) == [(3, 2)] and grid.cell_code(1, 1) == CellType.EMPTY.value
+    assert grid.remaining_food == 1000
+
+
+@pytest.mark.skipif(np is None, reason="NumPy is not installed")
+@pytest.mark.parametrize("lazy", [False, True])
+def test_numpy_backend_matches_the_python_one(lazy):
+    random.seed(1)
+    reference = run(Simulation(small_config({"lazy_dissipation": lazy})), 400)
+    random.seed(1)
+    vectorized = run(Simulation(small_config({"lazy_dissipation": lazy, "pheromone_backend": "numpy"})), 400)
+    assert isinstance(vectorized.pheromone_grid, ArrayPheromoneGrid)
+    assert outcome(reference)[0] == outcome(vectorized)[0]
+    assert_close_tables(q_values(reference.pheromone_grid), q_values(vectorized.pheromone_grid))
+
+    wall_mask = reference.grid.wall_mask()
+    assert any(any(row) for row in wall_mask)
+    for table in ("food_q_table", "nest_q_table"):
+        q_ref, q_vec = getattr(reference.pheromone_grid, table), getattr(vectorized.pheromone_grid, table)
+        for mask in (None, wall_mask):
+            assert_close_tables(reference.pheromone_grid.cell_max(q_ref, mask),
+                                vectorized.pheromone_grid.cell_max(q_vec, mask).tolist())
+            assert_close_tables(reference.pheromone_grid.heatmap(q_ref, mask),
+                                vectorized.pheromone_grid.heatmap(q_vec, mask).tolist())
+            assert reference.pheromone_grid.cell_argmax(q_ref, mask) == \
+                vectorized.pheromone_grid.cell_argmax(q_vec, mask).tolist()
+
+
+@pytest.mark.skipif(np is None, reason="NumPy is not installed")
+def test_numpy_backend_breaks_argmax_ties_like_the_python_one():
+    grids = PheromoneGrid(3, 1), ArrayPheromoneGrid(3, 1)
+    for pheromone_grid in grids:
+        pheromone_grid.food_q_table[0][1][:] = [0.5, 2.0, 2.0, 0.0]
+        pheromone_grid.food_q_table[0][2][:] = [-1.0, -1.0, -3.0, -1.0]
+    mask = [[False, False, True]]
+    reference, vectorized = (g.cell_argmax(g.food_q_table, mask) for g in grids)
+    assert reference == vectorized.tolist() == [[0, 1, -1]]
+    reference, vectorized = (g.heatmap(g.food_q_table, mask) for g in grids)
+    assert reference == vectorized.tolist() == [[0.0, 1.0, 0.0]]
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_sparse_backend_matches_the_dense_one(lazy):
+    random.seed(1)
+    dense = run(Simulation(small_config({"lazy_dissipation": lazy})))
+    random.seed(1)
+    sparse = run(Simulation(small_config({"lazy_dissipation": lazy, "pheromone_backend": "sparse",
+                                          "sparse_threshold": 0})))
+    assert outcome(dense)[0] == outcome(sparse)[0]
+    for a, b in zip(q_values(dense.pheromone_grid), q_values(sparse.pheromone_grid)):
+        assert all(math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-9) for x, y in zip(a, b))
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_sparse_grid_stores_visited_cells_and_evicts_faded_ones(lazy):
+    pheromone_grid = SparsePheromoneGrid(1000, 1000, 0.5, lazy, threshold=1e-3, sweep_interval=1)
+    pheromone_grid.sync_cell(7, 5)
+    pheromone_grid.food_q_table[5][7][1] = 1.0
+    pheromone_grid.dissipate(5)
+    pheromone_grid.sync_cell(7, 5)
+    assert pheromone_grid.food_q_table[5][7] == [0.0, 1 / 32, 0.0, 0.0]
+    assert sum(len(row) for row in pheromone_grid.food_q_table) == 1
+    pheromone_grid.dissipate(5)
+    assert sum(len(row) for row in pheromone_grid.food_q_table) == 0
+    assert pheromone_grid.food_q_table[5][7] == [0.0] * 4
@@ -0,0 +1,34 @@
+"""Profiling must not change a run, and its counters must add up."""
+import random
+
+import pytest
+
+from conftest import small_config, run, assert_same_run
+from profiler import Profiler
+from simulation import Simulation
+
+
+@pytest.mark.parametrize("engine", [
+    {},
+    {"scheduler": "event", "lazy_dissipation": True},
+    {"colony": "arrays"},
+])
+def test_profiled_run_matches_and_counts(engine):
+    random.seed(1)
+    plain = run(Simulation(small_config(engine)))
+    profiler = Profiler(hook_interval=100)
+    calls = []
+    profiler.subscribe(lambda time, p: calls.append(time))
+    random.seed(1)
+    profiled = run(Simulation(small_config(engine), profiler=profiler))
+    assert_same_run(plain, profiled)
+
+    counts = profiler.counts
+    ants = sum(small_config()["nest"]["ants"].values())
+    assert counts["ticks"] == profiled.time
+    assert counts["actions"] == profiled.actions_taken
+    assert counts["explorations"] + counts["exploitations"] == counts["actions"]
+    assert counts["deaths"] == ants - len(profiled.ants)
+    assert counts["pickups"] > 0 and counts["q_cells"] > 0
+    assert len(calls) >= profiled.time // 100 - 1 and calls == sorted(calls)
+    assert sum(profiler.times.values()) > 0
@@ -0,0 +1,102 @@
+"""Viewport culling and level-of-detail blocks, checked without Tk."""
+import random
+
+from renderer import BlockPyramid, Viewport, CanvasRenderer
+
+
+class FakeCanvas:
+    """The few Tk canvas calls the renderer makes, recording the live items."""
+
+    def __init__(self):
+        self.items = {}
+        self.next_id = 1
+
+    def _create(self, kind, coords, options):
+        item = self.next_id
+        self.next_id += 1
+        self.items[item] = (kind, list(coords), options)
+        return item
+
+    def create_rectangle(self, *coords, **options):
+        return self._create("rectangle", coords, options)
+
+    def create_oval(self, *coords, **options):
+        return self._create("oval", coords, options)
+
+    def delete(self, item):
+        if item == "all":
+            self.items.clear()
+        else:
+            del self.items[item]
+
+    def itemconfigure(self, item, **options):
+        self.items[item][2].update(options)
+
+    def coords(self, item, *coords):
+        self.items[item][1][:] = coords
+
+    def move(self, tag, dx, dy):
+        for _, coords, _ in self.items.values():
+            coords[0::2] = [x + dx for x in coords[0::2]]
+            coords[1::2] = [y + dy for y in coords[1::2]]
+
+    def tag_lower(self, tag):
+        pass
+
+    def tag_raise(self, tag):
+        pass
+
+    def count(self, kind, **options):
+        return sum(1 for k, _, item_options in self.items.values()
+                   if k == kind and all(item_options.get(key) == value for key, value in options.items()))
+
+
+def test_pyramid_updates_match_a_rebuild():
+    rng = random.Random(3)
+    width, height = 13, 7
+    values = bytearray(rng.randrange(4) for _ in range(width * height))
+    pyramid = BlockPyramid(width, height, values)
+    assert pyramid.sizes[-1] == (1, 1) and pyramid.levels[-1][0] == max(values)
+    for _ in range(20):
+        indices = rng.sample(range(width * height), 5)
+        new = [rng.randrange(4) for _ in indices]
+        pyramid.update(indices, new)
+        for i, value in zip(indices, new):
+            values[i] = value
+        assert pyramid.levels == BlockPyramid(width, height, values).levels
+
+
+def test_viewport_level_and_window():
+    viewport = Viewport(100, 50, 0.5)
+    # Half-pixel cells: blocks of 8 x 8 cells are the first ones 4 pixels wide
+    assert viewport.level(4, 10) == 3
+    viewport = Viewport(100, 50, 10)
+    viewport.x0, viewport.y0 = 5.5, 2
+    assert viewport.window(0, 1000, 1000) == (5, 2, 16, 8)
+    viewport.clamp(12, 1000)
+    assert viewport.x0 == 2.0
+
+
+def test_renderer_only_draws_the_visible_part():
+    width = height = 200
+    cells = bytearray(width * height)
+    cells[:] = bytes([1]) * len(cells)  # walls everywhere
+    canvas = FakeCanvas()
+    renderer = CanvasRenderer(canvas, cell_size=10, width=100, height=100, min_block_pixels=4)
+    ants = [{"x": x, "y": x, "type": "Explorer"} for x in range(0, 200, 5)]
+    renderer.draw(width, height, cells, ants)
+    # The whole grid fits at 0.5 pixel per cell: 8 x 8 blocks, 25 x 25 of them
+    assert renderer._level == 3 and canvas.count("rectangle", tags="terrain") == 25 * 25
+
+    renderer.zoom(20, 0, 0)  # 10 pixels per cell: 10 x 10 cells on screen
+    assert renderer._level == 0
+    assert canvas.count("rectangle", tags="terrain") == 11 * 11
+    visible = [item for item in canvas.items.values() if item[0] == "oval" and item[2].get("state") != "hidden"]
+    # The ants on (0, 0), (5, 5) and (10, 10), at the edge of the window
+    assert len(visible) == 3
+
+    renderer.pan(-500, 0)  # 50 cells to the right
+    assert canvas.count("rectangle", tags="terrain") == 11 * 11
+    # A wall cleared on screen removes its rectangle, one cleared off screen nothing
+    renderer.draw_changes({5 * width + 55: 0, 150 * width + 150: 0}, ants)
+    assert canvas.count("rectangle", tags="terrain") == 11 * 11 - 1
@@ -0,0 +1,42 @@
+"""Rules tables against the if/elif chains they replaced, for every mode and cell code."""
+import pytest
+
+from models import ANT_MODES, AntMode, FOOD_CODE, NEST_CODE, DEADLY_CODE
+from rules import Rules, MOVE, PICKUP, DROP, DEATH, np
+
+REWARDS = {"food_reward": 1000, "nest_reward": 800, "deadly_reward": -500, "move_reward": -1}
+
+
+def branch_reward(mode, cell):
+    """Simulation._get_reward before the tables."""
+    if cell == DEADLY_CODE:
+        return REWARDS["deadly_reward"]
+    if mode == AntMode.SEARCHING_FOOD and cell == FOOD_CODE:
+        return REWARDS["food_reward"]
+    if mode == AntMode.RETURNING_TO_NEST and cell == NEST_CODE:
+        return REWARDS["nest_reward"]
+    return REWARDS["move_reward"]
+
+
+def branch_effect(mode, cell):
+    """Simulation._handle_environment_interaction and the deadly-cell check before the tables."""
+    if cell == FOOD_CODE and mode == AntMode.SEARCHING_FOOD:
+        return PICKUP
+    if cell == NEST_CODE and mode == AntMode.RETURNING_TO_NEST:
+        return DROP
+    if cell == DEADLY_CODE:
+        return DEATH
+    return MOVE
+
+
+@pytest.mark.parametrize("mode", ANT_MODES)
+def test_tables_match_the_branch_chain(mode):
+    rules = Rules(REWARDS)
+    rewards, effects = rules.by_mode[mode]
+    index = ANT_MODES.index(mode)
+    for cell in range(256):
+        assert rewards[cell] == branch_reward(mode, cell)
+        assert effects[cell] == branch_effect(mode, cell)
+        if np is not None:
+            assert rules.reward_table[index, cell] == branch_reward(mode, cell)
+            assert rules.effect_table[index, cell] == branch_effect(mode, cell)
@@ -0,0 +1,41 @@
+"""Simulation engine options that must not change a seeded run."""
+import random
+
+import pytest
+
+from conftest import small_config, run, assert_same_run
+from simulation import Simulation
+
+
+@pytest.mark.parametrize("engine", [
+    {},
+    {"colony": "arrays"},
+    {"pheromone_backend": "numpy"},
+    {"pheromone_backend": "sparse"},
+])
+def test_lazy_dissipation_matches_eager(engine):
+    random.seed(1)
+    eager = run(Simulation(small_config(dict(engine, lazy_dissipation=False))))
+    random.seed(1)
+    lazy = run(Simulation(small_config(dict(engine, lazy_dissipation=True))))
+    assert_same_run(eager, lazy)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_event_scheduler_matches_tick(lazy):
+    random.seed(1)
+    tick = run(Simulation(small_config({"scheduler": "tick", "lazy_dissipation": lazy})))
+    random.seed(1)
+    event = run(Simulation(small_config({"scheduler": "event", "lazy_dissipation": lazy})))
+    assert_same_run(tick, event)
+
+
+@pytest.mark.parametrize("scheduler", ["tick", "event"])
+def test_skipping_idle_ticks_matches_stepping_them(scheduler):
+    random.seed(1)
+    stepped = Simulation(small_config({"scheduler": scheduler}))
+    while not stepped.is_finished():
+        stepped.run_step()
+    random.seed(1)
+    skipped = run(Simulation(small_config({"scheduler": scheduler})))
+    assert_same_run(stepped, skipped)
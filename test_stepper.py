@@ -0,0 +1,98 @@
+"""Background stepping and the incremental frames it publishes."""
+import random
+import threading
+import time
+
+import pytest
+
+from conftest import small_config, run, outcome, assert_same_run
+from renderer import heat_buckets
+from simulation import Simulation
+from stepper import HeatTracker, BackgroundStepper
+
+
+@pytest.mark.parametrize("engine", [
+    {},
+    {"lazy_dissipation": True},
+    {"pheromone_backend": "numpy"},
+    {"colony": "arrays", "lazy_dissipation": True},
+])
+@pytest.mark.parametrize("view", ["food", "nest"])
+def test_heat_tracker_matches_full_buckets(engine, view):
+    config = small_config(engine, max_time=3000)
+    config["pheromones"] = dict(config["pheromones"], dissipation_rate=0.001)
+    random.seed(1)
+    simulation = Simulation(config)
+    tracker = HeatTracker(simulation, view)
+    buckets = bytearray(heat_buckets(tracker.heatmap))
+    while not simulation.is_finished():
+        run(simulation, 25)
+        changes = tracker.update(simulation)
+        assert changes is not None
+        for i, bucket in changes.items():
+            buckets[i] = bucket
+        pheromone_grid = simulation.pheromone_grid
+        q_table = pheromone_grid.food_q_table if view == "food" else pheromone_grid.nest_q_table
+        assert bytes(buckets) == bytes(heat_buckets(pheromone_grid.heatmap(q_table)))
+    assert view == "nest" or sum(1 for bucket in buckets if bucket) > 10
+
+
+@pytest.mark.parametrize("backend", ["python", "numpy", "sparse"])
+def test_drawing_heatmaps_leaves_a_lazy_grid_untouched(backend):
+    engine = {"lazy_dissipation": True, "pheromone_backend": backend}
+    random.seed(1)
+    plain = run(Simulation(small_config(engine)), 300)
+    random.seed(1)
+    drawn = Simulation(small_config(engine))
+    tracker = HeatTracker(drawn, "food")
+    for _ in range(12):
+        run(drawn, 25)
+        pheromone_grid = drawn.pheromone_grid
+        stamps = repr(pheromone_grid.last_decayed)
+        tracker.update(drawn)
+        for q_table in (pheromone_grid.food_q_table, pheromone_grid.nest_q_table):
+            pheromone_grid.heatmap(q_table)
+            pheromone_grid.cell_max(q_table, drawn.grid.wall_mask())
+            pheromone_grid.cell_argmax(q_table)
+        assert repr(pheromone_grid.last_decayed) == stamps
+    # Bit for bit: syncing would have changed the rounding of the decayed cells
+    assert outcome(plain) == outcome(drawn)
+
+
+def test_background_stepper_runs_the_same_simulation():
+    # Small sources, so that some run out and their cells are cleared
+    config = small_config({"rng": "streams", "clear_exhausted_food": True})
+    config["food_quantities"] = dict.fromkeys(config["food_quantities"], 10)
+    stepper = BackgroundStepper(Simulation(config), view="food", publish_hz=1000)
+    frame = stepper.latest()
+    cells = bytearray(frame["cells"])
+    frame_zero = bytes(cells)
+    stepper.resume()
+    while not frame["finished"]:
+        time.sleep(0.001)
+        frame = stepper.latest()
+        if frame["full"]:
+            cells = bytearray(frame["cells"])
+        else:
+            for i, code in frame["cell_changes"].items():
+                cells[i] = code
+    stepper.stop()
+    simulation = stepper.simulation
+    assert bytes(cells) == bytes(simulation.grid.cells) != frame_zero
+    assert_same_run(simulation, run(Simulation(config)))
+
+
+def test_pause_stops_a_worker_waiting_for_the_lock():
+    stepper = BackgroundStepper(Simulation(small_config()), publish_hz=1)
+    # The worker wakes up and blocks on the lock, then pause() clears the
+    # flag and blocks too: whichever gets the lock first, no step runs.
+    with stepper.lock:
+        stepper.resume()
+        time.sleep(0.05)
+        pausing = threading.Thread(target=stepper.pause)
+        pausing.start()
+        time.sleep(0.05)
+    pausing.join()
+    time.sleep(0.05)
+    assert stepper.simulation.time == stepper.latest()["time"] == 0
+    stepper.stop()
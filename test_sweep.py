@@ -0,0 +1,34 @@
+"""Parameter sweep: resumable log keyed on the parameters and the base config."""
+import json
+
+from conftest import small_config
+from sweep import Sweep, grid_search
+
+SPACE = {"q_learning.epsilon": [0.05, 0.2]}
+
+
+def log_lines(path):
+    with open(path) as log:
+        return [json.loads(line) for line in log]
+
+
+def test_resumed_sweep_reuses_the_logged_runs(tmp_path):
+    path = str(tmp_path / "sweep.jsonl")
+    base = small_config(max_time=300)
+    first = Sweep(base, grid_search(SPACE), seeds=(0, 1), workers=2, log_path=path).run()
+    assert len(log_lines(path)) == 4
+
+    resumed = Sweep(base, grid_search(SPACE), seeds=(0, 1), workers=2, log_path=path)
+    assert len(resumed.done) == 4
+    assert resumed.run() == first
+    assert len(log_lines(path)) == 4
+
+
+def test_another_base_config_does_not_reuse_the_log(tmp_path):
+    path = str(tmp_path / "sweep.jsonl")
+    Sweep(small_config(max_time=300), grid_search(SPACE), seeds=(0,), workers=2, log_path=path).run()
+    other = small_config(max_time=300)
+    other["pheromones"] = dict(other["pheromones"], move_reward=-2)
+    Sweep(other, grid_search(SPACE), seeds=(0,), workers=2, log_path=path).run()
+    entries = log_lines(path)
+    assert len(entries) == 4 and len({entry["key"] for entry in entries}) == 4
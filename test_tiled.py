@@ -0,0 +1,36 @@
+"""Tiled execution: any tiling gives the run of a single tile and of Simulation."""
+import pytest
+
+from conftest import small_config, run
+from simulation import Simulation
+from tiled import TiledSimulation
+
+
+def tiled_outcome(tiles):
+    with TiledSimulation(small_config({"colony": "arrays", "rng": "streams"}), tiles) as simulation:
+        run(simulation)
+        food_q, nest_q = simulation.pheromone_grid.snapshot()
+        return (simulation.time, simulation.remaining_food, simulation.actions_taken,
+                [column.tolist() for column in simulation.ant_columns()],
+                food_q.tobytes(), nest_q.tobytes(), str(simulation.history[simulation.time // 2]))
+
+
+@pytest.mark.parametrize("tiles", [(2, 2), (3, 2), (1, 4)])
+def test_tiled_matches_single_tile(tiles):
+    assert tiled_outcome(tiles) == tiled_outcome((1, 1))
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_tiled_matches_simulation(lazy):
+    config = small_config({"colony": "arrays", "rng": "streams", "lazy_dissipation": lazy})
+    simulation = run(Simulation(config))
+    with TiledSimulation(config, (2, 2)) as tiled:
+        run(tiled)
+        assert (tiled.time, tiled.remaining_food, tiled.actions_taken) == \
+            (simulation.time, simulation.grid.remaining_food, simulation.actions_taken)
+        assert [column.tolist() for column in tiled.ant_columns()] == \
+            [column.tolist() for column in simulation.ant_columns()]
+        for tiled_q, q in zip(tiled.pheromone_grid.snapshot(), simulation.pheromone_grid.snapshot()):
+            assert tiled_q.tobytes() == q.tobytes()
+        for time in (0, simulation.time // 3, simulation.time):
+            assert str(tiled.history[time]) == str(simulation.history[time])
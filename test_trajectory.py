@@ -0,0 +1,33 @@
+"""Trajectory log: replay of every tick from disk, and no implicit overwrite."""
+import pytest
+
+from conftest import small_config, ant_set
+from simulation import Simulation
+from trajectory import TrajectoryReader
+
+
+@pytest.mark.parametrize("engine", [{}, {"colony": "arrays"}, {"pheromone_backend": "sparse"}])
+def test_trajectory_replays_every_tick(tmp_path, engine):
+    path = str(tmp_path / "run.traj")
+    engine = dict(engine, trajectory={"path": path, "keyframe_interval": 37, "frame_interval": 500},
+                  history=False)
+    simulation = Simulation(small_config(engine))
+    states = {0: ant_set(simulation.ant_states())}
+    while not simulation.is_finished():
+        simulation.run_step()
+        states[simulation.time] = ant_set(simulation.ant_states())
+    simulation.close_trajectory()
+
+    reader = TrajectoryReader(path)
+    assert len(reader) == simulation.time + 1
+    for time, ants in states.items():
+        assert ant_set(reader[time]["ants"]) == ants
+    assert reader.frame_at(1000) is not None
+
+
+def test_an_existing_log_is_not_overwritten(tmp_path):
+    path = str(tmp_path / "run.traj")
+    Simulation(small_config({"trajectory": path})).close_trajectory()
+    with pytest.raises(FileExistsError):
+        Simulation(small_config({"trajectory": path}))
+    Simulation(small_config({"trajectory": {"path": path, "overwrite": True}})).close_trajectory()
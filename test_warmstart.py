@@ -0,0 +1,72 @@
+"""Warm start: BFS distance fields and the Q-values they give."""
+import os
+
+import pytest
+
+from conftest import small_config
+from convergence import q_values
+from models import Grid
+from simulation import Simulation, setup_world
+from warmstart import UNREACHABLE, distance_fields, cached_distance_fields, distance_q_values
+
+MAZE = [
+    "N.W..",
+    ".WW.F",
+    "...D.",
+]
+U = UNREACHABLE
+
+
+def maze_grid():
+    grid = Grid(5, 3)
+    setup_world(grid, MAZE, {})
+    return grid
+
+
+def test_distance_fields_go_around_walls_and_deadly_cells():
+    nest, food = distance_fields(maze_grid())
+    assert list(nest) == [0, 1, U, U, U,
+                          1, U, U, U, U,
+                          2, 3, 4, U, U]
+    assert list(food) == [U, U, U, 2, 1,
+                          U, U, U, 1, 0,
+                          U, U, U, U, 1]
+
+
+def test_distance_fields_are_cached_per_map(tmp_path):
+    grid = maze_grid()
+    fields = cached_distance_fields(grid, str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 1
+    assert cached_distance_fields(grid, str(tmp_path)) == fields == distance_fields(grid)
+
+
+def test_q_values_follow_the_shortest_path():
+    grid = maze_grid()
+    nest, _ = distance_fields(grid)
+    rewards = {"move_reward": -1, "deadly_reward": -500}
+    gamma = 0.9
+    table = distance_q_values(grid, nest, 1000, rewards, gamma)
+
+    def q(x, y, action):
+        return table[(y * 5 + x) * 4 + action]
+
+    def path_value(d):
+        return -1 * (1 - gamma ** d) / (1 - gamma) + gamma ** d * 1000
+
+    # From (1, 2), west reaches (0, 2), two moves from the nest
+    assert q(1, 2, 3) == pytest.approx(path_value(2))
+    # East of (2, 2) is the deadly cell, north a wall (no value)
+    assert q(2, 2, 1) == -500 and q(2, 2, 0) == 0.0
+    # Every reachable cell prefers the move towards the nest
+    for x, y, best in ((1, 0, 3), (0, 1, 0), (0, 2, 0), (1, 2, 3), (2, 2, 3)):
+        valid = grid.valid_actions(x, y)
+        assert max(valid, key=lambda action: q(x, y, action)) == best
+
+
+@pytest.mark.parametrize("backend", ["python", "numpy", "sparse"])
+def test_every_backend_starts_from_the_same_tables(tmp_path, backend):
+    config = small_config({"warm_start": "distances", "warm_start_cache": str(tmp_path),
+                           "pheromone_backend": backend, "lazy_dissipation": True})
+    reference = small_config({"warm_start": "distances", "warm_start_cache": False})
+    assert q_values(Simulation(config).pheromone_grid)[1].tolist() == \
+        q_values(Simulation(reference).pheromone_grid)[1].tolist()
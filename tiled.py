@@ -0,0 +1,528 @@
+"""Runs one large world across several processes, split into rectangular tiles.
+
+Each tile belongs to a worker process that steps the ants standing on it.
+The terrain, both Q-tables, the lazy-decay stamps and the food quantities
+live in shared memory, so a worker writes its own cells in place and reads
+the cells just past its border (the halo) straight from its neighbours'
+memory. A tick runs in two phases separated by a barrier:
+
+    read     every due ant chooses and scores its move against the Q-tables
+             as they were at the start of the tick; Q writes are kept
+             pending and the ants that left the tile are handed back
+    commit   each worker applies its pending writes, takes in the ants that
+             arrived, resolves pickups, drops and deaths, and dissipates
+
+The rules and random streams are those of the "arrays" colony (see
+colony.py and rng.py): every draw is a function of the seed, the ant id and
+the tick, so the run is the same as Simulation(config) with the "arrays"
+colony, whatever the tiling or the number of workers.
+Time, termination and the history are handled globally by the parent.
+
+Needs NumPy. Scripts using it must create the simulation under
+``if __name__ == "__main__":`` since the workers are spawned.
+"""
+import multiprocessing
+import random
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from colony import Colony, COLUMNS, SEARCHING, RETURNING, ACTION_DX, ACTION_DY, ACTION_BITS
+from history import HistoryStore
+from trajectory import create_trajectory
+from models import ArrayPheromoneGrid, CellType, WALL_CODE, FOOD_CODE, NEST_CODE
+from rules import Rules, PICKUP, DROP, DEATH
+from maps import load_grid
+from rng import AntStreams
+from simulation import create_ants
+
+# Map character -> cell code (anything else is an empty cell, as in setup_world)
+CELL_CODES = np.zeros(256, dtype=np.uint8)
+for _char, _cell_type in (("W", CellType.WALL), ("N", CellType.NEST), ("F", CellType.FOOD), ("D", CellType.DEADLY)):
+    CELL_CODES[ord(_char)] = _cell_type.value
+
+
+def build_world(config):
+    """Returns (cells, valid_masks, food_keys, food, nest_position) for a config, without a Grid.
+
+    `food_keys` are the sorted flat indices (y * width + x) of the food cells
+    and `food` their quantities. The result matches setup_world on a Grid.
+    A "map_file" is loaded with maps.load_grid, whose cells and masks are
+    used as they are.
+    """
+    if config.get("map_file"):
+        grid = load_grid(config["map_file"], config.get("food_quantities", {}))
+        shape = (grid.height, grid.width)
+        food_keys = np.array([fs.y * grid.width + fs.x for fs in grid.food_sources], dtype=np.int64)
+        food = np.array([fs.quantity for fs in grid.food_sources], dtype=np.int64)
+        return (np.frombuffer(grid.cells, dtype=np.uint8).reshape(shape),
+                np.frombuffer(grid.valid_masks, dtype=np.uint8).reshape(shape),
+                food_keys, food, grid.nest_position)
+
+    width, height = config["grid_width"], config["grid_height"]
+    rows = ["".join(row)[:width].ljust(width, ".") for row in config["map"][:height]]
+    rows += ["." * width] * (height - len(rows))
+    cells = CELL_CODES[np.frombuffer("".join(rows).encode("latin-1"), dtype=np.uint8)].reshape(height, width)
+
+    # Bit i is set when action i (N, E, S, W) stays on the grid and avoids walls
+    open_cells = (cells != WALL_CODE).astype(np.uint8)
+    masks = np.zeros((height, width), dtype=np.uint8)
+    masks[1:, :] |= open_cells[:-1, :]
+    masks[:, :-1] |= open_cells[:, 1:] << 1
+    masks[:-1, :] |= open_cells[1:, :] << 2
+    masks[:, 1:] |= open_cells[:, :-1] << 3
+
+    food_keys = np.flatnonzero(cells == FOOD_CODE)
+    quantities = config.get("food_quantities", {})
+    food = np.array([quantities.get((key % width, key // width), 1000) for key in food_keys.tolist()], dtype=np.int64)
+
+    nests = np.flatnonzero(cells == NEST_CODE)
+    nest = (int(nests[-1] % width), int(nests[-1] // width)) if len(nests) else None
+    return cells, masks, food_keys, food, nest
+
+
+def _create_shared(layout):
+    """Allocates one shared block per {name: (shape, dtype)}; returns (blocks, arrays, spec)."""
+    blocks, arrays, spec = {}, {}, {}
+    for name, (shape, dtype) in layout.items():
+        size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        blocks[name] = block
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        spec[name] = (block.name, shape, dtype)
+    return blocks, arrays, spec
+
+
+def _attach_shared(spec):
+    """Maps the blocks described by a _create_shared spec; returns (blocks, arrays)."""
+    blocks, arrays = {}, {}
+    for name, (block_name, shape, dtype) in spec.items():
+        blocks[name] = shared_memory.SharedMemory(name=block_name)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+    return blocks, arrays
+
+
+class _Tile:
+    """One tile of the world and its ants, held by a worker process."""
+
+    def __init__(self, spec, columns):
+        self.blocks, arrays = _attach_shared(spec["arrays"])
+        self.cells, self.masks = arrays["cells"], arrays["masks"]
+        self.food_q_table, self.nest_q_table = arrays["food_q_table"], arrays["nest_q_table"]
+        self.last_decayed = arrays.get("last_decayed")
+        self.food_keys, self.food = arrays["food_keys"], arrays["food"]
+        self.height, self.width = self.cells.shape
+        self.x0, self.x1, self.y0, self.y1 = spec["bounds"]
+
+        self.rules = Rules(spec["rewards"])
+        self.streams = AntStreams(spec["seed"])
+        self.decay_factor = spec["decay_factor"]
+        self.lazy = self.last_decayed is not None
+        self.decay_steps = 0
+
+        self.colony = Colony.from_columns(columns)
+        self.acted = np.zeros(0, dtype=np.int64)
+        self.writes = None
+
+    def close(self):
+        # Drop the views before unmapping the blocks
+        self.cells = self.masks = self.food_q_table = self.nest_q_table = None
+        self.last_decayed = self.food_keys = self.food = None
+        for block in self.blocks.values():
+            block.close()
+
+    def _q_values(self, table, y, x):
+        """Q-values of the given cells, decayed up to date without writing them back."""
+        if not self.lazy:
+            return table[y, x]
+        return table[y, x] * (self.decay_factor ** (self.decay_steps - self.last_decayed[y, x]))[:, None]
+
+    def read(self, tick):
+        """First phase of a tick; returns (the ants that left the tile as columns or None, ants due)."""
+        colony = self.colony
+        colony.timer -= 1
+        due = np.flatnonzero(colony.timer <= 0)
+        ids = colony.ids[due]
+        self.acted = ids
+        self.writes = None
+        self.streams.tick = tick
+        n = len(due)
+        if n == 0:
+            return None, 0
+        x, y, mode = colony.x[due], colony.y[due], colony.mode[due]
+        rules = self.rules
+
+        searching = mode == SEARCHING
+        q_old = np.where(searching[:, None], self._q_values(self.food_q_table, y, x),
+                         self._q_values(self.nest_q_table, y, x))
+        valid = (self.masks[y, x, None] >> ACTION_BITS) & 1 == 1
+        n_valid = valid.sum(axis=1)
+
+        best = np.where(valid, q_old, -np.inf).argmax(axis=1)
+        explore = self.streams.uniforms(ids, 0) < colony.epsilon[due]
+        pick = (self.streams.uniforms(ids, 1) * n_valid).astype(np.int64)
+        random_action = (valid.cumsum(axis=1) > pick[:, None]).argmax(axis=1)
+        action = np.where(explore, random_action, best)
+
+        moving = n_valid > 0
+        nx = x + np.where(moving, ACTION_DX[action], 0)
+        ny = y + np.where(moving, ACTION_DY[action], 0)
+
+        reward = rules.reward_table[mode, self.cells[ny, nx]]
+
+        # The next cell may belong to a neighbouring tile: it is only read
+        q_future = np.where(searching[:, None], self._q_values(self.food_q_table, ny, nx),
+                            self._q_values(self.nest_q_table, ny, nx))
+        old_value = q_old[np.arange(n), action]
+        new_value = old_value + colony.learning_rate[due] * \
+            (reward + colony.discount_factor[due] * q_future.max(axis=1) - old_value)
+
+        # Same (table, cell, action) updated twice: the last ant by id wins.
+        # Those ants stand on the same cell, so always in the same tile.
+        key = ((mode.astype(np.int64) * self.height + y) * self.width + x) * 4 + action
+        _, last_rev = np.unique(key[::-1], return_index=True)
+        keep = np.zeros(n, dtype=bool)
+        keep[n - 1 - last_rev] = True
+        keep &= moving
+        self.writes = (searching[keep], y[keep], x[keep], action[keep], new_value[keep])
+
+        colony.x[due] = nx
+        colony.y[due] = ny
+        colony.timer[due] = colony.speed[due]
+
+        leaving = (colony.x < self.x0) | (colony.x >= self.x1) | (colony.y < self.y0) | (colony.y >= self.y1)
+        return (colony.take(leaving) if leaving.any() else None), n
+
+    def commit(self, immigrants):
+        """Second phase of a tick.
+
+        Returns (changes, removed ids, food taken, smallest timer or None, ants left)
+        where changes is (ids, xs, ys, loads, modes) of the ants that acted and survived.
+        """
+        if self.writes is not None:
+            searching, y, x, action, value = self.writes
+            if self.lazy:
+                factors = self.decay_factor ** (self.decay_steps - self.last_decayed[y, x])
+                self.food_q_table[y, x] *= factors[:, None]
+                self.nest_q_table[y, x] *= factors[:, None]
+                self.last_decayed[y, x] = self.decay_steps
+            self.food_q_table[y[searching], x[searching], action[searching]] = value[searching]
+            self.nest_q_table[y[~searching], x[~searching], action[~searching]] = value[~searching]
+            self.writes = None
+
+        colony = self.colony
+        acted = self.acted
+        if immigrants is not None:
+            colony.add(immigrants)
+            acted = np.concatenate([acted, immigrants["ids"]])
+        due = np.flatnonzero(np.isin(colony.ids, acted))
+        x, y = colony.x[due], colony.y[due]
+        mode, load = colony.mode[due], colony.load[due]
+        effect = self.rules.effect_table[mode, self.cells[y, x]]
+
+        # Pick up food, granted in id order within each source
+        pickers = np.flatnonzero(effect == PICKUP)
+        taken = 0
+        if len(pickers):
+            source = np.searchsorted(self.food_keys, y[pickers] * self.width + x[pickers])
+            order = np.argsort(source, kind="stable")
+            pickers, src = pickers[order], source[order]
+            demand = colony.max_load[due][pickers] - load[pickers]
+            uniq, start = np.unique(src, return_index=True)
+            group = np.searchsorted(uniq, src)
+            taken_before = np.cumsum(demand) - demand
+            taken_before -= taken_before[start][group]
+            granted = np.clip(self.food[uniq][group] - taken_before, 0, demand)
+            self.food[uniq] -= np.add.reduceat(granted, start)
+            load[pickers] += granted
+            mode[pickers[granted > 0]] = RETURNING
+            taken = int(granted.sum())
+
+        # Drop off food at the nest
+        dropping = effect == DROP
+        load[dropping] = 0
+        mode[dropping] = SEARCHING
+        colony.load[due] = load
+        colony.mode[due] = mode
+
+        died = effect == DEATH
+        ids = colony.ids[due]
+        changes = (ids[~died], x[~died], y[~died], load[~died], mode[~died])
+        removed = ids[died]
+        if len(removed):
+            dead = np.zeros(len(colony), dtype=bool)
+            dead[due[died]] = True
+            colony.drop(dead)
+
+        self._dissipate(1)
+        return changes, removed, taken, self._min_timer(), len(colony)
+
+    def skip(self, ticks):
+        """Applies `ticks` ticks in which no ant of the tile acts."""
+        self.colony.timer -= ticks
+        self._dissipate(ticks)
+
+    def columns(self, _=None):
+        colony = self.colony
+        return {name: getattr(colony, name) for name in COLUMNS}
+
+    def _dissipate(self, steps):
+        if self.lazy:
+            self.decay_steps += steps
+            return
+        factor = self.decay_factor ** steps
+        self.food_q_table[self.y0:self.y1, self.x0:self.x1] *= factor
+        self.nest_q_table[self.y0:self.y1, self.x0:self.x1] *= factor
+
+    def _min_timer(self):
+        return int(self.colony.timer.min()) if len(self.colony) else None
+
+
+def _serve(connection, spec, columns):
+    """Worker loop: runs the tile's commands until told to close."""
+    tile = _Tile(spec, columns)
+    try:
+        while True:
+            command, argument = connection.recv()
+            if command == "close":
+                break
+            try:
+                connection.send(("ok", getattr(tile, command)(argument)))
+            except Exception:
+                connection.send(("error", traceback.format_exc()))
+                break
+    finally:
+        tile.close()
+        connection.close()
+
+
+class TiledSimulation:
+    """One simulation whose world is split into `tiles` = (columns, rows) tiles, one worker process each.
+
+    Offers the stepping interface of Simulation (run_step, skip_idle_ticks,
+    is_finished, time, actions_taken, history, trajectory, pheromone_grid, ant_states)
+    without a Grid: the terrain is the (H, W) array `cells`. Results only
+    depend on the config and its seed, not on `tiles`, and match
+    Simulation(config) with the "arrays" colony. Call close(), or use
+    the simulation as a context manager, to stop the workers and free the
+    shared memory.
+    """
+
+    def __init__(self, config, tiles=(2, 2)):
+        engine = config.get("engine", {})
+        if engine.get("clear_exhausted_food", False):
+            raise ValueError("clear_exhausted_food changes the map and cannot be tiled")
+        if engine.get("rng", "shared") != "streams":
+            raise ValueError("tiled runs need the per-ant random streams (engine.rng = \"streams\")")
+        self.config = config
+        self.time = 0
+        self.actions_taken = 0
+        cells, masks, food_keys, food, self.nest = build_world(config)
+        height, width = cells.shape
+        cols, rows = tiles
+        if not (1 <= cols <= width and 1 <= rows <= height):
+            raise ValueError(f"cannot split a {width}x{height} grid into {cols}x{rows} tiles")
+        lazy = engine.get("lazy_dissipation", False)
+        layout = {
+            "cells": ((height, width), np.uint8),
+            "masks": ((height, width), np.uint8),
+            "food_q_table": ((height, width, 4), np.float64),
+            "nest_q_table": ((height, width, 4), np.float64),
+            "food_keys": ((len(food_keys),), np.int64),
+            "food": ((len(food),), np.int64),
+        }
+        if lazy:
+            layout["last_decayed"] = ((height, width), np.int64)
+        # New shared blocks are zero-filled, which is the initial Q-table and stamp value
+        self._blocks, self._arrays, spec = _create_shared(layout)
+        for name, values in (("cells", cells), ("masks", masks), ("food_keys", food_keys), ("food", food)):
+            self._arrays[name][...] = values
+        self.cells = self._arrays["cells"]
+        self.total_food = self.remaining_food = int(food.sum())
+
+        # Pheromone grid over the shared tables, for snapshots and heatmaps between ticks
+        self.pheromone_grid = ArrayPheromoneGrid(0, 0, config["pheromones"]["dissipation_rate"], lazy=lazy)
+        self.pheromone_grid.width, self.pheromone_grid.height = width, height
+        self.pheromone_grid.food_q_table = self._arrays["food_q_table"]
+        self.pheromone_grid.nest_q_table = self._arrays["nest_q_table"]
+        self.pheromone_grid.last_decayed = self._arrays.get("last_decayed")
+
+        self.x_bounds = [width * i // cols for i in range(cols + 1)]
+        self.y_bounds = [height * j // rows for j in range(rows + 1)]
+        self.tiles = tiles
+
+        colony = Colony.from_ants(create_ants(config, self.nest))
+        self._min_timer = int(colony.timer.min()) if len(colony) else None
+        self.ant_count = len(colony)
+        owner = self._owner(colony.x, colony.y)
+        seed = config.get("seed")
+        if seed is None:
+            seed = random.getrandbits(64)
+
+        context = multiprocessing.get_context("spawn")
+        self._connections, self._workers = [], []
+        for j in range(rows):
+            for i in range(cols):
+                tile_spec = {
+                    "arrays": spec,
+                    "bounds": (self.x_bounds[i], self.x_bounds[i + 1], self.y_bounds[j], self.y_bounds[j + 1]),
+                    "rewards": config["pheromones"],
+                    "seed": seed,
+                    "decay_factor": self.pheromone_grid.decay_factor,
+                }
+                selected = owner == j * cols + i
+                columns = {name: getattr(colony, name)[selected] for name in COLUMNS}
+                connection, worker_end = context.Pipe()
+                worker = context.Process(target=_serve, args=(worker_end, tile_spec, columns), daemon=True)
+                worker.start()
+                worker_end.close()
+                self._connections.append(connection)
+                self._workers.append(worker)
+
+        self._reset_history()
+
+    def _reset_history(self):
+        engine = self.config.get("engine", {})
+        history_options = engine.get("history", {})
+        self.history = None if history_options is False else HistoryStore(**history_options)
+        self.trajectory = create_trajectory(engine.get("trajectory", False), self.pheromone_grid, self.config)
+        self._record_history((), ())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Stops the workers, closes the trajectory log and frees the shared memory."""
+        if self._workers is None:
+            return
+        if self.trajectory is not None:
+            self.trajectory.close()
+        for connection in self._connections:
+            try:
+                connection.send(("close", None))
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self._workers:
+            worker.join()
+        for connection in self._connections:
+            connection.close()
+        self._workers = self._connections = None
+        self.cells = self.pheromone_grid.food_q_table = self.pheromone_grid.nest_q_table = None
+        self.pheromone_grid.last_decayed = None
+        self._arrays = None
+        for block in self._blocks.values():
+            block.close()
+            block.unlink()
+
+    def _owner(self, x, y):
+        """Index of the tile owning each (x, y) cell."""
+        i = np.searchsorted(self.x_bounds, x, side="right") - 1
+        j = np.searchsorted(self.y_bounds, y, side="right") - 1
+        return j * self.tiles[0] + i
+
+    def _call(self, command, arguments):
+        """Sends one command per worker and returns their answers, in tile order."""
+        for connection, argument in zip(self._connections, arguments):
+            connection.send((command, argument))
+        answers = []
+        for connection in self._connections:
+            status, answer = connection.recv()
+            if status == "error":
+                raise RuntimeError("tile worker failed:\n" + answer)
+            answers.append(answer)
+        return answers
+
+    def run_step(self):
+        """Runs a single time step on every tile."""
+        if self.is_finished():
+            return
+        count = len(self._connections)
+        answers = self._call("read", [self.time] * count)
+        self.actions_taken += sum(due for _, due in answers)
+
+        # Hand the ants that crossed a border over to their new tile
+        immigrants = [None] * count
+        leaving = [columns for columns, _ in answers if columns is not None]
+        if leaving:
+            merged = {name: np.concatenate([columns[name] for columns in leaving]) for name in COLUMNS}
+            owner = self._owner(merged["x"], merged["y"])
+            for tile in np.unique(owner).tolist():
+                selected = owner == tile
+                immigrants[tile] = {name: values[selected] for name, values in merged.items()}
+
+        answers = self._call("commit", immigrants)
+        changes = [np.concatenate(column) for column in zip(*(answer[0] for answer in answers))]
+        removed = np.sort(np.concatenate([answer[1] for answer in answers]))
+        self.remaining_food -= sum(answer[2] for answer in answers)
+        timers = [answer[3] for answer in answers if answer[3] is not None]
+        self._min_timer = min(timers) if timers else None
+        self.ant_count = sum(answer[4] for answer in answers)
+
+        # The workers dissipated their own cells; only the lazy clock is kept here
+        if self.pheromone_grid.lazy:
+            self.pheromone_grid.dissipate()
+        self.time += 1
+        order = np.argsort(changes[0], kind="stable")
+        self._record_history([column[order] for column in changes], removed)
+
+    def skip_idle_ticks(self):
+        """Jumps over the upcoming ticks in which no ant acts; returns the number skipped."""
+        if self.is_finished():
+            return 0
+        max_time = self.config["max_time"]
+        if self._min_timer is None:
+            target = max_time
+        else:
+            target = min(self.time + max(self._min_timer, 1) - 1, max_time)
+        skipped = target - self.time
+        if skipped <= 0:
+            return 0
+        self._call("skip", [skipped] * len(self._connections))
+        if self._min_timer is not None:
+            self._min_timer -= skipped
+        if self.pheromone_grid.lazy:
+            self.pheromone_grid.dissipate(skipped)
+        self.time = target
+        self._record_history((), ())
+        return skipped
+
+    def run(self, skip_idle=True):
+        """Steps the simulation until it is finished."""
+        while not self.is_finished():
+            self.run_step()
+            if skip_idle:
+                self.skip_idle_ticks()
+
+    def _colony(self):
+        """Gathers the ants of every tile into one Colony, sorted by id."""
+        parts = self._call("columns", [None] * len(self._connections))
+        colony = Colony.from_columns({name: np.concatenate([part[name] for part in parts]) for name in COLUMNS})
+        colony._compact(np.argsort(colony.ids, kind="stable"))
+        return colony
+
+    def ant_columns(self):
+        """Returns (ids, xs, ys, types, loads, modes) for every living ant."""
+        return self._colony().columns()
+
+    def ant_states(self):
+        """Returns the ants as a list of dicts (position, type and load)."""
+        return self._colony().ant_states()
+
+    def _record_history(self, changes, removed):
+        if self.history is None and self.trajectory is None:
+            return
+        if not len(changes):
+            changes, removed = ((),) * 5, ()
+        if self.history is not None:
+            self.history.record(self.time, changes, removed, self.ant_columns, self.pheromone_grid.snapshot)
+        if self.trajectory is not None:
+            self.trajectory.record(self.time, changes, removed, self.ant_columns, self.cells,
+                                   self.pheromone_grid.snapshot)
+
+    def is_finished(self):
+        """Checks if the simulation has ended."""
+        return self.time >= self.config["max_time"] or self.remaining_food <= 0
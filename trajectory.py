@@ -0,0 +1,323 @@
+"""On-disk trajectory log of a run, written as it goes and replayed through mmap.
+
+The in-memory history (history.py) only covers the current session and is
+bounded. A trajectory log keeps a whole run on disk, so a long headless run
+can be inspected later in the GUI (python3 main.py --replay LOG). The log is
+a directory of fixed-size records (little-endian):
+
+    header.json     format, grid size, first tick, intervals and the config
+    ants.bin        one ANT record (id, x, y, load as i32, then type, mode and
+                    kind as u8) per ant: every living ant on keyframe ticks
+                    (kind 0), then the ants that acted (kind 1) and the ids of
+                    the ants that died (kind 2) on the ticks in between
+    ticks.bin       one TICK record per tick from the first one, including the
+                    ticks nothing happened in: the end of the tick's ANT
+                    records, its keyframe tick and its frame number (i64)
+    frames.bin      one FRAME record every `frame_interval` ticks: the tick
+                    (i64), the cell codes (padded to 8 bytes), then both
+                    Q-tables decayed up to date as float32 (food, nest; 4 per
+                    cell, row-major)
+
+The state at tick t is rebuilt from the TICK record of t (found at a fixed
+offset) by reading its keyframe and the ANT records up to t: O(keyframe
+interval), whatever the length of the run. The reader maps the files and
+never loads them; refresh() picks up what a running simulation appended.
+
+    engine: {"trajectory": "run.traj"}
+    engine: {"trajectory": {"path": "run.traj", "keyframe_interval": 100, "frame_interval": 1000,
+                            "overwrite": False}}
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from config import config_to_json
+from models import ANT_TYPES, ANT_MODES
+
+FORMAT = "AIFTRAJ1"
+ANT = struct.Struct("<iiiiBBBx")
+TICK = struct.Struct("<qqq")
+FRAME_TIME = struct.Struct("<q")
+
+KEYFRAME, ACTED, REMOVED = 0, 1, 2
+
+
+def _frame_layout(width, height):
+    """(offset of the Q-tables, size) of a FRAME record."""
+    cells_end = FRAME_TIME.size + (width * height + 7) // 8 * 8
+    return cells_end, cells_end + 2 * width * height * 4 * 4
+
+
+def _float32(values):
+    """Bytes of a dense float32 Q-table from a flat list, array or NumPy array."""
+    if hasattr(values, "astype"):
+        return values.astype("<f4").tobytes()
+    table = array('f', values)
+    if sys.byteorder != "little":
+        table.byteswap()
+    return table.tobytes()
+
+
+def _dense(snapshot, size):
+    """(food, nest) flat tables of a pheromone snapshot; the sparse backend
+    gives (food keys, food values, nest keys, nest values) instead."""
+    if len(snapshot) != 4:
+        return snapshot
+    tables = []
+    for keys, values in (snapshot[:2], snapshot[2:]):
+        table = array('d', bytes(8 * size))
+        for i, key in enumerate(keys):
+            table[key * 4:key * 4 + 4] = values[i * 4:i * 4 + 4]
+        tables.append(table)
+    return tuple(tables)
+
+
+def create_trajectory(options, grid, config=None):
+    """The TrajectoryWriter of an engine.trajectory option (False, a path or a dict) for `grid`, or None."""
+    if not options:
+        return None
+    if not isinstance(options, dict):
+        options = {"path": options}
+    return TrajectoryWriter(width=grid.width, height=grid.height, config=config, **options)
+
+
+class TrajectoryWriter:
+    """Appends the ticks of a simulation to a new trajectory log at `path`.
+
+    A log already at `path` is only replaced with `overwrite`; otherwise
+    FileExistsError is raised, so a long recording is never lost by
+    starting another run with the same config.
+
+    record() takes the same arguments as HistoryStore.record, plus the cell
+    codes for the frames. Written data is flushed on every keyframe; call
+    close() at the end of the run so the last tick is written too.
+    """
+
+    def __init__(self, path, width, height, keyframe_interval=100, frame_interval=1000, config=None,
+                 overwrite=False):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.keyframe_interval = keyframe_interval
+        self.frame_interval = frame_interval
+        self.config = config
+        self.start_time = None
+        self.records = 0
+        self.frames = 0
+        self.keyframe_time = None
+        self.frame_time = None
+        # The TICK record of the last tick stays pending until a later tick
+        # comes, as a tick may be recorded in several calls
+        self._pending = None
+        if not overwrite and any(os.path.exists(os.path.join(path, name)) and os.path.getsize(os.path.join(path, name))
+                                 for name in ("header.json", "ants.bin", "ticks.bin")):
+            raise FileExistsError(f"{path!r} already holds a trajectory log (set overwrite to replace it)")
+        os.makedirs(path, exist_ok=True)
+        self._ants = open(os.path.join(path, "ants.bin"), "wb")
+        self._ticks = open(os.path.join(path, "ticks.bin"), "wb")
+        self._frames = open(os.path.join(path, "frames.bin"), "wb")
+
+    def _write_header(self):
+        header = {
+            "format": FORMAT, "width": self.width, "height": self.height, "start_time": self.start_time,
+            "keyframe_interval": self.keyframe_interval, "frame_interval": self.frame_interval,
+            "ant_types": [ant_type.__name__ for ant_type in ANT_TYPES],
+            "config": config_to_json(self.config) if self.config is not None else None,
+        }
+        temporary = os.path.join(self.path, "header.json.tmp")
+        with open(temporary, "w") as out:
+            json.dump(header, out)
+        os.replace(temporary, os.path.join(self.path, "header.json"))
+
+    def record(self, time, changes, removed, full_state, cells, pheromone_snapshot):
+        """Records tick `time`, as HistoryStore.record; `cells` are the grid's
+        cell codes and `pheromone_snapshot()` is only called on frame ticks."""
+        if self.start_time is None:
+            self.start_time = time
+            self._write_header()
+        if self._pending is not None and time > self._pending[0]:
+            self._ticks.write(TICK.pack(*self._pending[1:]))
+            gap = time - self._pending[0] - 1
+            if gap > 0:
+                # Ticks where nothing happened share the state of the one before
+                filler = TICK.pack(self.records, self.keyframe_time, self.frames - 1)
+                for start in range(0, gap, 4096):
+                    self._ticks.write(filler * min(4096, gap - start))
+            self._pending = None
+
+        keyframe = self.keyframe_time is None or time - self.keyframe_time >= self.keyframe_interval
+        if keyframe:
+            self.keyframe_time = time
+            self._write_ants(KEYFRAME, *full_state())
+        elif len(changes[0]) or len(removed):
+            ids, xs, ys, loads, modes = (_list(column) for column in changes)
+            self._write_ants(ACTED, ids, xs, ys, [0] * len(ids), loads, modes)
+            self._write_ants(REMOVED, _list(removed), *([[0] * len(removed)] * 5))
+
+        if self.frame_time is None or (self.frame_interval and time - self.frame_time >= self.frame_interval):
+            self._write_frame(time, cells, pheromone_snapshot())
+        self._pending = (time, self.records, self.keyframe_time, self.frames - 1)
+        if keyframe:
+            self.flush()
+
+    def _write_ants(self, kind, ids, xs, ys, types, loads, modes):
+        pack = ANT.pack
+        self._ants.write(b"".join(
+            pack(i, x, y, load, t, mode, kind)
+            for i, x, y, t, load, mode in zip(_list(ids), _list(xs), _list(ys), _list(types), _list(loads), _list(modes))
+        ))
+        self.records += len(ids)
+
+    def _write_frame(self, time, cells, snapshot):
+        size = self.width * self.height
+        offset, _ = _frame_layout(self.width, self.height)
+        food, nest = _dense(snapshot, size * 4)
+        self._frames.write(FRAME_TIME.pack(time))
+        self._frames.write(bytes(cells))
+        self._frames.write(bytes(offset - FRAME_TIME.size - size))
+        self._frames.write(_float32(food))
+        self._frames.write(_float32(nest))
+        self.frame_time = time
+        self.frames += 1
+
+    def flush(self):
+        """Makes what was written visible to readers (all but the last tick).
+        The ANT records and frames go first, so a TICK never points past them."""
+        self._ants.flush()
+        self._frames.flush()
+        self._ticks.flush()
+
+    def close(self):
+        """Writes the last tick and closes the files."""
+        if self._ants.closed:
+            return
+        if self._pending is not None:
+            self._ticks.write(TICK.pack(*self._pending[1:]))
+            self._pending = None
+        self.flush()
+        for f in (self._ants, self._ticks, self._frames):
+            f.close()
+
+
+def _list(values):
+    return values.tolist() if hasattr(values, "tolist") else values
+
+
+def _map(path):
+    """Read-only memoryview of a whole file (empty when the file is)."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return memoryview(b"")
+        return memoryview(mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ))
+
+
+class TrajectoryReader:
+    """A trajectory log opened for replay, read through memory mapping.
+
+    ``reader[t]`` rebuilds the ants at tick t in the format the GUI uses, like
+    HistoryStore; frame_at(t) gives the closest frame at or before t.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "header.json")) as f:
+            header = json.load(f)
+        if header.get("format") != FORMAT:
+            raise ValueError(f"{path!r} is not a trajectory log")
+        self.width = header["width"]
+        self.height = header["height"]
+        self.start_time = header["start_time"]
+        self.keyframe_interval = header["keyframe_interval"]
+        self.config = header["config"]
+        self.ant_types = header["ant_types"]
+        self._frame_offset, self._frame_size = _frame_layout(self.width, self.height)
+        self._sizes = None
+        self.refresh()
+
+    def refresh(self):
+        """Maps the files again if a running simulation appended to them."""
+        names = ("ants.bin", "ticks.bin", "frames.bin")
+        sizes = tuple(os.path.getsize(os.path.join(self.path, name)) for name in names)
+        if sizes == self._sizes:
+            return
+        self._sizes = sizes
+        self._ticks = _map(os.path.join(self.path, "ticks.bin"))
+        self._frames = _map(os.path.join(self.path, "frames.bin"))
+        self._ants = _map(os.path.join(self.path, "ants.bin"))
+        self.frames = len(self._frames) // self._frame_size
+        # A tick may reach the disk before its ANT records while the writer
+        # runs: only keep the ticks whose records are all there
+        records = len(self._ants) // ANT.size
+        low, high = 0, len(self._ticks) // TICK.size
+        while low < high:
+            middle = (low + high) // 2
+            if TICK.unpack_from(self._ticks, middle * TICK.size)[0] <= records:
+                low = middle + 1
+            else:
+                high = middle
+        self.ticks = low
+        self.last_time = self.start_time + self.ticks - 1
+
+    def __len__(self):
+        return self.last_time + 1
+
+    def __getitem__(self, time):
+        if time < 0:
+            time += len(self)
+        if not 0 <= time < len(self):
+            raise IndexError("trajectory tick out of range")
+        return self.state_at(time)
+
+    def _tick(self, time):
+        """(end of its ANT records, keyframe tick, frame number) of a recorded tick."""
+        return TICK.unpack_from(self._ticks, (time - self.start_time) * TICK.size)
+
+    def state_at(self, time):
+        """Rebuilds the ants at tick `time` as {"time", "ants": [dicts]}; ticks
+        outside the log give its first or last tick."""
+        time = min(max(time, self.start_time), self.last_time)
+        end, keyframe_time, _ = self._tick(time)
+        begin = self._tick(keyframe_time - 1)[0] if keyframe_time > self.start_time else 0
+
+        ants = {}
+        for i, x, y, load, t, mode, kind in ANT.iter_unpack(self._ants[begin * ANT.size:end * ANT.size]):
+            if kind == KEYFRAME:
+                ants[i] = [x, y, t, load, mode]
+            elif kind == ACTED:
+                ant = ants.get(i)
+                if ant is not None:
+                    ant[0], ant[1], ant[3], ant[4] = x, y, load, mode
+            else:
+                ants.pop(i, None)
+
+        return {
+            "time": time,
+            "ants": [
+                {"x": x, "y": y, "type": self.ant_types[t], "load": load, "mode": ANT_MODES[mode]}
+                for x, y, t, load, mode in ants.values()
+            ],
+        }
+
+    def frame_at(self, time):
+        """(tick, cells, (food, nest)) of the closest frame at or before `time`,
+        or None. The Q-tables are float32 memoryviews into the file."""
+        if not self.ticks:
+            return None
+        time = min(max(time, self.start_time), self.last_time)
+        frame = self._tick(time)[2]
+        if not 0 <= frame < self.frames:
+            return None
+        start = frame * self._frame_size
+        record = self._frames[start:start + self._frame_size]
+        size = self.width * self.height
+        tables = record[self._frame_offset:]
+        table_bytes = size * 4 * 4
+        return (
+            FRAME_TIME.unpack_from(record)[0],
+            record[FRAME_TIME.size:FRAME_TIME.size + size],
+            (tables[:table_bytes].cast('f'), tables[table_bytes:].cast('f')),
+        )
@@ -0,0 +1,182 @@
+"""Warm start: seeds the Q-tables of a new simulation instead of starting from zeros.
+
+The engine option `warm_start` selects the source:
+
+    "distances"   BFS distance fields from the nest and from the food cells,
+                  turned into the Q-values an ant would learn by following the
+                  shortest paths (walls block, deadly cells are never crossed)
+    <path>        the Q-tables of a checkpoint (see checkpoint.py), e.g. of a
+                  colony already trained on the same map
+
+Distance fields only depend on the map, so they are computed once and cached
+on disk in `warm_start_cache` (False disables the cache), keyed by a hash of
+the map layout.
+"""
+import hashlib
+import os
+import struct
+from array import array
+from collections import deque
+
+from models import ACTIONS, WALL_CODE, FOOD_CODE, NEST_CODE, DEADLY_CODE
+
+try:
+    import numpy as np
+except ImportError:  # only needed to fill the tables of the NumPy backend
+    np = None
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ai-fants")
+CACHE_MAGIC = b"AIFDIST1"
+CACHE_HEADER = struct.Struct("<8sII")
+UNREACHABLE = -1
+
+
+def map_key(grid):
+    """Hash of the size and cells of a grid, used as the cache key of its distance fields."""
+    digest = hashlib.sha1(struct.pack("<II", grid.width, grid.height))
+    digest.update(grid.cells)
+    return digest.hexdigest()
+
+
+def distance_fields(grid):
+    """Returns (nest_distance, food_distance), the number of moves from each cell to the
+    nearest nest / food cell as flat array('i'), UNREACHABLE where there is no path."""
+    return _bfs(grid, NEST_CODE), _bfs(grid, FOOD_CODE)
+
+
+def _bfs(grid, goal_code):
+    """Multi-source BFS from every cell holding `goal_code`."""
+    cells, masks = grid.cells, grid.valid_masks
+    offsets = [dy * grid.width + dx for dx, dy in ACTIONS]
+    distance = array('i', [UNREACHABLE]) * len(cells)
+    queue = deque()
+    for i, code in enumerate(cells):
+        if code == goal_code:
+            distance[i] = 0
+            queue.append(i)
+    # Moves are symmetric (a move is valid when the target is not a wall),
+    # so searching outwards from the goals gives the distance towards them
+    while queue:
+        i = queue.popleft()
+        d = distance[i] + 1
+        mask = masks[i]
+        for action, offset in enumerate(offsets):
+            if mask >> action & 1:
+                j = i + offset
+                if distance[j] == UNREACHABLE and cells[j] != DEADLY_CODE:
+                    distance[j] = d
+                    queue.append(j)
+    return distance
+
+
+def cached_distance_fields(grid, cache_dir=CACHE_DIR):
+    """distance_fields, read from or saved to `cache_dir` when it is set."""
+    if not cache_dir:
+        return distance_fields(grid)
+    path = os.path.join(cache_dir, map_key(grid) + ".dist")
+    size = grid.width * grid.height
+    try:
+        with open(path, "rb") as f:
+            magic, width, height = CACHE_HEADER.unpack(f.read(CACHE_HEADER.size))
+            if magic == CACHE_MAGIC and (width, height) == (grid.width, grid.height):
+                fields = array('i')
+                fields.fromfile(f, 2 * size)
+                return fields[:size], fields[size:]
+    except (OSError, EOFError, struct.error):
+        pass
+
+    nest, food = distance_fields(grid)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written aside then renamed, as parallel sweep workers may race on it
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as out:
+            out.write(CACHE_HEADER.pack(CACHE_MAGIC, grid.width, grid.height))
+            nest.tofile(out)
+            food.tofile(out)
+        os.replace(temporary, path)
+    except OSError:
+        pass  # a read-only cache only costs the next run a new BFS
+    return nest, food
+
+
+def distance_q_values(grid, distance, goal_reward, rewards, discount_factor):
+    """Flat Q-table (height * width * 4 values) leading to the goal cells of a distance field.
+
+    Moving onto a cell d moves away from a goal is worth the discounted return
+    of the shortest path from there: d move rewards, then `goal_reward`.
+    Moving onto a deadly cell is worth the deadly reward.
+    """
+    move, gamma = rewards["move_reward"], discount_factor
+
+    def path_value(d):
+        if gamma == 1:
+            return move * d + goal_reward
+        return move * (1 - gamma ** d) / (1 - gamma) + gamma ** d * goal_reward
+
+    values = [path_value(d) for d in range(max(distance) + 1)]
+    unreachable = path_value(len(distance))
+    deadly = rewards["deadly_reward"]
+
+    cells, masks = grid.cells, grid.valid_masks
+    offsets = [dy * grid.width + dx for dx, dy in ACTIONS]
+    table = array('d', bytes(8 * 4 * len(cells)))
+    for i, mask in enumerate(masks):
+        if not mask or cells[i] == WALL_CODE:
+            continue
+        for action, offset in enumerate(offsets):
+            if mask >> action & 1:
+                j = i + offset
+                if cells[j] == DEADLY_CODE:
+                    value = deadly
+                else:
+                    d = distance[j]
+                    value = unreachable if d == UNREACHABLE else values[d]
+                table[i * 4 + action] = value
+    return table
+
+
+def load_q_values(pheromone_grid, food, nest):
+    """Writes flat (height * width * 4) food and nest Q-tables into a pheromone grid of any backend."""
+    width, height = pheromone_grid.width, pheromone_grid.height
+    if hasattr(pheromone_grid.food_q_table, "shape"):
+        pheromone_grid.food_q_table[...] = np.frombuffer(food, dtype=np.float64).reshape(height, width, 4)
+        pheromone_grid.nest_q_table[...] = np.frombuffer(nest, dtype=np.float64).reshape(height, width, 4)
+        if pheromone_grid.lazy:
+            pheromone_grid.last_decayed[...] = pheromone_grid.decay_steps
+        return
+
+    # Nested lists or sparse rows: all-zero cells are skipped so the sparse
+    # backend only stores the seeded cells
+    for y in range(height):
+        food_row, nest_row = pheromone_grid.food_q_table[y], pheromone_grid.nest_q_table[y]
+        stamps = pheromone_grid.last_decayed[y] if pheromone_grid.lazy else None
+        for x in range(width):
+            i = (y * width + x) * 4
+            food_values, nest_values = food[i:i + 4], nest[i:i + 4]
+            if not (any(food_values) or any(nest_values)):
+                continue
+            food_row[x] = list(food_values)
+            nest_row[x] = list(nest_values)
+            if stamps is not None:
+                stamps[x] = pheromone_grid.decay_steps
+
+
+def warm_start(grid, pheromone_grid, config):
+    """Seeds the Q-tables as set by config["engine"]["warm_start"]; does nothing when it is unset."""
+    engine = config.get("engine", {})
+    source = engine.get("warm_start")
+    if not source:
+        return
+    if source == "distances":
+        nest_distance, food_distance = cached_distance_fields(grid, engine.get("warm_start_cache", CACHE_DIR))
+        rewards = config["pheromones"]
+        discount_factor = config["q_learning"]["discount_factor"]
+        food = distance_q_values(grid, food_distance, rewards["food_reward"], rewards, discount_factor)
+        nest = distance_q_values(grid, nest_distance, rewards["nest_reward"], rewards, discount_factor)
+    else:
+        from checkpoint import read_q_tables  # checkpoint imports simulation, which imports this module
+        trained, food, nest = read_q_tables(source)
+        if (trained["grid_width"], trained["grid_height"]) != (grid.width, grid.height):
+            raise ValueError(f"warm-start checkpoint {source!r} was saved on a map of another size")
+    load_q_values(pheromone_grid, food, nest)